@@ -7,3 +7,5 @@ class AuthConfig(AppConfig):
     label = 'custom_auth'  # django.contrib.authとの衝突を回避
     verbose_name = '認証'
 
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,182 @@
+"""
+認証のホットパスからDBアクセスを外すためのプロセス内キャッシュ
+
+- UserCache: トークンのユーザーIDから User を引くTTL付きLRU。
+  同じプロセス内の変更は signals で即時に破棄し、他プロセスの変更は TTL で反映する。
+- BlacklistFilter: リフレッシュトークンのブラックリスト（token_blacklist）の
+  ブルームフィルタ。含まれない jti はDBを見ずに「未登録」と判定でき、
+  含まれるかもしれない場合だけDBで確認する。他プロセスで登録された分は
+  一定間隔（TOKEN_BLACKLIST_FILTER_REFRESH_INTERVAL 秒）で差分を読み込んで取り込むので、
+  他プロセスで無効にしたトークンはその間だけ（最大で間隔1回分）リフレッシュに使える。
+  ID は登録時に採番されコミットの順とは限らないので、差分の読み込みで飛んでいたID
+  （コミット前の行）は見えるまで（最大 TOKEN_BLACKLIST_FILTER_GAP_TIMEOUT 秒）読み直す。
+"""
+import copy
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class UserCache:
+    """ユーザーIDごとの User のTTL付きLRUキャッシュ"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """キャッシュ済みの User のコピー（無い・期限切れならNone）"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                self._users.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            # リクエスト側で属性を書き換えても共有のインスタンスに影響しないようにする
+            return copy.copy(entry[0])
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (copy.copy(user), time.monotonic() + self.ttl)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+class BloomFilter:
+    """ビット配列と二重ハッシュによるブルームフィルタ"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.n_bits = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.n_hashes = max(int(round(self.n_bits / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.n_bits for i in range(self.n_hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class BlacklistFilter:
+    """ブラックリスト済みリフレッシュトークン（jti）のブルームフィルタ"""
+
+    # 読み直す飛んだIDの上限（ロールバックなどで大きく飛んだら古い方から諦める）
+    max_gaps = 1000
+
+    def __init__(self, capacity, error_rate, refresh_interval, rebuild_interval, gap_timeout):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.gap_timeout = gap_timeout
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        # 読み込んだときに見えなかったID → 最初に見えなかった時刻
+        self._gaps = {}
+        self._refreshed_at = 0.0
+        self._rebuilt_at = 0.0
+
+    def might_contain(self, jti):
+        """False ならブラックリストに無い。True ならDBで確認が必要"""
+        self._refresh()
+        with self._lock:
+            return jti in self._filter
+
+    def add(self, jti):
+        """このプロセスでブラックリストに登録したトークンを即時に反映する"""
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+
+    def _refresh(self):
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        now = time.monotonic()
+        with self._lock:
+            rebuild = self._filter is None or now - self._rebuilt_at >= self.rebuild_interval
+            if not rebuild and now - self._refreshed_at < self.refresh_interval:
+                return
+            last_id = self._last_id
+            gaps = {row_id: seen for row_id, seen in self._gaps.items() if now - seen < self.gap_timeout}
+            # 飛んでいたIDの分も読み直す
+            start = 0 if rebuild else min(gaps, default=last_id + 1) - 1
+
+        # 期限切れのトークンはリフレッシュに使えないので、作り直すときは除く
+        blacklisted = BlacklistedToken.objects.filter(id__gt=start)
+        if rebuild:
+            blacklisted = blacklisted.filter(token__expires_at__gt=timezone.now())
+        rows = list(blacklisted.order_by('id').values_list('id', 'token__jti'))
+
+        with self._lock:
+            if rebuild:
+                self._filter = BloomFilter(max(self.capacity, len(rows) * 2), self.error_rate)
+                self._rebuilt_at = now
+            seen_ids = set()
+            for row_id, jti in rows:
+                seen_ids.add(row_id)
+                resolved = gaps.pop(row_id, None) is not None
+                # 取り込み済みの行は入れ直さない（件数が増えて作り直しが早まる）
+                if rebuild or resolved or row_id > last_id:
+                    self._filter.add(jti)
+            if rows and rows[-1][0] > last_id:
+                # 新しく読んだ範囲で見えなかったID（作り直しでは期限切れの行も含むが、読み直すだけ）
+                for row_id in range(max(last_id + 1, rows[-1][0] - self.max_gaps), rows[-1][0]):
+                    if row_id not in seen_ids:
+                        gaps[row_id] = now
+                self._last_id = rows[-1][0]
+            if len(gaps) > self.max_gaps:
+                gaps = dict(sorted(gaps.items())[-self.max_gaps:])
+            self._gaps = gaps
+            self._refreshed_at = now
+            # 想定件数を超えると誤判定（DB確認）が増えるので早めに作り直す
+            if self._filter.count > self._filter.capacity:
+                self._rebuilt_at = now - self.rebuild_interval
+
+
+user_cache = UserCache(
+    getattr(settings, 'AUTH_USER_CACHE_MAX_SIZE', 10000),
+    getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+)
+
+blacklist_filter = BlacklistFilter(
+    getattr(settings, 'TOKEN_BLACKLIST_FILTER_CAPACITY', 100000),
+    getattr(settings, 'TOKEN_BLACKLIST_FILTER_ERROR_RATE', 0.001),
+    getattr(settings, 'TOKEN_BLACKLIST_FILTER_REFRESH_INTERVAL', 5),
+    getattr(settings, 'TOKEN_BLACKLIST_FILTER_REBUILD_INTERVAL', 60 * 60),
+    getattr(settings, 'TOKEN_BLACKLIST_FILTER_GAP_TIMEOUT', 60)
+)
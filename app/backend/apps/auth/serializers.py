@@ -1,6 +1,9 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from django.contrib.auth.models import User
 
+from .tokens import FilteredRefreshToken
+
 
 class UserSerializer(serializers.ModelSerializer):
     """ユーザーシリアライザー"""
@@ -10,3 +13,9 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email')
         read_only_fields = ('id',)
 
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    """ブラックリストの確認にブルームフィルタを使うトークンリフレッシュ"""
+    
+    token_class = FilteredRefreshToken
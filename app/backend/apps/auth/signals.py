@@ -0,0 +1,15 @@
+"""
+ユーザーの変更を認証キャッシュに反映するシグナルハンドラ
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import user_cache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # 無効化・パスワード変更・削除を次のリクエストから反映する（他プロセスは TTL で反映）
+    user_cache.invalidate(instance.pk)
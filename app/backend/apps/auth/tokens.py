@@ -0,0 +1,22 @@
+"""
+JWTトークン
+"""
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import blacklist_filter
+
+
+class FilteredRefreshToken(RefreshToken):
+    """ブラックリストの確認をブルームフィルタで先に絞り込むリフレッシュトークン"""
+
+    def check_blacklist(self):
+        # フィルタに無ければ確実に未登録なのでDBを見ない
+        if not blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            return
+        super().check_blacklist()
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted
@@ -7,6 +7,8 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 
+from .tokens import FilteredRefreshToken
+
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     """カスタムログインView"""
@@ -70,7 +72,7 @@ def logout_view(request):
     try:
         refresh_token = request.COOKIES.get('refresh_token')
         if refresh_token:
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
     except Exception:
         pass
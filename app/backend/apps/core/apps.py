@@ -6,3 +6,7 @@ class CoreConfig(AppConfig):
     name = 'apps.core'
     verbose_name = 'コア'
 
+    def ready(self):
+        from . import checks, lookups  # noqa: F401
+        from . import metrics
+        metrics.install()
@@ -0,0 +1,314 @@
+"""
+APIのベンチマーク
+
+seed_dataset で作ったデータに対して、主要なルートを一定の並列数で繰り返し
+呼び出し、レイテンシ（p50/p95/p99）・スループット・1リクエストあたりの
+SQL件数を測る。SQL件数は RequestMetricsMiddleware の計測値から読む。プロセス内
+（django.test.Client）では本文を読み切った後の値を使うので、ストリーミングで返す
+ルート（グラフ・エクスポート）も本文を生成する間のSQLまで数える。起動済みのサーバー
+（--base-url）では Server-Timing ヘッダー（db;desc="N queries"）から読むので、
+ストリーミングのルートは本文より前のSQLだけになる。
+
+結果はコミット済みのベースライン（benchmarks/baseline.json）と比べ、SQL件数が増えたか
+エラーが増えたルートを回帰とする。レイテンシはベースラインに p50/p95 がある場合だけ比べる
+（コミット済みのベースラインはSQL件数とエラーだけで、レイテンシはベンチマークを動かす
+環境で --save-baseline して記録する）。
+"""
+import json
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.projects.models import Node, NodeLink, ProcessStep, Project, Round
+
+QUERY_COUNT_PATTERN = re.compile(r'db;[^,]*desc="(\d+) queries"')
+BENCHMARK_PROJECT_PREFIX = 'benchmark-'
+BENCHMARK_NODE_PREFIX = 'benchmark-'
+
+
+class Scenario:
+    """計測するリクエスト1種類（path は固定データから作る）"""
+
+    def __init__(self, name, path, method='GET', body=None, authenticated=True, prepare=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.body = body
+        self.authenticated = authenticated
+        # 同じリクエストを繰り返せない書き込み（リンクの作成・削除など）で、1回ごとに
+        # path / body / headers を作り直す関数（計測の外で呼ぶ）
+        self.prepare = prepare
+
+    def build(self):
+        """1回分のリクエスト（path, body, headers）"""
+        request = {'path': self.path, 'body': self.body, 'headers': {}}
+        if self.prepare is not None:
+            request.update(self.prepare())
+        return request
+
+
+def build_scenarios(fixture):
+    """各ルートのシナリオ一覧"""
+    project, round_id, step, node, linked_node = (
+        fixture['project'], fixture['round'], fixture['step'], fixture['node'], fixture['linked_node']
+    )
+    login = {'username': fixture['username'], 'password': fixture['password']}
+
+    def refresh_token():
+        return str(RefreshToken.for_user(User.objects.get(pk=fixture['user_id'])))
+
+    def new_node():
+        return Node.objects.create(project_id=project, title=f'{BENCHMARK_NODE_PREFIX}node')
+
+    def create_link():
+        return {'body': {'to_node_id': str(new_node().pk), 'weight': '0.5'}}
+
+    def delete_link():
+        link = NodeLink.objects.create(from_node_id=linked_node, to_node=new_node())
+        return {'body': {'link_id': str(link.pk)}}
+
+    def create_step():
+        # ステップ種別は周ごとに1つまでなので、毎回空の周を作る
+        new_project = Project.objects.create(user_id=fixture['user_id'], title=f'{BENCHMARK_PROJECT_PREFIX}project')
+        new_round = Round.objects.create(project=new_project, round_number=1)
+        return {'path': f'/api/v1/rounds/{new_round.pk}/steps/'}
+
+    return [
+        Scenario('auth.login', '/api/v1/auth/login/', 'POST', login, authenticated=False),
+        Scenario(
+            'auth.refresh', '/api/v1/auth/refresh/', 'POST', authenticated=False,
+            prepare=lambda: {'body': {'refresh': refresh_token()}}
+        ),
+        Scenario(
+            'auth.logout', '/api/v1/auth/logout/', 'POST',
+            prepare=lambda: {'headers': {'Cookie': f'refresh_token={refresh_token()}'}}
+        ),
+        Scenario('auth.user', '/api/v1/auth/user/'),
+        Scenario('projects.list', '/api/v1/projects/'),
+        Scenario('projects.create', '/api/v1/projects/', 'POST', {'title': f'{BENCHMARK_PROJECT_PREFIX}project'}),
+        Scenario('projects.detail', f'/api/v1/projects/{project}/'),
+        Scenario('projects.rounds', f'/api/v1/projects/{project}/rounds/'),
+        Scenario('projects.nodes', f'/api/v1/projects/{project}/nodes/'),
+        Scenario('projects.nodes_rank', f'/api/v1/projects/{project}/nodes/?rank=true&ordering=rank'),
+        Scenario('projects.snapshot', f'/api/v1/projects/{project}/snapshot/'),
+        Scenario('projects.graph', f'/api/v1/projects/{project}/graph/'),
+        Scenario('projects.cycles', f'/api/v1/projects/{project}/cycles/'),
+        Scenario('projects.centrality', f'/api/v1/projects/{project}/centrality/'),
+        Scenario('rounds.detail', f'/api/v1/rounds/{round_id}/'),
+        Scenario('rounds.steps', f'/api/v1/rounds/{round_id}/steps/'),
+        Scenario(
+            'rounds.steps_create', '', 'POST',
+            {'step_type': fixture['step_type'], 'content': fixture['step_content']}, prepare=create_step
+        ),
+        Scenario('steps.list', '/api/v1/steps/'),
+        Scenario('steps.detail', f'/api/v1/steps/{step}/'),
+        Scenario('nodes.list', '/api/v1/nodes/'),
+        Scenario(
+            'nodes.create', '/api/v1/nodes/', 'POST',
+            {'project_id': project, 'title': f'{BENCHMARK_NODE_PREFIX}node', 'context': ''}
+        ),
+        Scenario('nodes.detail', f'/api/v1/nodes/{node}/'),
+        Scenario('nodes.update', f'/api/v1/nodes/{node}/', 'PATCH', {'title': fixture['node_title']}),
+        Scenario('nodes.links', f'/api/v1/nodes/{linked_node}/links/'),
+        Scenario('nodes.links_create', f'/api/v1/nodes/{linked_node}/links/', 'POST', prepare=create_link),
+        Scenario('nodes.links_delete', f'/api/v1/nodes/{linked_node}/links/', 'DELETE', prepare=delete_link),
+        Scenario('nodes.neighborhood', f'/api/v1/nodes/{linked_node}/neighborhood/?depth=2'),
+        Scenario('nodes.suggestions', f'/api/v1/nodes/{node}/suggestions/'),
+        Scenario('nodes.duplicates', f'/api/v1/nodes/duplicates/?project={project}'),
+        Scenario('nodes.global_nodes', '/api/v1/nodes/global_nodes/'),
+        Scenario('search', '/api/v1/search/?q=%E8%AA%B2%E9%A1%8C'),
+        Scenario('sync.changes', '/api/v1/sync/changes/?limit=100'),
+        Scenario('async.projects', '/api/v1/async/projects/'),
+        Scenario('async.project_nodes', f'/api/v1/async/projects/{project}/nodes/'),
+        Scenario('async.node_links', f'/api/v1/async/nodes/{linked_node}/links/'),
+    ]
+
+
+def load_fixture(user, password):
+    """ユーザーのデータからベンチマークに使うIDを選ぶ（最新のプロジェクトと、その中のリンクのあるノード）"""
+    project = (
+        Project.objects.filter(user=user)
+        .exclude(title__startswith=BENCHMARK_PROJECT_PREFIX)
+        .order_by('-created_at', '-id')
+        .first()
+    )
+    if project is None:
+        return None
+    round_obj = Round.objects.filter(project=project).order_by('round_number').first()
+    step = ProcessStep.objects.filter(round=round_obj).order_by('created_at', 'id').first()
+    node = (
+        Node.objects.filter(project=project)
+        .exclude(title__startswith=BENCHMARK_NODE_PREFIX)
+        .order_by('-created_at', '-id')
+        .first()
+    )
+    link = (
+        NodeLink.objects.filter(from_node__project=project)
+        .exclude(to_node__title__startswith=BENCHMARK_NODE_PREFIX)
+        .order_by('-created_at', '-id')
+        .first()
+    )
+    if round_obj is None or step is None or node is None or link is None:
+        return None
+    return {
+        'user_id': user.pk,
+        'username': user.username,
+        'password': password,
+        'project': str(project.pk),
+        'round': str(round_obj.pk),
+        'step': str(step.pk),
+        'step_type': step.step_type,
+        'step_content': step.content,
+        'node': str(node.pk),
+        'node_title': node.title,
+        'linked_node': str(link.from_node_id),
+    }
+
+
+def cleanup(user):
+    """書き込みのシナリオで作ったプロジェクトとノードを消す"""
+    Project.objects.filter(user=user, title__startswith=BENCHMARK_PROJECT_PREFIX).delete()
+    Node.objects.filter(project__user=user, title__startswith=BENCHMARK_NODE_PREFIX).delete()
+
+
+class InProcessTransport:
+    """django.test.Client で同じプロセス内のアプリを呼ぶ（スレッドごとにClientとDB接続を持つ）"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, scenario, request, token):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(raise_request_exception=False)
+        headers = {
+            'HTTP_' + name.upper().replace('-', '_'): value for name, value in request['headers'].items()
+        }
+        if scenario.authenticated:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        if scenario.method == 'GET':
+            response = client.get(request['path'], **headers)
+        else:
+            response = client.generic(
+                scenario.method, request['path'], json.dumps(request['body']), 'application/json', **headers
+            )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        # 本文を読み切った後の値（ストリーミングでも本文を生成する間のSQLまで入る）
+        metrics = getattr(response, 'request_metrics', None)
+        if metrics is not None:
+            return response.status_code, metrics.db_queries
+        return response.status_code, parse_query_count(response.headers.get('Server-Timing', ''))
+
+    def close(self):
+        connections.close_all()
+
+
+class HTTPTransport:
+    """起動済みのサーバーを HTTP で呼ぶ"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, scenario, request, token):
+        data = json.dumps(request['body']).encode('utf-8') if request['body'] is not None else None
+        http_request = urllib.request.Request(self.base_url + request['path'], data=data, method=scenario.method)
+        http_request.add_header('Content-Type', 'application/json')
+        for name, value in request['headers'].items():
+            http_request.add_header(name, value)
+        if scenario.authenticated:
+            http_request.add_header('Authorization', f'Bearer {token}')
+        # ヘッダーは本文より先に届くので、ストリーミングのルートは本文より前のSQLだけになる
+        try:
+            with urllib.request.urlopen(http_request) as response:
+                response.read()
+                return response.status, parse_query_count(response.headers.get('Server-Timing', ''))
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code, parse_query_count(exc.headers.get('Server-Timing', ''))
+
+    def close(self):
+        pass
+
+
+def parse_query_count(server_timing):
+    """Server-Timing ヘッダーのSQL件数（無ければ None）"""
+    match = QUERY_COUNT_PATTERN.search(server_timing)
+    return int(match.group(1)) if match else None
+
+
+def percentile(sorted_values, q):
+    """線形補間のパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def run_scenario(transport, scenario, token, concurrency, requests, warmup=0):
+    """1シナリオを並列数 concurrency で requests 回呼び、集計結果を返す"""
+    def call(_):
+        request = scenario.build()
+        started = time.perf_counter()
+        status_code, queries = transport.request(scenario, request, token)
+        elapsed = time.perf_counter() - started
+        return elapsed, status_code, queries
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(warmup)))
+        started = time.perf_counter()
+        results = list(executor.map(call, range(requests)))
+        wall = time.perf_counter() - started
+        # 各ワーカースレッドで1回ずつ後始末する（DB接続は作ったスレッドでしか閉じられない）
+        barrier = threading.Barrier(concurrency)
+
+        def close(_):
+            barrier.wait()
+            transport.close()
+        list(executor.map(close, range(concurrency)))
+
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in results)
+    queries = [count for _, _, count in results if count is not None]
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, status_code, _ in results if status_code >= 400),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'throughput_rps': round(requests / wall, 1) if wall else 0.0,
+        'queries': max(queries) if queries else None,
+        'queries_median': statistics.median(queries) if queries else None,
+    }
+
+
+def result_key(scenario_name, concurrency):
+    return f'{scenario_name}@c{concurrency}'
+
+
+def compare(results, baseline, threshold, min_delta_ms=0.0):
+    """ベースラインと比べた回帰の一覧（(キー, 内容) の列）。レイテンシは min_delta_ms 未満の差を無視する"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if base.get('queries') is not None and result['queries'] is not None and result['queries'] > base['queries']:
+            regressions.append((key, f"SQL件数 {base['queries']} → {result['queries']}"))
+        for metric in ('p50_ms', 'p95_ms'):
+            # レイテンシはベースラインを記録した環境でだけ比べる（無ければSQL件数だけ）
+            if base.get(metric) and result[metric] > max(base[metric] * (1 + threshold), base[metric] + min_delta_ms):
+                regressions.append((key, f'{metric} {base[metric]} → {result[metric]}'))
+        if result['errors'] > base.get('errors', 0):
+            regressions.append((key, f"エラー {base.get('errors', 0)} → {result['errors']}"))
+    return regressions
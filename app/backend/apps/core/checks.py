@@ -0,0 +1,25 @@
+"""
+設定の検査（python manage.py check / runserver / migrate で実行される）
+"""
+from django.conf import settings
+from django.core import checks
+
+# プロセス間で共有しなければならないキャッシュ（バージョン番号・スナップショット・レスポンス）
+SHARED_CACHE_ALIASES = ('default', 'responses')
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """ワーカーが複数なのにプロセス内のキャッシュを使っていないか"""
+    if settings.WEB_CONCURRENCY <= 1:
+        return []
+    return [
+        checks.Error(
+            f"CACHES['{alias}'] がプロセス内のキャッシュ（locmem）ですが、WEB_CONCURRENCY が {settings.WEB_CONCURRENCY} です",
+            hint='書き込んだワーカーが進めたバージョンが他のワーカーに届きません。file か db のバックエンドにしてください',
+            id='thinkring.E001',
+        )
+        for alias in SHARED_CACHE_ALIASES
+        if settings.CACHES.get(alias, {}).get('BACKEND') == LOCMEM_BACKEND
+    ]
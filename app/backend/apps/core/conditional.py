@@ -0,0 +1,85 @@
+"""
+条件付きGET（ETag / Last-Modified）
+
+クエリセットの最終更新日時と件数だけを集計してETagを作り、
+If-None-Match / If-Modified-Since が一致すればシリアライズ前に304を返す。
+
+行の削除では最終更新日時が進まない（件数だけが変わる）ので、クエリセットの集計を
+含む場合は Last-Modified を付けず、ETag だけで判定させる。
+"""
+import hashlib
+from calendar import timegm
+from collections import namedtuple
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+# クエリセットの (最終更新日時のタプル, 件数)
+Fingerprint = namedtuple('Fingerprint', ['last_modified', 'count'])
+
+
+def queryset_fingerprint(queryset, *fields):
+    """
+    クエリセットの Fingerprint（最終更新日時のタプル, 件数）を1クエリで求める
+
+    fields を省略すると updated_at を使う。関連先の更新日時も含めたい場合は
+    'from_node__updated_at' のように指定する。
+    """
+    aggregates = _fingerprint_aggregates(fields)
+    return _fingerprint(queryset.order_by().aggregate(**aggregates), aggregates)
+
+
+async def aqueryset_fingerprint(queryset, *fields):
+    """queryset_fingerprint の非同期版"""
+    aggregates = _fingerprint_aggregates(fields)
+    return _fingerprint(await queryset.order_by().aaggregate(**aggregates), aggregates)
+
+
+def _fingerprint_aggregates(fields):
+    fields = fields or ('updated_at',)
+    aggregates = {f'last_{i}': Max(field) for i, field in enumerate(fields)}
+    aggregates['count'] = Count('pk')
+    return aggregates
+
+
+def _fingerprint(result, aggregates):
+    return Fingerprint(tuple(result[f'last_{i}'] for i in range(len(aggregates) - 1)), result['count'])
+
+
+class Validators:
+    """レスポンスのETagとLast-Modified"""
+
+    def __init__(self, request, *parts):
+        # パラメータ違い（カーソルなど）で内容が変わるのでURLも含める
+        digest = hashlib.sha1(repr((request.get_full_path(), parts)).encode('utf-8')).hexdigest()
+        self.etag = quote_etag(digest)
+        timestamps = [value for value in _flatten(parts) if hasattr(value, 'utctimetuple')]
+        if any(isinstance(part, Fingerprint) for part in parts):
+            # 削除で件数だけが変わっても最終更新日時は進まない
+            timestamps = []
+        self.last_modified = timegm(max(timestamps).utctimetuple()) if timestamps else None
+
+    def not_modified(self, request):
+        """変更が無ければ304レスポンス、あればNone"""
+        return get_conditional_response(
+            request,
+            etag=self.etag,
+            last_modified=self.last_modified,
+        )
+
+    def apply(self, response):
+        """レスポンスにETagとLast-Modifiedを付ける"""
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified)
+        return response
+
+
+def _flatten(values):
+    for value in values:
+        if isinstance(value, (tuple, list)):
+            yield from _flatten(value)
+        else:
+            yield value
@@ -6,20 +6,24 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def error_payload(exc):
+    """例外をAPI共通のエラー形式にする"""
+    return {
+        'error': {
+            'code': getattr(exc, 'default_code', 'SRV_001'),
+            'message': str(exc.detail) if hasattr(exc, 'detail') else str(exc),
+            'type': exc.__class__.__name__,
+            'timestamp': timezone.now().isoformat(),
+        }
+    }
+
+
 def custom_exception_handler(exc, context):
     """カスタム例外ハンドラー"""
     response = exception_handler(exc, context)
     
     if response is not None:
-        custom_response_data = {
-            'error': {
-                'code': getattr(exc, 'default_code', 'SRV_001'),
-                'message': str(exc.detail) if hasattr(exc, 'detail') else str(exc),
-                'type': exc.__class__.__name__,
-                'timestamp': timezone.now().isoformat(),
-            }
-        }
-        response.data = custom_response_data
+        response.data = error_payload(exc)
         
         # ログ記録
         logger.error(
@@ -0,0 +1,27 @@
+"""
+独自のフィールドルックアップ（CoreConfig.ready で登録する）
+"""
+from django.db.models import CharField, TextField
+from django.db.models.lookups import IContains
+
+
+@CharField.register_lookup
+@TextField.register_lookup
+class ILike(IContains):
+    """
+    大文字小文字を区別しない部分一致（col ILIKE '%text%'）
+
+    icontains は PostgreSQL では UPPER(col::text) LIKE UPPER(...) になり、
+    列そのものに張った pg_trgm の GIN インデックス（gin_trgm_ops）を使えない。
+    ILIKE は pg_trgm のインデックスで検索できる。他のDBでは icontains と同じ。
+    """
+
+    lookup_name = 'ilike'
+
+    def as_sql(self, compiler, connection):
+        return IContains(self.lhs, self.rhs).as_sql(compiler, connection)
+
+    def as_postgresql(self, compiler, connection):
+        lhs_sql, params = self.process_lhs(compiler, connection)
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs_sql} ILIKE {rhs_sql}', [*params, *rhs_params]
@@ -0,0 +1,125 @@
+"""
+APIのベンチマークを実行するコマンド
+
+事前に seed_dataset でデータを作っておく。結果をベースラインと比べ、
+回帰があれば一覧を出して異常終了する（CIで使える）。
+
+コミット済みのベースライン（benchmarks/baseline.json）はSQL件数とエラーだけを持つので、
+そのままではSQL件数とエラーの回帰だけを検出する。レイテンシも比べる場合は、同じ環境で
+--save-baseline したベースラインを --baseline で指定する。プロセス内で呼ぶ場合は
+レスポンスキャッシュを無効にして測る（--response-cache で有効にできる）。
+
+例:
+    python manage.py seed_dataset --seed 0 --users 10 --projects-per-user 5 --nodes-per-step 20
+    python manage.py benchmark --concurrency 1,4 --requests 200
+    python manage.py benchmark --save-baseline   # ベースラインを更新する
+"""
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.core import benchmark
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'APIのレイテンシ・スループット・SQL件数を測り、ベースラインと比較します'
+        '（コミット済みのベースラインで比べるのはSQL件数とエラーだけです。'
+        'レイテンシはベースラインに p50/p95 がある場合だけ比べます）'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default='seed000000', help='ベンチマークに使うユーザー（seed_dataset で作成）')
+        parser.add_argument('--password', default='testpass123', help='そのユーザーのパスワード（auth.login で使う）')
+        parser.add_argument('--concurrency', default='1,4', help='並列数（カンマ区切りで複数）')
+        parser.add_argument('--requests', type=int, default=100, help='シナリオ・並列数ごとのリクエスト数')
+        parser.add_argument('--warmup', type=int, default=5, help='計測前に捨てるリクエスト数')
+        parser.add_argument('--only', default='', help='実行するシナリオ名の接頭辞（カンマ区切り）')
+        parser.add_argument('--base-url', default='', help='起動済みのサーバーを呼ぶ場合のURL（省略時はプロセス内で呼ぶ）')
+        parser.add_argument(
+            '--response-cache', action='store_true',
+            help='プロセス内で呼ぶ場合もレスポンスキャッシュを使う（省略時は無効にしてビューのSQL件数を測る）'
+        )
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='ベースラインのJSONファイル')
+        parser.add_argument('--threshold', type=float, default=0.2, help='回帰とみなすレイテンシの悪化率（ベースラインに p50/p95 がある場合）')
+        parser.add_argument('--min-delta-ms', type=float, default=5.0, help='回帰とみなすレイテンシの最小の差（ミリ秒）')
+        parser.add_argument('--save-baseline', action='store_true', help='結果をベースラインとして保存する')
+        parser.add_argument('--output', default='', help='結果をJSONで保存するファイル')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',') if level]
+        except ValueError:
+            raise CommandError('--concurrency は整数のカンマ区切りで指定してください')
+        if not levels or min(levels) < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency と --requests は 1 以上を指定してください')
+
+        user = User.objects.filter(username=options['username']).first()
+        fixture = benchmark.load_fixture(user, options['password']) if user else None
+        if fixture is None:
+            raise CommandError(
+                f"ユーザー \"{options['username']}\" のデータがありません。先に seed_dataset を実行してください"
+            )
+
+        scenarios = benchmark.build_scenarios(fixture)
+        prefixes = [prefix for prefix in options['only'].split(',') if prefix]
+        if prefixes:
+            scenarios = [s for s in scenarios if any(s.name.startswith(prefix) for prefix in prefixes)]
+
+        if options['base_url']:
+            transport = benchmark.HTTPTransport(options['base_url'])
+        else:
+            # プロセス内で呼ぶ場合も ALLOWED_HOSTS を通す
+            settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+            # キャッシュが当たるとSQLが0件になり、ビューのSQL件数の回帰を検出できない
+            if not options['response_cache']:
+                settings.RESPONSE_CACHE_ENABLED = False
+            transport = benchmark.InProcessTransport()
+        token = str(AccessToken.for_user(user))
+
+        self.stdout.write(
+            f"{'scenario':<28}{'c':>4}{'p50':>10}{'p95':>10}{'p99':>10}{'rps':>9}{'sql':>6}{'err':>6}"
+        )
+        results = {}
+        try:
+            for scenario in scenarios:
+                for concurrency in levels:
+                    result = benchmark.run_scenario(
+                        transport, scenario, token, concurrency, options['requests'], options['warmup']
+                    )
+                    results[benchmark.result_key(scenario.name, concurrency)] = result
+                    self.stdout.write(
+                        f"{scenario.name:<28}{concurrency:>4}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                        f"{result['p99_ms']:>10}{result['throughput_rps']:>9}"
+                        f"{'-' if result['queries'] is None else result['queries']:>6}{result['errors']:>6}"
+                    )
+        finally:
+            benchmark.cleanup(user)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, ensure_ascii=False, indent=2) + '\n')
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, ensure_ascii=False, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'ベースラインを保存しました: {baseline_path}'))
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f'ベースラインがありません: {baseline_path}'))
+            return
+        regressions = benchmark.compare(
+            results, json.loads(baseline_path.read_text()), options['threshold'], options['min_delta_ms']
+        )
+        if regressions:
+            for key, detail in regressions:
+                self.stdout.write(self.style.ERROR(f'  {key}: {detail}'))
+            raise CommandError(f'{len(regressions)} 件の回帰があります')
+        self.stdout.write(self.style.SUCCESS('ベースラインからの回帰はありません'))
@@ -0,0 +1,43 @@
+"""
+プロジェクトのグラフレイアウト（WordTree の座標）を事前に計算するコマンド
+
+/projects/{id}/graph/ は保存済みの座標を返すだけで計算しない。リンクの変更のコミット後にも
+計算し直すが、ノードが LAYOUT_ON_WRITE_MAX_NODES を超えるプロジェクトはそこでは計算しないので、
+このコマンドを定期的に（一括取り込みの後などに）実行して計算しておく。
+保存済みの座標があれば変わった部分だけを計算し直す（--full で全て計算し直す）。
+
+例:
+    python manage.py compute_layouts --project 0b6f... --full
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.projects.layout import update_project_layout
+from apps.projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'プロジェクトのグラフレイアウトを計算して保存します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', action='append', default=[], help='対象のプロジェクトID（複数指定可。省略時は全プロジェクト）')
+        parser.add_argument('--full', action='store_true', help='保存済みの座標を使わずに計算し直す')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.order_by('created_at', 'id')
+        if options['project']:
+            projects = projects.filter(pk__in=options['project'])
+
+        count = 0
+        started = time.monotonic()
+        for project_id in projects.values_list('id', flat=True).iterator():
+            project_started = time.monotonic()
+            layout = update_project_layout(project_id, full=options['full'])
+            count += 1
+            self.stdout.write(
+                f'{project_id}: ノード {len(layout.node_ids)} ({time.monotonic() - project_started:.2f}s)'
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f'{count} プロジェクトのレイアウトを保存しました ({time.monotonic() - started:.0f}s)')
+        )
@@ -0,0 +1,63 @@
+"""
+重複ノード（タイトル・文脈がほぼ同じノード）のクラスタを表示し、まとめるコマンド
+
+MinHash 署名の LSH で候補を絞るので、全ノードの組は比べない（apps.projects.dedup）。
+署名の無いノード（一括登録・インポート・保存したノード）の分は実行時に計算する。
+--merge を付けると各クラスタの重複ノードのリンクを最も古いノードへ付け替え、重複ノードを削除する。
+
+例:
+    python manage.py find_duplicates --global --threshold 0.9 --merge
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from apps.projects.dedup import find_duplicates, merge_duplicates
+from apps.projects.models import Node
+
+
+class Command(BaseCommand):
+    help = '重複ノードのクラスタを表示し、--merge でまとめます'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', action='append', default=[], help='対象のプロジェクトID（複数指定可）')
+        parser.add_argument('--global', action='store_true', dest='global_only', help='グローバルノードだけを対象にする')
+        parser.add_argument('--threshold', type=float, default=None, help='重複とみなす類似度（推定 Jaccard 係数。既定は DEDUP_THRESHOLD）')
+        parser.add_argument('--limit', type=int, default=20, help='表示するクラスタ数')
+        parser.add_argument('--merge', action='store_true', help='重複ノードをまとめる')
+        parser.add_argument('--rebuild', action='store_true', help='対象のノードの署名を全て計算し直す')
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        if threshold is not None and not 0 < threshold <= 1:
+            raise CommandError('--threshold は0より大きく1以下で指定してください')
+
+        # 省略時は全ノード
+        scope = Q()
+        if options['project']:
+            scope |= Q(project__in=options['project'])
+        if options['global_only']:
+            scope |= Q(project__isnull=True)
+
+        started = time.monotonic()
+        if options['rebuild']:
+            count = Node.objects.filter(scope).update(minhash=None)
+            self.stdout.write(f'{count} ノードの署名を計算し直します')
+        clusters = find_duplicates(scope, threshold)
+        self.stdout.write(
+            f'{len(clusters)} クラスタ、重複ノード {sum(len(cluster["nodes"]) - 1 for cluster in clusters)} '
+            f'({time.monotonic() - started:.1f}s)'
+        )
+        for cluster in clusters[:options['limit']]:
+            (keep_id, keep_title, _), *duplicates = cluster['nodes']
+            self.stdout.write(f'{keep_id} {keep_title!r} ({cluster["project_id"] or "global"})')
+            for node_id, title, similarity in duplicates:
+                self.stdout.write(f'    {similarity:.2f} {node_id} {title!r}')
+
+        if options['merge']:
+            result = merge_duplicates(clusters)
+            self.stdout.write(self.style.SUCCESS(
+                f'{result["cluster_count"]} クラスタの {result["merged_node_count"]} ノードをまとめました'
+                f'（付け替えたリンク {result["link_count"]}）'
+            ))
@@ -0,0 +1,244 @@
+"""
+大規模な検証用データを生成するコマンド
+
+同じ --seed なら同じデータ（UUID・タイトル・リンク構造）を生成する。
+ユーザー × プロジェクト × 5周 × 5ステップ × ステップごとのノードに加えて
+グローバルノードを作り、ノードごとの出次数を指定した分布から、リンクの重みを
+指定した比率から選ぶ。書き込みは bulk_create をバッチ単位で行う。
+
+例:
+    python manage.py seed_dataset --users 100 --projects-per-user 10 --nodes-per-step 40 \\
+        --global-nodes 1000 --degree-distribution powerlaw --mean-degree 3 \\
+        --weights 0.3:1,0.5:3,0.8:2,1.0:1
+"""
+import math
+import random
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.projects.models import Change, Node, NodeLink, ProcessStep, Project, Round
+from apps.projects.sync import CurrentTransactionId
+
+STEP_TYPES = [step_type for step_type, _ in ProcessStep.STEP_TYPE_CHOICES]
+ROUND_NUMBERS = range(1, 6)
+DEGREE_DISTRIBUTIONS = ('fixed', 'poisson', 'powerlaw')
+
+WORDS = [
+    '目的', '課題', '仮説', '利用者', '価値', '制約', '優先度', '流れ', '入力', '出力',
+    '画面', '通知', '検索', '共有', '権限', '履歴', '集計', '分析', '改善', '検証',
+    '市場', '競合', '費用', '期限', '品質', 'リスク', '依存', '拡張', '運用', '保守',
+]
+
+
+def parse_weights(value):
+    """'0.5:3,1.0:1' を ([Decimal('0.5'), Decimal('1.0')], [3.0, 1.0]) にする"""
+    weights, ratios = [], []
+    try:
+        for item in value.split(','):
+            weight, _, ratio = item.partition(':')
+            weights.append(Decimal(weight.strip()).quantize(Decimal('0.1')))
+            ratios.append(float(ratio) if ratio else 1.0)
+    except ArithmeticError:
+        raise CommandError(f'--weights の形式が正しくありません: {value}')
+    if any(not Decimal('0.1') <= weight <= Decimal('1.0') for weight in weights) or sum(ratios) <= 0:
+        raise CommandError('--weights の重みは 0.1〜1.0、比率は正の数で指定してください')
+    return weights, ratios
+
+
+class Seeder:
+    """乱数列から決定的にオブジェクトを作り、バッチ単位で書き込む"""
+
+    def __init__(self, options, stdout):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.stdout = stdout
+        self.batch_size = options['batch_size']
+        self.weights, self.weight_ratios = parse_weights(options['weights'])
+        self.buffers = {model: [] for model in (Project, Round, ProcessStep, Node, NodeLink)}
+        self.changes = []
+        self.counts = {model: 0 for model in (User, *self.buffers)}
+        self.started = time.monotonic()
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def phrase(self, n):
+        return ''.join(self.rng.choice(WORDS) for _ in range(n))
+
+    def add(self, obj, kind=None, user_id=None):
+        self.buffers[type(obj)].append(obj)
+        if kind is not None and self.options['record_changes']:
+            self.changes.append(Change(kind=kind, object_id=obj.pk, user_id=user_id, txid=CurrentTransactionId()))
+        if len(self.buffers[type(obj)]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """外部キーの参照先から順に書き込む"""
+        with transaction.atomic():
+            for model, objs in self.buffers.items():
+                if objs:
+                    model.objects.bulk_create(objs, batch_size=self.batch_size)
+                    self.counts[model] += len(objs)
+                    objs.clear()
+            if self.changes:
+                Change.objects.bulk_create(self.changes, batch_size=self.batch_size)
+                self.changes = []
+
+    def progress(self):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f'  users={self.counts[User]} projects={self.counts[Project]} '
+            f'nodes={self.counts[Node]} links={self.counts[NodeLink]} ({elapsed:.0f}s)'
+        )
+
+    def out_degree(self):
+        """ノード1件の出次数"""
+        mean = self.options['mean_degree']
+        distribution = self.options['degree_distribution']
+        if distribution == 'fixed':
+            return int(round(mean))
+        if distribution == 'poisson':
+            # Knuth の方法（平均が小さい前提）
+            limit, k, p = math.exp(-mean), 0, 1.0
+            while True:
+                p *= self.rng.random()
+                if p <= limit:
+                    return k
+                k += 1
+        # 平均が mean になるパレート分布（形状 alpha）を切り捨てる
+        alpha = self.options['powerlaw_alpha']
+        scale = mean * (alpha - 1) / alpha
+        return int(scale * self.rng.paretovariate(alpha))
+
+    def link_nodes(self, node_ids, global_ids, owner_id):
+        """プロジェクト内（一部はグローバルノード）へのリンクを作る"""
+        global_ratio = self.options['global_link_ratio']
+        for i, from_id in enumerate(node_ids):
+            degree = min(self.out_degree(), len(node_ids) - 1)
+            targets = set()
+            for _ in range(degree * 3):
+                if len(targets) >= degree:
+                    break
+                if global_ids and self.rng.random() < global_ratio:
+                    targets.add(self.rng.choice(global_ids))
+                else:
+                    j = self.rng.randrange(len(node_ids))
+                    if j != i:
+                        targets.add(node_ids[j])
+            for to_id in sorted(targets):
+                weight = self.rng.choices(self.weights, self.weight_ratios)[0]
+                self.add(NodeLink(id=self.uuid(), from_node_id=from_id, to_node_id=to_id, weight=weight), 'link', owner_id)
+
+    def run(self):
+        options = self.options
+        password = make_password(options['password'])
+
+        global_ids = []
+        for _ in range(options['global_nodes']):
+            node = Node(id=self.uuid(), title=self.phrase(2), context=self.phrase(6))
+            self.add(node, 'node')
+            global_ids.append(node.pk)
+
+        # ユーザーIDは採番されるので先に書き込む
+        users = [
+            User(username=f"{options['username_prefix']}{i:06d}", password=password)
+            for i in range(options['users'])
+        ]
+        for i in range(0, len(users), self.batch_size):
+            User.objects.bulk_create(users[i:i + self.batch_size], batch_size=self.batch_size)
+        self.counts[User] = len(users)
+        users = User.objects.filter(username__in=[user.username for user in users]).order_by('username')
+
+        projects_done = 0
+        for user in users.iterator():
+            for _ in range(options['projects_per_user']):
+                project = Project(
+                    id=self.uuid(),
+                    user_id=user.pk,
+                    title=self.phrase(3),
+                    status=self.rng.choice(('active', 'active', 'pending', 'completed'))
+                )
+                self.add(project, 'project', user.pk)
+                node_ids = []
+                for round_number in ROUND_NUMBERS:
+                    round_obj = Round(id=self.uuid(), project_id=project.pk, round_number=round_number)
+                    self.add(round_obj, 'round', user.pk)
+                    for step_type in STEP_TYPES:
+                        step = ProcessStep(
+                            id=self.uuid(),
+                            project_id=project.pk,
+                            round_id=round_obj.pk,
+                            step_type=step_type,
+                            content=self.phrase(12)
+                        )
+                        self.add(step, 'step', user.pk)
+                        for _ in range(options['nodes_per_step']):
+                            node = Node(
+                                id=self.uuid(),
+                                project_id=project.pk,
+                                round_id=round_obj.pk,
+                                step_id=step.pk,
+                                title=self.phrase(2),
+                                context=self.phrase(8)
+                            )
+                            self.add(node, 'node', user.pk)
+                            node_ids.append(node.pk)
+                self.link_nodes(node_ids, global_ids, user.pk)
+                projects_done += 1
+                if projects_done % 1000 == 0:
+                    self.progress()
+        self.flush()
+        self.progress()
+
+
+class Command(BaseCommand):
+    help = 'シードから決定的に大規模な検証用データを生成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+        parser.add_argument('--users', type=int, default=10, help='ユーザー数')
+        parser.add_argument('--projects-per-user', type=int, default=5, help='ユーザーごとのプロジェクト数')
+        parser.add_argument('--nodes-per-step', type=int, default=10, help='ステップごとのノード数（1プロジェクト5周×5ステップ）')
+        parser.add_argument('--global-nodes', type=int, default=100, help='グローバルノード数')
+        parser.add_argument(
+            '--degree-distribution', choices=DEGREE_DISTRIBUTIONS, default='poisson',
+            help='ノードごとの出次数の分布'
+        )
+        parser.add_argument('--mean-degree', type=float, default=2.0, help='出次数の平均')
+        parser.add_argument('--powerlaw-alpha', type=float, default=2.5, help='powerlaw の形状パラメータ（>1）')
+        parser.add_argument('--global-link-ratio', type=float, default=0.05, help='グローバルノードへのリンクの割合')
+        parser.add_argument(
+            '--weights', default='0.3:1,0.5:3,0.7:2,1.0:1',
+            help='リンクの重みと比率（重み:比率 のカンマ区切り）'
+        )
+        parser.add_argument('--username-prefix', default='seed', help='ユーザー名の接頭辞')
+        parser.add_argument('--password', default='testpass123', help='全ユーザー共通のパスワード')
+        parser.add_argument('--batch-size', type=int, default=5000, help='bulk_create の件数')
+        parser.add_argument(
+            '--no-changes', dest='record_changes', action='store_false',
+            help='差分同期用の変更履歴（Change）を記録しない'
+        )
+
+    def handle(self, *args, **options):
+        if options['powerlaw_alpha'] <= 1:
+            raise CommandError('--powerlaw-alpha は 1 より大きい値を指定してください')
+        prefix = options['username_prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f'ユーザー名が "{prefix}" で始まるユーザーが既に存在します（--username-prefix を変えてください）')
+
+        seeder = Seeder(options, self.stdout)
+        seeder.run()
+        counts = seeder.counts
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'生成しました: ユーザー {counts[User]} / プロジェクト {counts[Project]} / 周 {counts[Round]} / '
+                f'ステップ {counts[ProcessStep]} / ノード {counts[Node]} / リンク {counts[NodeLink]} '
+                f'({time.monotonic() - seeder.started:.0f}s)'
+            )
+        )
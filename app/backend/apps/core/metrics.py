@@ -0,0 +1,405 @@
+"""
+リクエストごとの計測
+
+RequestMetricsMiddleware がリクエストごとに次を計測する。
+
+- DBクエリの件数と時間（全接続の execute_wrappers に登録したラッパーで数える）
+- シリアライザ（data / is_valid）の時間
+- 認証の時間（apps.auth.authentication が timer('auth') で計測する）
+- レスポンスキャッシュの参照時間（apps.core.response_cache が timer('cache') で計測する）
+- ビューの時間とリクエスト全体の時間
+
+結果は Server-Timing ヘッダーと構造化ログ（logger: apps.core.metrics）で出し、
+ルート（URL名）とメソッドごとのヒストグラムに集計して /metrics で
+Prometheus のテキスト形式で返す。ストリーミングのレスポンス（グラフ・エクスポート）は
+本文を生成しながらクエリを実行するので、本文を読み切るか閉じた時点で集計とログを出す
+（ヘッダーは本文より先に送るので、Server-Timing に入るのは本文の前までの値）。レスポンスキャッシュ（apps.core.response_cache）の
+ヒット・ミスと無効化の件数も集計する。集計はプロセスごとなので、複数ワーカーで
+動かす場合はワーカーごとにスクレイプした値を合算する。
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+# リクエスト時間のヒストグラムの境界（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 1リクエストあたりのクエリ件数のヒストグラムの境界
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+# METRICS_TOKEN が無いときに /metrics を返す接続元
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """1リクエスト分の計測値"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.timings = {}
+        self._active = set()
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+def current():
+    """処理中のリクエストの計測値（リクエスト外ならNone）"""
+    return _current.get()
+
+
+@contextmanager
+def timer(name):
+    """処理中のリクエストの name の時間に加算する。同じ name の入れ子は外側だけ数える"""
+    metrics = _current.get()
+    if metrics is None or name in metrics._active:
+        yield
+        return
+    metrics._active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._active.discard(name)
+        metrics.add(name, time.perf_counter() - started)
+
+
+def _count_queries(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    # 接続（スレッドごと）が開くたびに呼ばれるので二重登録しない
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+def _timed_property(name, prop):
+    def fget(self):
+        with timer(name):
+            return prop.fget(self)
+    return property(fget, prop.fset, prop.fdel, prop.__doc__)
+
+
+def _timed_method(name, method):
+    def wrapper(self, *args, **kwargs):
+        with timer(name):
+            return method(self, *args, **kwargs)
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+def install():
+    """DBクエリとシリアライザの計測を有効にする（CoreConfig.ready から呼ぶ）"""
+    from rest_framework.serializers import BaseSerializer
+
+    connection_created.connect(_install_query_counter, dispatch_uid='apps.core.metrics')
+    # Serializer.data / ListSerializer.data は super().data 経由でここを通る
+    if not hasattr(BaseSerializer.is_valid, '__wrapped__'):
+        BaseSerializer.data = _timed_property('serializer', BaseSerializer.data)
+        BaseSerializer.is_valid = _timed_method('serializer', BaseSerializer.is_valid)
+
+
+class Histogram:
+    """累積バケットのヒストグラム"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """ルート・メソッドごとの集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.queries = {}
+        self.requests = {}
+        self.totals = {}
+        self.cache_requests = {}
+        self.cache_invalidations = {}
+
+    def observe(self, route, method, status, duration, metrics):
+        key = (route, method)
+        with self._lock:
+            if key not in self.durations:
+                self.durations[key] = Histogram(DURATION_BUCKETS)
+                self.queries[key] = Histogram(QUERY_BUCKETS)
+            self.durations[key].observe(duration)
+            self.queries[key].observe(metrics.db_queries)
+            status_key = (route, method, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            for name, seconds in (('db', metrics.db_time), *metrics.timings.items()):
+                total_key = (route, method, name)
+                self.totals[total_key] = self.totals.get(total_key, 0.0) + seconds
+
+    def observe_cache(self, route, result):
+        """レスポンスキャッシュの参照結果（hit / miss / stale）"""
+        key = (route, result)
+        with self._lock:
+            self.cache_requests[key] = self.cache_requests.get(key, 0) + 1
+
+    def observe_cache_invalidation(self, kind):
+        """レスポンスキャッシュのタグの無効化（kind はタグの種類）"""
+        with self._lock:
+            self.cache_invalidations[kind] = self.cache_invalidations.get(kind, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self.durations.clear()
+            self.queries.clear()
+            self.requests.clear()
+            self.totals.clear()
+            self.cache_requests.clear()
+            self.cache_invalidations.clear()
+
+    def render(self):
+        """Prometheus のテキスト形式"""
+        with self._lock:
+            lines = []
+            _render_histogram(
+                lines, 'thinkring_http_request_duration_seconds',
+                'Request latency by route and method', self.durations
+            )
+            _render_histogram(
+                lines, 'thinkring_http_request_db_queries',
+                'DB queries per request by route and method', self.queries
+            )
+            lines.append('# HELP thinkring_http_requests_total Requests by route, method and status')
+            lines.append('# TYPE thinkring_http_requests_total counter')
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'thinkring_http_requests_total{_labels(route=route, method=method, status=status)} {count}'
+                )
+            lines.append('# HELP thinkring_http_request_phase_seconds_total Time spent in db, auth, serializer and view')
+            lines.append('# TYPE thinkring_http_request_phase_seconds_total counter')
+            for (route, method, phase), seconds in sorted(self.totals.items()):
+                lines.append(
+                    f'thinkring_http_request_phase_seconds_total{_labels(route=route, method=method, phase=phase)} '
+                    f'{seconds!r}'
+                )
+            lines.append('# HELP thinkring_response_cache_requests_total Response cache lookups by route and result')
+            lines.append('# TYPE thinkring_response_cache_requests_total counter')
+            for (route, result), count in sorted(self.cache_requests.items()):
+                lines.append(
+                    f'thinkring_response_cache_requests_total{_labels(route=route, result=result)} {count}'
+                )
+            lines.append('# HELP thinkring_response_cache_invalidations_total Response cache tag invalidations by kind')
+            lines.append('# TYPE thinkring_response_cache_invalidations_total counter')
+            for kind, count in sorted(self.cache_invalidations.items()):
+                lines.append(f'thinkring_response_cache_invalidations_total{_labels(kind=kind)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _render_histogram(lines, name, help_text, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for (route, method), histogram in sorted(histograms.items()):
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{_labels(route=route, method=method, le=repr(float(bound)))} {count}')
+        lines.append(f'{name}_bucket{_labels(route=route, method=method, le="+Inf")} {histogram.count}')
+        lines.append(f'{name}_sum{_labels(route=route, method=method)} {histogram.sum!r}')
+        lines.append(f'{name}_count{_labels(route=route, method=method)} {histogram.count}')
+
+
+registry = MetricsRegistry()
+
+
+def route_name(request):
+    """集計に使うルート名（URL名。DRFのルーターなら 'project-nodes' のようにアクションまで分かる）"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_ROUTE
+    return match.view_name or match.route or UNMATCHED_ROUTE
+
+
+class MeasuredStream:
+    """ストリーミングのレスポンスの本文を生成する間も計測を続け、読み切るか閉じたときに集計する"""
+
+    def __init__(self, content, on_close):
+        self._iterator = iter(content)
+        self._on_close = on_close
+        self._metrics = _current.get()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = _current.set(self._metrics)
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self.close()
+            raise
+        finally:
+            _current.reset(token)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._on_close()
+
+
+class AsyncMeasuredStream(MeasuredStream):
+    """MeasuredStream の async イテレータ版"""
+
+    def __init__(self, content, on_close):
+        self._iterator = aiter(content)
+        self._on_close = on_close
+        self._metrics = _current.get()
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        token = _current.set(self._metrics)
+        try:
+            return await anext(self._iterator)
+        except StopAsyncIteration:
+            self.close()
+            raise
+        finally:
+            _current.reset(token)
+
+
+class RequestMetricsMiddleware:
+    """リクエストごとの計測を行い Server-Timing ヘッダーとログに出す（MIDDLEWARE の先頭に置く）"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+            return self.finish(request, response, metrics)
+        finally:
+            _current.reset(token)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+            return self.finish(request, response, metrics)
+        finally:
+            _current.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
+
+    def finish(self, request, response, metrics):
+        """Server-Timing を付け、集計する（ストリーミングなら本文を読み切るか閉じたときに集計する）"""
+        now = time.perf_counter()
+        if metrics.view_started is not None:
+            metrics.add('view', now - metrics.view_started)
+
+        timings = [('db', metrics.db_time, f'{metrics.db_queries} queries')]
+        timings += [(name, seconds, None) for name, seconds in sorted(metrics.timings.items())]
+        timings.append(('total', now - metrics.started, None))
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={seconds * 1000:.1f}' + (f';desc="{desc}"' if desc else '')
+            for name, seconds, desc in timings
+        )
+        # テストやベンチマークで、本文を読み切った後の計測値を見るため
+        response.request_metrics = metrics
+
+        if not response.streaming:
+            self.observe(request, response, metrics)
+            return response
+
+        def on_close():
+            metrics.add('stream', time.perf_counter() - now)
+            self.observe(request, response, metrics)
+
+        stream_class = AsyncMeasuredStream if response.is_async else MeasuredStream
+        response.streaming_content = stream_class(response.streaming_content, on_close)
+        return response
+
+    def observe(self, request, response, metrics):
+        duration = time.perf_counter() - metrics.started
+        route = route_name(request)
+        registry.observe(route, request.method, response.status_code, duration, metrics)
+
+        fields = {
+            'method': request.method,
+            'route': route,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'db_queries': metrics.db_queries,
+            'db_ms': round(metrics.db_time * 1000, 1),
+        }
+        for name, seconds in metrics.timings.items():
+            fields[f'{name}_ms'] = round(seconds * 1000, 1)
+        logger.info('%(method)s %(route)s %(status)s %(duration_ms)sms', fields, extra=fields)
+        return response
+
+
+def metrics_view(request):
+    """
+    /metrics
+
+    METRICS_TOKEN を設定した場合は Bearer トークンが必要。設定していなければ
+    同じホストから（REMOTE_ADDR がループバック）か、スタッフのユーザーだけに返す。
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif request.META.get('REMOTE_ADDR') not in LOOPBACK_ADDRESSES and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,152 @@
+"""
+ページネーション
+
+一覧は (created_at, id) のキーセット（カーソル）でページングする。
+COUNT(*) も OFFSET も使わないため、深いページでも先頭ページと同じコストで返せる。
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """(created_at, id) の複合キーによるカーソルページネーション"""
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'カーソルが不正です'
+
+    # 新しい順（created_at, id の降順）
+    descending = True
+
+    def __init__(self, cursor_query_param=None):
+        if cursor_query_param is not None:
+            self.cursor_query_param = cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._page(list(self._page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset の非同期版（async ORM で取得）"""
+        return self._page([row async for row in self._page_queryset(queryset, request)])
+
+    def _page_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self._page_size = page_size = self.get_page_size(request)
+        self._position, self._reverse = position, reverse = self.decode_cursor(request)
+
+        # reverse=True は「前のページ」方向に逆順でたどる
+        descending = self.descending != reverse
+        if position is not None:
+            queryset = self._after(queryset, position, descending)
+        if descending:
+            queryset = queryset.order_by('-created_at', '-id')
+        else:
+            queryset = queryset.order_by('created_at', 'id')
+        return queryset[:page_size + 1]
+
+    def _page(self, rows):
+        page_size, position, reverse = self._page_size, self._position, self._reverse
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_position = self.previous_position = None
+        if rows:
+            # 行はモデルのインスタンスか values_list(named=True) の行
+            first = (rows[0].created_at, rows[0].id)
+            last = (rows[-1].created_at, rows[-1].id)
+            if reverse:
+                self.next_position = last if position is not None else None
+                self.previous_position = first if has_more else None
+            else:
+                self.next_position = last if has_more else None
+                self.previous_position = first if position is not None else None
+        elif position is not None:
+            # 空ページでも来た方向へは戻れるようにする
+            if reverse:
+                self.next_position = position
+            else:
+                self.previous_position = position
+        return rows
+
+    @staticmethod
+    def _after(queryset, position, descending):
+        created_at, pk = position
+        if descending:
+            # created_at__lte は複合インデックスの範囲スキャンを効かせるため
+            return queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        return queryset.filter(created_at__gte=created_at).filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            created_at, pk, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            position = (datetime.fromisoformat(created_at), uuid.UUID(pk))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
+
+    def encode_cursor(self, position, reverse):
+        created_at, pk = position
+        payload = json.dumps([created_at.isoformat(), str(pk), reverse], separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class InMemoryPagination(LimitOffsetPagination):
+    """メモリ上で並べ替えた一覧（PageRank順など）のページネーション"""
+
+    max_limit = 100
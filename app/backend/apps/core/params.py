@@ -0,0 +1,8 @@
+"""
+クエリパラメータの解釈（views と async_views で共通）
+"""
+
+
+def is_true(value):
+    """クエリパラメータの真偽値を判定"""
+    return value is not None and value.lower() in ('1', 'true', 'yes')
@@ -0,0 +1,30 @@
+"""
+パーサー
+"""
+import io
+
+import orjson
+from rest_framework.parsers import JSONParser
+
+
+class FastJSONParser(JSONParser):
+    """
+    orjson による JSONParser
+
+    UTF-8 の本文を orjson で読む。それ以外の文字コードや、orjson が扱えない
+    入力（64ビットに収まらない整数など）は JSONParser に任せるので、
+    結果とエラーは JSONParser と同じ。
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read() if stream is not None else b''
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # エラーメッセージを JSONParser と揃えるため読み直す
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+
@@ -0,0 +1,91 @@
+"""
+レンダラー
+"""
+import datetime
+import json
+import uuid
+
+import orjson
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+# orjson でDRFの JSONRenderer とバイト単位で同じ出力になる型
+# （float は指数表記の書式が json と異なるので含めない）
+_ORJSON_SCALAR_TYPES = frozenset({str, int, bool, type(None), uuid.UUID, datetime.datetime})
+_ORJSON_CONTAINER_TYPES = (dict, list, tuple)
+
+
+def _orjson_compatible(data):
+    """data が orjson で JSONRenderer と同じ出力になる型だけでできているか（階層ごとに型を調べる）"""
+    level = [data]
+    while level:
+        containers = False
+        for value_type in set(map(type, level)):
+            if value_type in _ORJSON_SCALAR_TYPES:
+                continue
+            if not issubclass(value_type, _ORJSON_CONTAINER_TYPES):
+                return False
+            containers = True
+        if not containers:
+            return True
+        children = []
+        for value in level:
+            if isinstance(value, dict):
+                # orjson はキーが文字列でないとエラーになる
+                if not all(type(key) is str for key in value):
+                    return False
+                children.extend(value.values())
+            elif isinstance(value, _ORJSON_CONTAINER_TYPES):
+                children.extend(value)
+        level = children
+    return True
+
+
+def _orjson_default(obj):
+    if isinstance(obj, datetime.datetime):
+        # rest_framework.utils.encoders.JSONEncoder と同じ書式
+        representation = obj.isoformat()
+        if representation.endswith('+00:00'):
+            representation = representation[:-6] + 'Z'
+        return representation
+    raise TypeError
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    orjson による JSONRenderer
+
+    出力は JSONRenderer とバイト単位で同じ。float や Decimal など書式が
+    異なりうる値を含む場合と、インデント指定がある場合は JSONRenderer で描画する。
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None or not _orjson_compatible(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_orjson_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            # 64ビットに収まらない整数など
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer と同じく U+2028 / U+2029 はエスケープする
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    NDJSON（1行1JSON）
+
+    本文は StreamingHttpResponse で直接書き出すので、ここで描画するのは
+    エラーなど通常の Response だけ。?format=ndjson を受け付けるために使う。
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n').encode('utf-8')
@@ -0,0 +1,164 @@
+"""
+APIレスポンスのキャッシュ（タグによる無効化）
+
+GETのレスポンス（Response.data・ステータス・ETag / Last-Modified）をユーザー・
+ルート・URLごとに保存し、内容が依存するオブジェクトをタグ（'project:<id>' など）で
+記録する。タグごとにバージョン値を持ち、書き込み時に signals がそのタグの
+バージョン値だけを変えるので、関係するエントリだけが次の読み込みで無効になる。
+無効になったエントリは次の保存で上書きされるか、件数上限・期限で追い出される。
+
+エントリとタグのバージョン値は同じキャッシュ（CACHES['responses']）に置くので、
+file / db バックエンドにすればワーカープロセス間で共有される。
+"""
+import hashlib
+import pickle
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from . import metrics
+
+RESPONSE_CACHE_ALIAS = 'responses'
+GLOBAL_TAG_ID = 'global'
+# レスポンスと一緒に保存するヘッダー（条件付きGETに使う）
+CACHED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def tag(kind, object_id):
+    """タグ名（object_id が None ならグローバル。プロジェクトに属さないノードなど）"""
+    return f'{kind}:{GLOBAL_TAG_ID if object_id is None else object_id}'
+
+
+def _tag_key(name):
+    return f'response-tag:{name}'
+
+
+def _new_version():
+    # incr は file / db バックエンドでアトミックでないので、毎回新しい値にする
+    return uuid.uuid4().hex
+
+
+class ResponseCache:
+    """レスポンスのエントリとタグのバージョン値の読み書き"""
+
+    def __init__(self, alias=RESPONSE_CACHE_ALIAS):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def tag_versions(self, tags):
+        """タグ → 現在のバージョン値（無いタグは作る）"""
+        keys = {_tag_key(name): name for name in tags}
+        found = self.cache.get_many(list(keys))
+        missing = {key: _new_version() for key in keys if key not in found}
+        if missing:
+            # 追い出されたタグも新しい値になるので、古いエントリは一致しない
+            self.cache.set_many(missing, timeout=None)
+            found.update(missing)
+        return {name: found[key] for key, name in keys.items()}
+
+    def get(self, key):
+        """(エントリ, 結果) を返す。結果は hit / miss / stale"""
+        raw = self.cache.get(key)
+        if raw is None:
+            return None, 'miss'
+        entry = pickle.loads(raw)
+        if self.tag_versions(entry['tags']) != entry['tags']:
+            return None, 'stale'
+        return entry, 'hit'
+
+    def set(self, key, entry):
+        """エントリを保存する（RESPONSE_CACHE_MAX_ENTRY_BYTES を超えるものは保存しない）"""
+        raw = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        if len(raw) > settings.RESPONSE_CACHE_MAX_ENTRY_BYTES:
+            return False
+        self.cache.set(key, raw, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+        return True
+
+    def invalidate(self, tags):
+        """tags に依存するエントリを無効にする"""
+        tags = set(tags)
+        if not tags:
+            return
+        self.cache.set_many({_tag_key(name): _new_version() for name in tags}, timeout=None)
+        for name in tags:
+            metrics.registry.observe_cache_invalidation(name.partition(':')[0])
+
+    def invalidate_on_commit(self, tags):
+        """トランザクションのコミット後に無効にする（コミット前の内容を新しいバージョンで保存させない）"""
+        tags = tuple(tags)
+        transaction.on_commit(lambda: self.invalidate(tags))
+
+
+response_cache = ResponseCache()
+
+
+def response_key(request, route):
+    """ユーザー・ルート・URL（クエリ文字列と、次ページのリンクに使うホストを含む）ごとのキー"""
+    digest = hashlib.sha1(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return f'response:{request.user.pk}:{route}:{digest}'
+
+
+def _cached_response(request, entry):
+    headers = entry['headers']
+    not_modified = get_conditional_response(
+        request,
+        etag=headers.get('ETag'),
+        last_modified=parse_http_date_safe(headers['Last-Modified']) if 'Last-Modified' in headers else None,
+    )
+    if not_modified is not None:
+        return not_modified
+    return Response(entry['data'], status=entry['status'], headers=headers)
+
+
+class CachedResponseMixin:
+    """
+    ViewSet のGETをレスポンスキャッシュから返す
+
+    get_cache_tags() がタグの列を返したリクエストだけをキャッシュする（None ならキャッシュしない）。
+    保存するのはステータス200の Response だけで、ストリーミングのレスポンスは対象外。
+    """
+
+    def get_cache_tags(self):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        # 認証（initial）の後に呼ばれるハンドラーを差し替える
+        handler = getattr(self, 'get', None)
+        if handler is not None and settings.RESPONSE_CACHE_ENABLED:
+            self.get = self._cached_handler(handler)
+        return super().dispatch(request, *args, **kwargs)
+
+    def _cached_handler(self, handler):
+        def cached(request, *args, **kwargs):
+            tags = self.get_cache_tags()
+            if tags is None:
+                return handler(request, *args, **kwargs)
+            route = metrics.route_name(request)
+            key = response_key(request, route)
+            with metrics.timer('cache'):
+                entry, result = response_cache.get(key)
+                # 内容を組み立てる前のバージョン値を保存する（組み立て中の書き込みは次の読み込みで無効になる）
+                versions = response_cache.tag_versions(tags) if entry is None else None
+            metrics.registry.observe_cache(route, result)
+            if entry is not None:
+                return _cached_response(request, entry)
+
+            response = handler(request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                with metrics.timer('cache'):
+                    response_cache.set(key, {
+                        'tags': versions,
+                        'status': response.status_code,
+                        'data': response.data,
+                        'headers': {name: response[name] for name in CACHED_HEADERS if response.has_header(name)},
+                    })
+            return response
+        return cached
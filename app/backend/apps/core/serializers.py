@@ -0,0 +1,147 @@
+"""
+一覧用の軽量シリアライザー
+
+ModelSerializer はモデルのインスタンスを作ってフィールドごとに to_representation を
+呼ぶので、数千件の一覧では行の組み立てが支配的になる。ValuesSerializer は
+values_list() のタプルから、ModelSerializer の定義を元に事前に組み立てた
+関数で1行ずつ dict を作る。出力は元の ModelSerializer と同じ。
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+
+def _datetime_representation(value, tz):
+    # DateTimeField.to_representation（ISO 8601、USE_TZ=True）と同じ
+    if timezone.is_aware(value):
+        value = value.astimezone(tz)
+    else:
+        value = timezone.make_aware(value, tz)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class SparseFieldsSerializerMixin:
+    """fields（フィールド名の列）を渡すと、そのフィールドだけを返す"""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ValuesSerializer:
+    """
+    values_list() の行を ModelSerializer と同じ dict にする（読み取り専用）
+
+    serializer_class のフィールドをそのまま使い、DBの列にならないフィールド
+    （プロパティや SerializerMethodField）は computed に
+    {フィールド名: (元にする列, 関数)} で指定する。
+    """
+
+    serializer_class = None
+    computed = {}
+
+    def __init__(self, rows, fields=None):
+        self.rows = rows
+        self.fields = fields
+
+    @classmethod
+    def field_names(cls):
+        """出力するフィールド名（serializer_class の順）"""
+        return tuple(name for name, field in cls.serializer_class().fields.items() if not field.write_only)
+
+    @classmethod
+    def values(cls, queryset, fields=None):
+        """
+        一覧の行を取得するクエリセット（キーセットページネーション用に created_at, id も含む）
+
+        fields を指定すると、そのフィールドに必要な列だけを取得する。
+        """
+        return queryset.values_list(*cls._compiled(fields)[0], named=True)
+
+    @property
+    def data(self):
+        _, build = self._compiled(self.fields)
+        tz = timezone.get_current_timezone()
+        return [build(row, tz) for row in self.rows]
+
+    @classmethod
+    def _compiled(cls, fields=None):
+        # fields の組み合わせごとに組み立てた関数をクラスに保持する
+        cache = cls.__dict__.get('_compiled_cache')
+        if cache is None:
+            cache = cls._compiled_cache = {}
+        key = tuple(fields) if fields is not None else None
+        compiled = cache.get(key)
+        if compiled is None:
+            compiled = cache[key] = cls._compile(key)
+        return compiled
+
+    @classmethod
+    def _compile(cls, fields=None):
+        model = cls.serializer_class.Meta.model
+        columns = []
+        namespace = {'_datetime': _datetime_representation}
+        items = []
+
+        def column(lookup):
+            if lookup not in columns:
+                columns.append(lookup)
+            return f'row[{columns.index(lookup)}]'
+
+        for name, field in cls.serializer_class().fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if name in cls.computed:
+                lookup, func = cls.computed[name]
+                converter = f'_c{len(namespace)}'
+                namespace[converter] = func
+                items.append(f'{name!r}: {converter}({column(lookup)})')
+                continue
+
+            lookup = field.source.replace('.', '__')
+            try:
+                model._meta.get_field(lookup.split('__')[0])
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(
+                    f'{cls.__name__}: {name} はDBの列ではないので computed に指定してください'
+                )
+            value = column(lookup)
+            expression = cls._field_expression(field, value, namespace)
+            items.append(f'{name!r}: {expression}')
+
+        # ページネーションで使う列
+        column('created_at')
+        column('id')
+        source = 'def build(row, tz):\n    return {' + ', '.join(items) + '}\n'
+        exec(source, namespace)
+        return columns, namespace['build']
+
+    @staticmethod
+    def _field_expression(field, value, namespace):
+        """1フィールドの値を出力にする式（None はそのまま None）"""
+        if isinstance(field, (serializers.BooleanField, serializers.IntegerField)) or (
+            type(field) in (serializers.CharField, serializers.ChoiceField)
+        ):
+            # DBから読んだ値は to_representation しても変わらない
+            return value
+        if isinstance(field, serializers.UUIDField) and field.uuid_format == 'hex_verbose':
+            namespace['_str'] = str
+            return f'(None if {value} is None else _str({value}))'
+        if (
+            type(field) is serializers.DateTimeField
+            and settings.USE_TZ
+            and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == 'iso-8601'
+            and not hasattr(field, 'timezone')
+        ):
+            return f'(None if {value} is None else _datetime({value}, tz))'
+        converter = f'_f{len(namespace)}'
+        namespace[converter] = field.to_representation
+        return f'(None if {value} is None else {converter}({value}))'
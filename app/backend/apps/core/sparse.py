@@ -0,0 +1,118 @@
+"""
+スパースフィールドセット（?fields= / ?omit=）
+
+?fields=id,title で返すフィールドを指定し、?omit=context で指定したフィールドを除く。
+どちらも無い場合はビューごとの既定（一覧では長いテキスト列を除くなど）に従う。
+?omit=（空）を付けると既定で除かれるフィールドも含めて全て返す。
+
+選択は SQL にも反映する。一覧は values_list() の列を絞り、詳細は返さない
+テキスト列を defer() するので、大きなテキスト列をDBから読まない。
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_QUERY_PARAM = 'fields'
+OMIT_QUERY_PARAM = 'omit'
+
+
+class InvalidFieldSelection(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'fields / omit に指定できないフィールドがあります'
+    default_code = 'VAL_001'
+
+
+def _names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def select_fields(request, available, default_omit=()):
+    """
+    返すフィールド名のタプル（available の順）。全フィールドを返す場合は None
+
+    request は DRF の Request でも Django の HttpRequest でもよい。
+    """
+    params = getattr(request, 'query_params', None) or request.GET
+    if FIELDS_QUERY_PARAM in params:
+        requested = _names(params[FIELDS_QUERY_PARAM])
+        if not requested:
+            raise InvalidFieldSelection('fields には1つ以上のフィールドを指定してください')
+        unknown = [name for name in requested if name not in available]
+        selected = [name for name in available if name in requested]
+    else:
+        if OMIT_QUERY_PARAM in params:
+            omitted = _names(params[OMIT_QUERY_PARAM])
+            unknown = [name for name in omitted if name not in available]
+        else:
+            omitted, unknown = default_omit, []
+        selected = [name for name in available if name not in omitted]
+    if unknown:
+        raise InvalidFieldSelection(
+            f"指定できないフィールドです: {', '.join(unknown)}（指定できるのは {', '.join(available)}）"
+        )
+    return None if len(selected) == len(available) else tuple(selected)
+
+
+def readable_fields(serializer_class):
+    """シリアライザーが出力するフィールド名"""
+    return tuple(name for name, field in serializer_class().fields.items() if not field.write_only)
+
+
+def deferred_columns(serializer_class, fields):
+    """fields に含まれないシリアライザーのフィールドのうち、defer() するテキスト列"""
+    model = serializer_class.Meta.model
+    columns = []
+    for name, field in serializer_class().fields.items():
+        if name in fields or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if isinstance(model_field, models.TextField):
+            columns.append(model_field.name)
+    return columns
+
+
+class SparseFieldsMixin:
+    """
+    ViewSet の list / retrieve で ?fields= / ?omit= を受け付ける
+
+    シリアライザーは fields 引数を受け付けること（apps.core.serializers.SparseFieldsSerializerMixin）。
+    一覧の既定で除くフィールドは default_omit_fields に指定する。
+    """
+
+    default_omit_fields = ()
+
+    def get_sparse_fields(self):
+        """list / retrieve で返すフィールド（全フィールドなら None）"""
+        if self.request.method not in SAFE_METHODS or self.action not in ('list', 'retrieve'):
+            return None
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = select_fields(
+                self.request,
+                readable_fields(self.get_serializer_class()),
+                self.default_omit_fields if self.action == 'list' else ()
+            )
+        return self._sparse_fields
+
+    def select_values_fields(self, values_serializer_class, default_omit=()):
+        """一覧を返す @action で返すフィールド（ValuesSerializer に渡す）"""
+        return select_fields(self.request, values_serializer_class.field_names(), default_omit)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields = self.get_sparse_fields() if self.action == 'retrieve' else None
+        if fields is not None:
+            columns = deferred_columns(self.get_serializer_class(), fields)
+            if columns:
+                queryset = queryset.defer(*columns)
+        return queryset
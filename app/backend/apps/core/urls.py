@@ -2,7 +2,13 @@ from django.urls import path, include
 from apps.projects.urls import (
     round_urlpatterns,
     step_urlpatterns,
-    node_urlpatterns
+    node_urlpatterns,
+    search_urlpatterns,
+    sync_urlpatterns,
+    export_urlpatterns,
+    import_urlpatterns,
+    async_urlpatterns,
+    graph_cache_urlpatterns
 )
 
 urlpatterns = [
@@ -11,5 +17,11 @@ urlpatterns = [
     path('rounds/', include(round_urlpatterns)),  # /rounds/ エンドポイント
     path('steps/', include(step_urlpatterns)),  # /steps/ エンドポイント
     path('nodes/', include(node_urlpatterns)),  # /nodes/ エンドポイント
+    path('search/', include(search_urlpatterns)),  # /search/ エンドポイント
+    path('sync/', include(sync_urlpatterns)),  # /sync/ エンドポイント
+    path('export/', include(export_urlpatterns)),  # /export/ エンドポイント
+    path('import/', include(import_urlpatterns)),  # /import/ エンドポイント
+    path('async/', include(async_urlpatterns)),  # 読み取りAPIの async 版
+    path('graph-cache/', include(graph_cache_urlpatterns)),  # /graph-cache/ エンドポイント
 ]
 
@@ -13,6 +13,7 @@ class ProjectAdmin(admin.ModelAdmin):
 @admin.register(Round)
 class RoundAdmin(admin.ModelAdmin):
     list_display = ('project', 'round_number', 'created_at')
+    list_select_related = ('project',)
     list_filter = ('round_number', 'created_at')
     search_fields = ('project__title',)
 
@@ -20,6 +21,7 @@ class RoundAdmin(admin.ModelAdmin):
 @admin.register(ProcessStep)
 class ProcessStepAdmin(admin.ModelAdmin):
     list_display = ('project', 'round', 'step_type', 'created_at')
+    list_select_related = ('project', 'round__project')
     list_filter = ('step_type', 'created_at')
     search_fields = ('content',)
 
@@ -27,11 +29,12 @@ class ProcessStepAdmin(admin.ModelAdmin):
 @admin.register(Node)
 class NodeAdmin(admin.ModelAdmin):
     list_display = ('title', 'project', 'is_global', 'created_at')
+    list_select_related = ('project',)
     list_filter = ('created_at',)
     search_fields = ('title', 'context')
     
     def is_global(self, obj):
-        return obj.project is None
+        return obj.project_id is None
     is_global.boolean = True
     is_global.short_description = 'グローバルノード'
 
@@ -39,5 +42,6 @@ class NodeAdmin(admin.ModelAdmin):
 @admin.register(NodeLink)
 class NodeLinkAdmin(admin.ModelAdmin):
     list_display = ('from_node', 'to_node', 'weight', 'created_at')
+    list_select_related = ('from_node', 'to_node')
     list_filter = ('created_at',)
 
@@ -0,0 +1,276 @@
+"""
+CSRグラフ（apps.projects.graph_engine）に対する分析処理
+
+結果は ProjectGraph.memo に保持するため、リンクが変わるまで再計算しない。
+"""
+import numpy as np
+
+
+def strongly_connected_components(graph):
+    """
+    強連結成分を求め、各ノードの成分ラベル配列を返す
+
+    Tarjan法を明示的なスタックで実装しているため再帰上限に当たらない。
+    計算量は O(ノード数 + 辺数)。
+    """
+    return graph.memo('scc', lambda: _tarjan(graph.n_nodes, graph.indptr.tolist(), graph.indices.tolist()))
+
+
+def _tarjan(n_nodes, indptr, indices):
+    index_of = [-1] * n_nodes
+    lowlink = [0] * n_nodes
+    on_stack = [False] * n_nodes
+    labels = np.full(n_nodes, -1, dtype=np.int32)
+    stack = []
+    counter = 0
+    n_components = 0
+
+    for root in range(n_nodes):
+        if index_of[root] != -1:
+            continue
+        # (ノード, 次に調べる辺の位置) のスタックで深さ優先探索を行う
+        work = [(root, indptr[root])]
+        index_of[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+
+        while work:
+            v, pos = work[-1]
+            end = indptr[v + 1]
+            # 未訪問の子が見つかるまで辺を進める
+            while pos < end:
+                w = indices[pos]
+                pos += 1
+                if index_of[w] == -1:
+                    work[-1] = (v, pos)
+                    index_of[w] = lowlink[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, indptr[w]))
+                    break
+                if on_stack[w] and index_of[w] < lowlink[v]:
+                    lowlink[v] = index_of[w]
+            else:
+                # vの辺をすべて調べ終えた
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if lowlink[v] < lowlink[parent]:
+                        lowlink[parent] = lowlink[v]
+                if lowlink[v] == index_of[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        labels[w] = n_components
+                        if w == v:
+                            break
+                    n_components += 1
+
+    return labels
+
+
+def rings(graph):
+    """
+    2ノード以上からなる強連結成分（リング）を返す
+
+    各要素は (メンバーのインデックス配列, 内部の辺数, 内部の辺の重み合計)。
+    大きいリングから順に並べる。
+    """
+    return graph.memo('rings', lambda: _rings(graph))
+
+
+def _rings(graph):
+    labels = strongly_connected_components(graph)
+    if not graph.n_nodes:
+        return []
+    n_components = int(labels.max()) + 1
+    sizes = np.bincount(labels, minlength=n_components)
+
+    src_labels = labels[graph.sources()]
+    internal = src_labels == labels[graph.indices]
+    edge_counts = np.bincount(src_labels[internal], minlength=n_components)
+    weight_sums = np.bincount(
+        src_labels[internal],
+        weights=graph.weights[internal].astype(np.float64),
+        minlength=n_components,
+    )
+
+    ring_labels = np.flatnonzero(sizes > 1)
+    ring_labels = ring_labels[np.argsort(-sizes[ring_labels], kind='stable')]
+    order = np.argsort(labels, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(sizes)))
+    return [
+        (order[starts[label]:starts[label + 1]], int(edge_counts[label]), float(weight_sums[label]))
+        for label in ring_labels
+    ]
+
+
+def pagerank(graph, damping=0.85, tol=1e-6, max_iter=100):
+    """
+    重み付きPageRankを求める
+
+    (各ノードのランク配列, 反復回数, 収束したか) を返す。辺の重みで遷移確率を
+    配分し、出リンクの無いノードのランクは全ノードに均等に配る。
+    疎行列とベクトルの積は np.bincount で計算する。
+    """
+    return graph.memo(
+        'pagerank',
+        lambda: _pagerank(graph, damping, tol, max_iter),
+        params=(damping, tol, max_iter),
+    )
+
+
+def _pagerank(graph, damping, tol, max_iter):
+    n = graph.n_nodes
+    if not n:
+        return np.empty(0, dtype=np.float64), 0, True
+
+    src = graph.sources()
+    weights = graph.weights.astype(np.float64)
+    out_weight = np.bincount(src, weights=weights, minlength=n)
+    # 辺ごとの遷移確率（始点の出リンク重みで正規化）
+    coef = weights / out_weight[src] if weights.size else weights
+    dangling = out_weight == 0
+
+    ranks = np.full(n, 1.0 / n)
+    converged = False
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        spread = np.bincount(graph.indices, weights=ranks[src] * coef, minlength=n)
+        new_ranks = (1.0 - damping) / n + damping * (spread + ranks[dangling].sum() / n)
+        delta = np.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        if delta < tol:
+            converged = True
+            break
+    return ranks, iterations, converged
+
+
+def rank_order(graph, **params):
+    """PageRankの降順に並べたノードインデックスの配列"""
+    ranks, _, _ = pagerank(graph, **params)
+    return graph.memo(
+        'rank_order',
+        lambda: np.argsort(-ranks, kind='stable'),
+        params=tuple(sorted(params.items())),
+    )
+
+
+def degrees(graph):
+    """(入次数, 出次数, 重み付き入次数, 重み付き出次数) の配列"""
+    return graph.memo('degrees', lambda: _degrees(graph))
+
+
+def _degrees(graph):
+    n = graph.n_nodes
+    weights = graph.weights.astype(np.float64)
+    return (
+        graph.in_degree(),
+        graph.out_degree(),
+        np.bincount(graph.indices, weights=weights, minlength=n),
+        np.bincount(graph.sources(), weights=weights, minlength=n),
+    )
+
+
+def node_ranks(graph, **params):
+    """ノードID → PageRank の辞書"""
+    ranks, _, _ = pagerank(graph, **params)
+    return dict(zip(graph.node_ids, ranks.tolist()))
+
+
+# コミュニティの階層の最大レベル数
+COMMUNITY_MAX_LEVELS = 8
+# 1レベルの局所移動でノードを一巡する最大回数
+COMMUNITY_MAX_PASSES = 20
+
+
+def communities(graph):
+    """
+    Louvain法でコミュニティの階層を求める
+
+    リンクの向きを無視した重み付きグラフのモジュラリティを、ノードを隣の
+    コミュニティへ移す局所移動と、コミュニティを1ノードに縮約する処理の
+    繰り返しで大きくする。細かいレベルから順に、ノード → コミュニティ番号の
+    配列のタプルを返す（縮約が進まなくなったら終わる。リンクが無ければ空）。
+    """
+    return graph.memo('communities', lambda: _louvain(graph))
+
+
+def _louvain(graph):
+    n = graph.n_nodes
+    src = graph.sources().astype(np.int64)
+    dst = graph.indices.astype(np.int64)
+    weights = graph.weights.astype(np.float64)
+    # 無向の隣接（両方向に持つ）
+    rows = np.concatenate((src, dst))
+    cols = np.concatenate((dst, src))
+    values = np.concatenate((weights, weights))
+
+    membership = np.arange(n)
+    levels = []
+    size = n
+    for _ in range(COMMUNITY_MAX_LEVELS):
+        indptr, indices, data = _coalesce(rows, cols, values, size)
+        labels = _local_moving(size, indptr.tolist(), indices.tolist(), data.tolist())
+        count = int(labels.max()) + 1 if size else 0
+        if count == size:
+            break
+        membership = labels[membership]
+        levels.append(membership.astype(np.int32))
+        # 縮約したグラフ（コミュニティ内のリンクは自己ループになる）
+        rows, cols = labels[rows], labels[cols]
+        size = count
+    return tuple(levels)
+
+
+def _coalesce(rows, cols, values, size):
+    """(行, 列, 値) の列を、重複を足し合わせたCSRにする"""
+    keys, inverse = np.unique(rows * size + cols, return_inverse=True)
+    data = np.bincount(inverse, weights=values, minlength=len(keys))
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // size, minlength=size), out=indptr[1:])
+    return indptr, keys % size, data
+
+
+def _local_moving(size, indptr, indices, data):
+    """モジュラリティが増える限りノードを隣のコミュニティへ移し、コミュニティ番号の配列を返す"""
+    degree = [sum(data[indptr[i]:indptr[i + 1]]) for i in range(size)]
+    total = sum(degree)
+    community = list(range(size))
+    if not total:
+        return np.arange(size)
+    # コミュニティごとの次数の和
+    tot = degree[:]
+
+    for _ in range(COMMUNITY_MAX_PASSES):
+        moved = 0
+        for i in range(size):
+            current = community[i]
+            k_i = degree[i]
+            links = {}
+            for pos in range(indptr[i], indptr[i + 1]):
+                j = indices[pos]
+                if j != i:
+                    c = community[j]
+                    links[c] = links.get(c, 0.0) + data[pos]
+            tot[current] -= k_i
+            # i を外したうえで、入れたときのモジュラリティの増分（定数倍を除く）が最大のコミュニティ
+            best = current
+            best_gain = links.get(current, 0.0) - tot[current] * k_i / total
+            for c, weight in links.items():
+                gain = weight - tot[c] * k_i / total
+                if gain > best_gain + 1e-12:
+                    best, best_gain = c, gain
+            tot[best] += k_i
+            if best != current:
+                community[i] = best
+                moved += 1
+        if not moved:
+            break
+
+    # 現れた順に振り直す
+    _, first, labels = np.unique(community, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first, kind='stable'), kind='stable')
+    return order[labels]
@@ -0,0 +1,209 @@
+"""
+よく呼ばれる読み取りAPIの async 版（/async/ 以下）
+
+ポーリングの多いクライアント向け。ASGI（uvicorn）で動かすと、DBの応答を
+待つ間もワーカースレッドを占有しない。認証（JWT）とDBアクセスは async で行い、
+レスポンスの形式・ページネーション・ETag・?fields= / ?omit= は同期版のViewSetと同じ。
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotAuthenticated, NotFound
+from rest_framework.request import Request
+
+from apps.auth.authentication import AsyncJWTAuthentication
+from apps.core.conditional import Validators, aqueryset_fingerprint
+from apps.core.exceptions import error_payload
+from apps.core.pagination import InMemoryPagination, KeysetPagination
+from apps.core.params import is_true
+from apps.core.renderers import FastJSONRenderer
+from apps.core.sparse import select_fields
+
+from . import versions
+from .analytics import pagerank, rank_order
+from .graph_engine import GRAPH_VERSION_NAMESPACE, get_project_graph
+from .models import Node, NodeLink, ProcessStep, Project, Round
+from .serializers import (
+    NodeLinkValuesSerializer,
+    NodeValuesSerializer,
+    ProcessStepValuesSerializer,
+    ProjectValuesSerializer,
+    RoundValuesSerializer,
+)
+from .snapshot import STEP_TYPE_ORDER
+from .views import DEFAULT_NODE_OMIT, pagerank_params
+
+authenticator = AsyncJWTAuthentication()
+
+
+def _render(data, status_code=status.HTTP_200_OK):
+    # 同期版と同じレンダラーでバイト単位で同じ出力にする
+    return HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status_code)
+
+
+def async_api_view(view):
+    """GETのみ受け付け、JWTで認証し、APIExceptionを共通のエラー形式で返す"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method != 'GET':
+                raise MethodNotAllowed(request.method)
+            auth = await authenticator.aauthenticate(request)
+            if auth is None:
+                raise NotAuthenticated()
+            request.user = auth[0]
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            response = _render(error_payload(exc), exc.status_code)
+            if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            return response
+    return wrapper
+
+
+async def _get_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise NotFound()
+
+
+def _paginated(paginator, data):
+    return paginator.get_paginated_response(data).data
+
+
+@async_api_view
+async def project_list(request):
+    """プロジェクト一覧を取得"""
+    fields = select_fields(request, ProjectValuesSerializer.field_names())
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(
+        ProjectValuesSerializer.values(Project.objects.filter(user=request.user), fields), Request(request)
+    )
+    return _render(_paginated(paginator, ProjectValuesSerializer(page, fields).data))
+
+
+@async_api_view
+async def project_nodes(request, pk):
+    """プロジェクトのノード一覧を取得（?rank=true でPageRankを付与）"""
+    project = await _get_or_404(Project.objects.filter(user=request.user), pk=pk)
+    nodes = Node.objects.filter(project=project)
+    with_rank = is_true(request.GET.get('rank'))
+    fields = select_fields(request, NodeValuesSerializer.field_names(), DEFAULT_NODE_OMIT)
+
+    validators = Validators(
+        request,
+        project.updated_at,
+        await aqueryset_fingerprint(nodes),
+        await sync_to_async(versions.get_version)(GRAPH_VERSION_NAMESPACE, project.pk) if with_rank else None
+    )
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    drf_request = Request(request)
+    if not with_rank:
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(NodeValuesSerializer.values(nodes, fields), drf_request)
+        return validators.apply(_render(_paginated(paginator, NodeValuesSerializer(page, fields).data)))
+
+    # グラフの構築とPageRankはCPU処理なのでスレッドで実行する
+    params = pagerank_params()
+    graph = await sync_to_async(get_project_graph)(project.pk)
+    ranks, _, _ = await sync_to_async(pagerank)(graph, **params)
+    if request.GET.get('ordering') == 'rank':
+        paginator = InMemoryPagination()
+        order = await sync_to_async(rank_order)(graph, **params)
+        page_ids = [graph.node_ids[i] for i in paginator.paginate_queryset(order, drf_request)]
+        rows_by_id = {row.id: row async for row in NodeValuesSerializer.values(nodes.filter(pk__in=page_ids), fields)}
+        page = [rows_by_id[node_id] for node_id in page_ids if node_id in rows_by_id]
+    else:
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(NodeValuesSerializer.values(nodes, fields), drf_request)
+
+    data = NodeValuesSerializer(page, fields).data
+    for row, item in zip(page, data):
+        i = graph.index.get(row.id)
+        item['rank'] = float(ranks[i]) if i is not None else 0.0
+    return validators.apply(_render(_paginated(paginator, data)))
+
+
+@async_api_view
+async def project_rounds(request, pk):
+    """プロジェクトの周一覧を取得"""
+    project = await _get_or_404(Project.objects.filter(user=request.user), pk=pk)
+    rounds = Round.objects.filter(project=project).order_by('round_number')
+    validators = Validators(request, await aqueryset_fingerprint(rounds))
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    fields = select_fields(request, RoundValuesSerializer.field_names())
+    data = RoundValuesSerializer([row async for row in RoundValuesSerializer.values(rounds, fields)], fields).data
+    return validators.apply(_render(data))
+
+
+@async_api_view
+async def round_steps(request, pk):
+    """周のステップ一覧を取得（ステップ種別の順）"""
+    round_obj = await _get_or_404(Round.objects.filter(project__user=request.user), pk=pk)
+    steps = ProcessStep.objects.filter(round=round_obj)
+    validators = Validators(request, await aqueryset_fingerprint(steps))
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    fields = select_fields(request, ProcessStepValuesSerializer.field_names())
+    rows = ProcessStepValuesSerializer.values(steps.order_by(STEP_TYPE_ORDER), fields)
+    data = ProcessStepValuesSerializer([row async for row in rows], fields).data
+    return validators.apply(_render(data))
+
+
+@async_api_view
+async def global_nodes(request):
+    """グローバルノード一覧を取得"""
+    fields = select_fields(request, NodeValuesSerializer.field_names(), DEFAULT_NODE_OMIT)
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(
+        NodeValuesSerializer.values(Node.objects.filter(project__isnull=True), fields), Request(request)
+    )
+    return _render(_paginated(paginator, NodeValuesSerializer(page, fields).data))
+
+
+@async_api_view
+async def node_links(request, pk):
+    """ノードのリンク一覧を取得（送信・受信それぞれ別カーソルでページング）"""
+    node = await _get_or_404(
+        Node.objects.filter(Q(project__user=request.user) | Q(project__isnull=True)),
+        pk=pk
+    )
+    validators = Validators(
+        request,
+        await aqueryset_fingerprint(
+            NodeLink.objects.filter(Q(from_node=node) | Q(to_node=node)),
+            'updated_at',
+            'from_node__updated_at',
+            'to_node__updated_at'
+        )
+    )
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    fields = select_fields(request, NodeLinkValuesSerializer.field_names())
+    drf_request = Request(request)
+    outgoing_paginator = KeysetPagination(cursor_query_param='outgoing_cursor')
+    incoming_paginator = KeysetPagination(cursor_query_param='incoming_cursor')
+    outgoing_page = await outgoing_paginator.apaginate_queryset(
+        NodeLinkValuesSerializer.values(NodeLink.objects.filter(from_node=node), fields), drf_request
+    )
+    incoming_page = await incoming_paginator.apaginate_queryset(
+        NodeLinkValuesSerializer.values(NodeLink.objects.filter(to_node=node), fields), drf_request
+    )
+    return validators.apply(_render({
+        'outgoing': NodeLinkValuesSerializer(outgoing_page, fields).data,
+        'incoming': NodeLinkValuesSerializer(incoming_page, fields).data,
+        'outgoing_next': outgoing_paginator.get_next_link(),
+        'incoming_next': incoming_paginator.get_next_link()
+    }))
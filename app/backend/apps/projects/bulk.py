@@ -0,0 +1,251 @@
+"""
+ノードとリンクの一括登録
+
+ブレインストームの取り込みなど、数千件のノードとリンクを1リクエストで登録する。
+入力はまとめて検証し、外部キーは種類ごとに1回の IN クエリで解決して、
+1トランザクション内で bulk_create する。リンクは (from_node, to_node) の
+一意制約で upsert し、既存のリンクは重みを更新する。
+
+リンクの両端には既存ノードのUUIDのほか、同じリクエスト内のノードに
+クライアントが付けた temp_id を指定できる。
+"""
+import uuid
+
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import serializers
+
+from apps.core.response_cache import tag
+
+from .models import Node, NodeLink, ProcessStep, Project, Round
+from .signals import bulk_written, responses_changed
+from .sync import record_changes
+
+MAX_BULK_NODES = 5000
+MAX_BULK_LINKS = 10000
+BULK_BATCH_SIZE = 1000
+
+
+class BulkNodeSerializer(serializers.Serializer):
+    """一括登録するノード1件"""
+
+    temp_id = serializers.CharField(max_length=100, required=False)
+    project_id = serializers.UUIDField(required=False, allow_null=True)
+    round_id = serializers.UUIDField(required=False, allow_null=True)
+    step_id = serializers.UUIDField(required=False, allow_null=True)
+    title = serializers.CharField(max_length=255)
+    context = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class BulkLinkSerializer(serializers.Serializer):
+    """一括登録するリンク1件（両端はノードのUUIDまたはtemp_id）"""
+
+    from_node_id = serializers.CharField(max_length=100)
+    to_node_id = serializers.CharField(max_length=100)
+    weight = serializers.DecimalField(
+        max_digits=3,
+        decimal_places=1,
+        min_value=0.1,
+        max_value=1.0,
+        default=0.5
+    )
+
+
+class BulkValidationError(Exception):
+    """一括登録の入力エラー（errors は 'nodes' / 'links' ごとの {インデックス: エラー}）"""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.errors = errors or {}
+
+
+def _item_errors(serializer):
+    return {i: errors for i, errors in enumerate(serializer.errors) if errors}
+
+
+def _as_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def bulk_create_nodes_and_links(user, nodes_data, links_data):
+    """
+    ノードとリンクを一括登録する
+
+    成功すると temp_id → 作成したノードID の対応と件数を返す。
+    入力に誤りがあれば何も書き込まずに BulkValidationError を送出する。
+    """
+    if len(nodes_data) > MAX_BULK_NODES or len(links_data) > MAX_BULK_LINKS:
+        raise BulkValidationError(
+            f'1回に登録できるのはノード{MAX_BULK_NODES}件、リンク{MAX_BULK_LINKS}件までです'
+        )
+
+    node_serializer = BulkNodeSerializer(data=nodes_data, many=True)
+    link_serializer = BulkLinkSerializer(data=links_data, many=True)
+    errors = {}
+    if not node_serializer.is_valid():
+        errors['nodes'] = _item_errors(node_serializer)
+    if not link_serializer.is_valid():
+        errors['links'] = _item_errors(link_serializer)
+    if errors:
+        raise BulkValidationError('入力内容に誤りがあります', errors)
+
+    nodes, temp_ids = _build_nodes(user, node_serializer.validated_data)
+    links, link_owners, link_project_ids = _build_links(user, link_serializer.validated_data, nodes, temp_ids)
+
+    with transaction.atomic():
+        Node.objects.bulk_create(nodes, batch_size=BULK_BATCH_SIZE)
+        NodeLink.objects.bulk_create(
+            links,
+            batch_size=BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['from_node', 'to_node'],
+            update_fields=['weight', 'updated_at']
+        )
+
+        # 既存の組み合わせは upsert で更新されるのでIDを読み直す
+        link_ids = {}
+        if links:
+            link_ids = {
+                (from_id, to_id): pk
+                for pk, from_id, to_id in NodeLink.objects.filter(
+                    from_node_id__in={link.from_node_id for link in links},
+                    to_node_id__in={link.to_node_id for link in links}
+                ).values_list('pk', 'from_node_id', 'to_node_id')
+                if (from_id, to_id) in link_owners
+            }
+        record_changes('node', [(node.pk, user.pk if node.project_id else None) for node in nodes])
+        record_changes('link', [(link_ids[pair], owner) for pair, owner in link_owners.items()])
+
+        # bulk_create はシグナルを送らないので、キャッシュ類へは直接反映する
+        project_ids = {node.project_id for node in nodes} | link_project_ids
+        for project_id in project_ids - {None}:
+            transaction.on_commit(lambda project_id=project_id: bulk_written(project_id))
+        # リンクの両端（既存ノードを含む）のリンク一覧とグローバルノードの一覧も無効にする
+        tags = {tag('user', user.pk)}
+        tags.update(tag('node', node_id) for link in links for node_id in (link.from_node_id, link.to_node_id))
+        if any(node.project_id is None for node in nodes):
+            tags.add(tag('project', None))
+        responses_changed(*tags)
+
+    return {
+        'nodes': {temp_id: str(nodes[i].pk) for temp_id, i in temp_ids.items()},
+        'node_count': len(nodes),
+        'link_count': len(links),
+    }
+
+
+def _build_nodes(user, items):
+    """所属先をまとめて解決してNodeインスタンスを組み立てる（最大3クエリ）"""
+    def ids(field):
+        return {item[field] for item in items if item.get(field)}
+
+    project_ids = ids('project_id')
+    round_ids = ids('round_id')
+    step_ids = ids('step_id')
+    projects = set(
+        Project.objects.filter(user=user, pk__in=project_ids).values_list('pk', flat=True)
+    ) if project_ids else set()
+    rounds = dict(
+        Round.objects.filter(project__user=user, pk__in=round_ids).values_list('pk', 'project_id')
+    ) if round_ids else {}
+    steps = {
+        pk: (round_id, project_id)
+        for pk, round_id, project_id in ProcessStep.objects.filter(
+            project__user=user, pk__in=step_ids
+        ).values_list('pk', 'round_id', 'project_id')
+    } if step_ids else {}
+
+    nodes, temp_ids, errors = [], {}, {}
+    for i, item in enumerate(items):
+        project_id = item.get('project_id')
+        round_id = item.get('round_id')
+        step_id = item.get('step_id')
+        item_errors = {}
+
+        # NodeSerializer.create と同様、指定の無い周・プロジェクトはステップや周から補完する
+        if project_id and project_id not in projects:
+            item_errors['project_id'] = 'Project not found'
+        if round_id:
+            if round_id not in rounds:
+                item_errors['round_id'] = 'Round not found'
+            else:
+                project_id = project_id or rounds[round_id]
+        if step_id:
+            if step_id not in steps:
+                item_errors['step_id'] = 'ProcessStep not found'
+            else:
+                round_id = round_id or steps[step_id][0]
+                project_id = project_id or steps[step_id][1]
+
+        temp_id = item.get('temp_id')
+        if temp_id is not None:
+            if temp_id in temp_ids:
+                item_errors['temp_id'] = 'temp_id が重複しています'
+            temp_ids[temp_id] = i
+
+        if item_errors:
+            errors[i] = item_errors
+            continue
+        nodes.append(Node(
+            project_id=project_id,
+            round_id=round_id,
+            step_id=step_id,
+            title=item['title'],
+            context=item.get('context')
+        ))
+
+    if errors:
+        raise BulkValidationError('入力内容に誤りがあります', {'nodes': errors})
+    return nodes, temp_ids
+
+
+def _build_links(user, items, nodes, temp_ids):
+    """両端を解決してNodeLinkインスタンスを組み立てる（既存ノードの確認に1クエリ）"""
+    existing_ids = {
+        pk for item in items for ref in (item['from_node_id'], item['to_node_id'])
+        if ref not in temp_ids and (pk := _as_uuid(ref)) is not None
+    }
+    existing = dict(
+        Node.objects.filter(
+            Q(project__user=user) | Q(project__isnull=True),
+            pk__in=existing_ids
+        ).values_list('pk', 'project_id')
+    ) if existing_ids else {}
+
+    def resolve(ref):
+        if ref in temp_ids:
+            node = nodes[temp_ids[ref]]
+            return node.pk, node.project_id
+        pk = _as_uuid(ref)
+        if pk in existing:
+            return pk, existing[pk]
+        return None, None
+
+    # 同じ組み合わせが複数あれば後のものを優先する（upsert は1文で同じ行を2度更新できない）
+    links, owners, project_ids, errors = {}, {}, set(), {}
+    for i, item in enumerate(items):
+        from_id, from_project_id = resolve(item['from_node_id'])
+        to_id, to_project_id = resolve(item['to_node_id'])
+        item_errors = {}
+        if from_id is None:
+            item_errors['from_node_id'] = 'from_node not found'
+        if to_id is None:
+            item_errors['to_node_id'] = 'to_node not found'
+        if from_id is not None and from_id == to_id:
+            item_errors['to_node_id'] = '同じノード同士はリンクできません'
+        if item_errors:
+            errors[i] = item_errors
+            continue
+        links[(from_id, to_id)] = NodeLink(from_node_id=from_id, to_node_id=to_id, weight=item['weight'])
+        # 両端ともグローバルノードのリンクは全ユーザーの同期対象
+        owners[(from_id, to_id)] = user.pk if from_project_id or to_project_id else None
+        if from_project_id == to_project_id:
+            project_ids.add(from_project_id)
+
+    if errors:
+        raise BulkValidationError('入力内容に誤りがあります', {'links': errors})
+    return list(links.values()), owners, project_ids
@@ -0,0 +1,354 @@
+"""
+ノードの重複検出（MinHash + LSH）
+
+タイトルと文脈の先頭（DEDUP_MAX_CHARS 文字）の文字 n-gram（DEDUP_SHINGLE_SIZE 文字）の
+集合から MinHash 署名（_NUM_PERM 個の32ビット値）を作って Node.minhash に保存し、
+署名を _BANDS 個のバンドに分けたハッシュを MinHashBucket に保存する（LSH）。
+検出では同じバケットに入ったノードだけを署名で比べるので、全ノードの組は比べない。
+
+署名はノードの保存で消え（signals.node_saving）、一括登録・インポートでは作られないので、
+検出の前に update_signatures() で署名の無いノードの分をまとめて計算する。
+重複は同じ所属（同じプロジェクト、またはグローバルノード同士）のノードの間で探す。
+"""
+import itertools
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from apps.core.response_cache import tag
+
+from .models import MinHashBucket, Node, NodeLink
+from .signals import bulk_written, link_owner, owner_tags, responses_changed
+from .similarity import ngram_counts, node_text
+from .sync import record_changes
+
+MAX_DUPLICATE_CLUSTERS = 500
+
+# 署名の長さとバンドの分け方（変えたら find_duplicates --rebuild で計算し直す）。
+# 推定 Jaccard 係数が (1 / _BANDS) ** (1 / _ROWS) ≒ 0.68 あたりから候補になる
+_NUM_PERM = 60
+_BANDS = 10
+_ROWS = _NUM_PERM // _BANDS
+# 一度に署名を計算するノード数
+_BATCH_SIZE = 1000
+# IN で一度に指定するID数
+_CHUNK_SIZE = 5000
+# バケットごとに比べる基準のノード数（大きなバケットでも比較をバケットの大きさに比例させる）
+_MAX_ANCHORS = 4
+
+_U64 = np.uint64
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(x):
+    """uint64 の配列のハッシュ（splitmix64 の仕上げ）"""
+    x = x ^ (x >> _U64(30))
+    x = x * _U64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> _U64(27))
+    x = x * _U64(0x94D049BB133111EB)
+    return x ^ (x >> _U64(31))
+
+
+_SEEDS = _mix(np.arange(1, _NUM_PERM + 1, dtype=np.uint64) * _U64(0x9E3779B97F4A7C15))
+
+
+def signatures(texts):
+    """テキストの列の MinHash 署名（(テキスト数, _NUM_PERM) の uint32）と、n-gram があるかどうか"""
+    docs, grams, _ = ngram_counts(texts, n=settings.DEDUP_SHINGLE_SIZE)
+    result = np.full((len(texts), _NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    present = np.zeros(len(texts), dtype=bool)
+    if len(docs):
+        starts = np.flatnonzero(np.concatenate(([True], docs[1:] != docs[:-1])))
+        owners = docs[starts]
+        present[owners] = True
+        grams = grams.astype(np.uint64)
+        for i, seed in enumerate(_SEEDS):
+            hashes = (_mix(grams ^ seed) >> _U64(32)).astype(np.uint32)
+            result[owners, i] = np.minimum.reduceat(hashes, starts)
+    return result, present
+
+
+def decode_signature(data):
+    return np.frombuffer(data, dtype='<u4')
+
+
+def _scope_hash(project_id):
+    if project_id is None:
+        return 0
+    return (project_id.int ^ (project_id.int >> 64)) & _MASK64
+
+
+def bucket_keys(rows, project_ids):
+    """署名（(n, _NUM_PERM)）と所属からバンドごとのバケット（(n, _BANDS) の int64）"""
+    scopes = np.fromiter(map(_scope_hash, project_ids), dtype=np.uint64, count=len(project_ids))
+    bands = rows.reshape(len(rows), _BANDS, _ROWS).astype(np.uint64)
+    keys = _mix(scopes[:, None] ^ _SEEDS[None, :_BANDS])
+    for j in range(_ROWS):
+        keys = _mix(keys ^ bands[:, :, j])
+    return keys.view(np.int64)
+
+
+def update_signatures(scope=Q()):
+    """
+    署名の無いノード（scope で絞る）の署名とバケットを計算して保存し、件数を返す
+
+    n-gram の無いノード（1文字のタイトルだけなど）は空の署名にして、比較の対象から外す。
+    """
+    count = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Node.objects.filter(scope, minhash__isnull=True)
+                .select_for_update(skip_locked=True, of=('self',))
+                .annotate(context_head=Substr('context', 1, settings.DEDUP_MAX_CHARS))
+                .order_by()
+                .values_list('id', 'project_id', 'title', 'context_head')[:_BATCH_SIZE]
+            )
+            if not rows:
+                return count
+
+            sigs, present = signatures([
+                node_text(title, context, settings.DEDUP_MAX_CHARS) for _, _, title, context in rows
+            ])
+            Node.objects.bulk_update(
+                [
+                    Node(pk=node_id, minhash=sigs[i].astype('<u4').tobytes() if present[i] else b'')
+                    for i, (node_id, *_) in enumerate(rows)
+                ],
+                ['minhash'],
+                batch_size=_BATCH_SIZE
+            )
+
+            # 以前の署名（保存前の内容・所属）のバケットは入れ直す
+            MinHashBucket.objects.filter(node_id__in=[row[0] for row in rows]).delete()
+            signed = np.flatnonzero(present)
+            keys = bucket_keys(sigs[signed], [rows[i][1] for i in signed])
+            MinHashBucket.objects.bulk_create(
+                [
+                    MinHashBucket(node_id=rows[i][0], project_id=rows[i][1], band=band, bucket=bucket)
+                    for i, node_keys in zip(signed.tolist(), keys.tolist())
+                    for band, bucket in enumerate(node_keys)
+                ],
+                batch_size=_BATCH_SIZE * _BANDS
+            )
+            count += len(rows)
+
+
+def _candidate_groups(scope):
+    """2件以上のノードが入ったバケットのノードIDの列（バケットごと）"""
+    shared = MinHashBucket.objects.filter(
+        band=OuterRef('band'), bucket=OuterRef('bucket')
+    ).exclude(pk=OuterRef('pk'))
+    rows = (
+        MinHashBucket.objects.filter(scope)
+        .filter(Exists(shared))
+        .order_by('band', 'bucket')
+        .values_list('band', 'bucket', 'node_id')
+        .iterator(chunk_size=_CHUNK_SIZE)
+    )
+    for _, members in itertools.groupby(rows, key=lambda row: row[:2]):
+        yield [row[2] for row in members]
+
+
+def find_duplicates(scope=Q(), threshold=None):
+    """
+    scope のノードの重複のクラスタを大きい順に返す
+
+    同じバケットに入ったノードを署名で比べ、推定 Jaccard 係数が threshold
+    （既定は DEDUP_THRESHOLD）以上のものをつなぐ。つながったノードのうち最も古いものを
+    残す側とし、それとの類似度が threshold 以上のノードを重複とする。
+    クラスタは {'project_id', 'nodes': [(ID, タイトル, 類似度), ...]}（先頭が残す側）。
+    """
+    threshold = threshold or settings.DEDUP_THRESHOLD
+    update_signatures(scope)
+    groups = list(_candidate_groups(scope))
+    candidates = list({node_id for members in groups for node_id in members})
+
+    nodes = []
+    for start in range(0, len(candidates), _CHUNK_SIZE):
+        nodes += Node.objects.filter(
+            pk__in=candidates[start:start + _CHUNK_SIZE]
+        ).exclude(minhash=b'').values_list('id', 'project_id', 'title', 'created_at', 'minhash')
+    # 署名の計算後に保存されたノードは除く
+    nodes = [node for node in nodes if node[4] is not None]
+    nodes.sort(key=lambda node: (node[3], str(node[0])))
+    index = {node[0]: i for i, node in enumerate(nodes)}
+    sigs = np.array([decode_signature(node[4]) for node in nodes]).reshape(len(nodes), _NUM_PERM)
+    scope_codes = {}
+    scopes = np.array([scope_codes.setdefault(node[1], len(scope_codes)) for node in nodes], dtype=np.int64)
+
+    parent = list(range(len(nodes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for members in groups:
+        remaining = np.array([index[node_id] for node_id in members if node_id in index], dtype=np.int64)
+        for _ in range(_MAX_ANCHORS):
+            if len(remaining) < 2:
+                break
+            anchor = remaining[0]
+            similar = (sigs[remaining] == sigs[anchor]).mean(axis=1) >= threshold
+            similar &= scopes[remaining] == scopes[anchor]
+            similar[0] = True
+            root = find(anchor)
+            for i in remaining[similar][1:].tolist():
+                parent[find(i)] = root
+            remaining = remaining[~similar]
+
+    components = {}
+    for i in range(len(nodes)):
+        components.setdefault(find(i), []).append(i)
+
+    clusters = []
+    for members in components.values():
+        if len(members) < 2:
+            continue
+        # nodes は作成日時の順なので先頭が最も古い
+        keep, others = members[0], np.array(members[1:])
+        similarity = (sigs[others] == sigs[keep]).mean(axis=1)
+        duplicates = [
+            (nodes[i][0], nodes[i][2], float(score))
+            for i, score in zip(others.tolist(), similarity.tolist())
+            if score >= threshold
+        ]
+        if duplicates:
+            clusters.append({
+                'project_id': nodes[keep][1],
+                'nodes': [(nodes[keep][0], nodes[keep][2], 1.0), *duplicates],
+            })
+    clusters.sort(key=lambda cluster: -len(cluster['nodes']))
+    return clusters
+
+
+class InvalidClusters(ValueError):
+    pass
+
+
+def check_clusters(clusters, scope=Q(), threshold=None):
+    """
+    指定されたクラスタ（ノードIDの列。先頭が残す側）を現在の署名で確かめ、merge_duplicates に渡す形にする
+
+    scope に無いノードや所属の違うノードを含むと InvalidClusters。取得後に編集されて
+    残す側との推定 Jaccard 係数が threshold 未満になったノードは除き、(クラスタの列, 除いたノードIDの列) を返す。
+    """
+    threshold = threshold or settings.DEDUP_THRESHOLD
+    ids = [node_id for cluster in clusters for node_id in cluster]
+    if any(len(cluster) < 2 for cluster in clusters) or len(set(ids)) != len(ids):
+        raise InvalidClusters('クラスタは2件以上の重複しないノードIDで指定してください')
+
+    update_signatures(scope & Q(pk__in=ids))
+    nodes = {}
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        nodes.update(
+            (row[0], row)
+            for row in Node.objects.filter(scope, pk__in=ids[start:start + _CHUNK_SIZE])
+            .values_list('id', 'project_id', 'title', 'minhash')
+        )
+    if len(nodes) < len(ids):
+        raise InvalidClusters('ノードが見つかりません')
+
+    checked, skipped = [], []
+    for cluster in clusters:
+        keep_id, keep_project_id, keep_title, keep_minhash = nodes[cluster[0]]
+        if any(nodes[node_id][1] != keep_project_id for node_id in cluster):
+            raise InvalidClusters('クラスタは同じプロジェクトのノード（またはグローバルノード同士）で指定してください')
+        duplicates = []
+        for node_id in cluster[1:]:
+            minhash = nodes[node_id][3]
+            # 空の署名（n-gram が無い）と、署名の計算後に保存されて署名の無いノードはまとめない
+            score = 0.0
+            if minhash and keep_minhash:
+                score = float((decode_signature(minhash) == decode_signature(keep_minhash)).mean())
+            if score >= threshold:
+                duplicates.append((node_id, nodes[node_id][2], score))
+            else:
+                skipped.append(node_id)
+        if duplicates:
+            checked.append({'project_id': keep_project_id, 'nodes': [(keep_id, keep_title, 1.0), *duplicates]})
+    return checked, skipped
+
+
+def merge_duplicates(clusters):
+    """
+    クラスタごとに重複ノードを残す側のノードへまとめる
+
+    重複ノードのリンクは残す側へ付け替え（同じ組になるリンクは重みの大きい方を残す）、
+    重複ノードは削除する。付け替えは bulk_update なので、キャッシュ類と変更履歴へは直接反映する。
+    """
+    replace = {
+        node_id: cluster['nodes'][0][0]
+        for cluster in clusters
+        for node_id, *_ in cluster['nodes'][1:]
+    }
+    if not replace:
+        return {'cluster_count': 0, 'merged_node_count': 0, 'link_count': 0}
+
+    with transaction.atomic():
+        ids = list(replace) + list(set(replace.values()))
+        links = {}
+        for start in range(0, len(ids), _CHUNK_SIZE):
+            chunk = ids[start:start + _CHUNK_SIZE]
+            links.update(
+                (link.pk, link)
+                for link in NodeLink.objects.filter(
+                    Q(from_node_id__in=chunk) | Q(to_node_id__in=chunk)
+                ).annotate(
+                    from_project_id=F('from_node__project_id'),
+                    to_project_id=F('to_node__project_id')
+                )
+            )
+
+        # 重複ノードを含まないリンク（組 → リンク）と、付け替えるリンク（組 → リンクの列）
+        existing = {}
+        moved = {}
+        for link in links.values():
+            pair = (replace.get(link.from_node_id, link.from_node_id), replace.get(link.to_node_id, link.to_node_id))
+            if pair == (link.from_node_id, link.to_node_id):
+                existing[pair] = link
+            elif pair[0] != pair[1]:
+                moved.setdefault(pair, []).append(link)
+
+        # 付け替えない残りのリンクは重複ノードと一緒に削除される
+        now = timezone.now()
+        updated = []
+        for pair, group in moved.items():
+            weight = max(link.weight for link in group)
+            link = existing.get(pair)
+            if link is None:
+                link = group[0]
+                link.from_node_id, link.to_node_id = pair
+            elif link.weight >= weight:
+                continue
+            link.weight = max(link.weight, weight)
+            link.updated_at = now
+            updated.append(link)
+        NodeLink.objects.bulk_update(updated, ['from_node', 'to_node', 'weight', 'updated_at'], batch_size=_BATCH_SIZE)
+
+        owners = {link.pk: link_owner(link.from_project_id, link.to_project_id) for link in updated}
+        record_changes('link', owners.items())
+        project_ids = {link.from_project_id for link in updated} | {link.to_project_id for link in updated}
+        for project_id in project_ids - {None}:
+            transaction.on_commit(lambda project_id=project_id: bulk_written(project_id))
+        tags = {tag('node', node_id) for link in updated for node_id in (link.from_node_id, link.to_node_id)}
+        tags.update(owner_tag for owner in set(owners.values()) for owner_tag in owner_tags(owner))
+        if None in project_ids:
+            tags.add(tag('project', None))
+        responses_changed(*tags)
+
+        dropped = list(replace)
+        for start in range(0, len(dropped), _CHUNK_SIZE):
+            Node.objects.filter(pk__in=dropped[start:start + _CHUNK_SIZE]).delete()
+
+    return {
+        'cluster_count': len(set(replace.values())),
+        'merged_node_count': len(replace),
+        'link_count': len(updated),
+    }
@@ -0,0 +1,390 @@
+"""
+プロジェクトのグラフ（ノード＋リンク）をまとめて返すためのヘルパー
+"""
+import json
+import uuid
+
+import numpy as np
+from django.db import connection
+
+from .analytics import communities, degrees
+from .models import Node, NodeLink
+
+# サーバーサイドカーソルで一度に取得する行数
+GRAPH_CHUNK_SIZE = 2000
+
+NODE_GRAPH_FIELDS = ('id', 'title', 'context', 'round_id', 'step_id')
+# グラフで既定で返さないフィールド（描画に使わない長いテキスト）
+DEFAULT_NODE_GRAPH_OMIT = ('context',)
+# サーバーで計算した描画用の座標（apps.projects.layout）
+NODE_LAYOUT_FIELDS = ('x', 'y')
+EDGE_GRAPH_FIELDS = ('id', 'from_node_id', 'to_node_id', 'weight')
+
+# 近傍探索の上限
+MAX_NEIGHBORHOOD_DEPTH = 6
+MAX_NEIGHBORHOOD_NODES = 500
+
+NEIGHBORHOOD_DIRECTIONS = ('out', 'in', 'both')
+
+# 要約グラフ（?level= / ?cluster=）で返す要素数とリンク数の上限
+MAX_CLUSTER_ITEMS = 500
+MAX_CLUSTER_EDGES = 2000
+
+
+def project_nodes(project):
+    """プロジェクトに属するノードのクエリセット"""
+    return Node.objects.filter(project=project).order_by('created_at', 'id')
+
+
+def project_edges(project):
+    """両端がプロジェクト内のノードであるリンクのクエリセット"""
+    return NodeLink.objects.filter(
+        from_node__project=project,
+        to_node__project=project,
+    ).order_by('created_at', 'id')
+
+
+def _optional_str(value):
+    return str(value) if value else None
+
+
+# ノードのフィールドごとの変換
+_NODE_GRAPH_CONVERTERS = {
+    'id': str,
+    'title': None,
+    'context': None,
+    'round_id': _optional_str,
+    'step_id': _optional_str,
+}
+
+
+def _node_columns(fields):
+    """fields を返すのに取得する列（先頭は必ず id）"""
+    return ('id',) + tuple(name for name in fields if name != 'id')
+
+
+def _node_row_builder(fields):
+    """_node_columns(fields) の行を fields の dict にする関数"""
+    columns = _node_columns(fields)
+    converters = [(name, columns.index(name), _NODE_GRAPH_CONVERTERS[name]) for name in fields]
+
+    def node_row(row):
+        return {
+            name: row[i] if convert is None else convert(row[i])
+            for name, i, convert in converters
+        }
+    return node_row
+
+
+def _edge_row(row):
+    link_id, from_node_id, to_node_id, weight = row
+    return {
+        'id': str(link_id),
+        'from_node_id': str(from_node_id),
+        'to_node_id': str(to_node_id),
+        # NodeLinkSerializerと同じく文字列で返す
+        'weight': str(weight),
+    }
+
+
+def _iter_json_array(queryset, fields, to_dict, chunk_size):
+    """values_listの結果をJSON配列の断片としてチャンクごとに返す"""
+    buffer = []
+    first = True
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        item = json.dumps(to_dict(row), ensure_ascii=False, separators=(',', ':'))
+        buffer.append(item if first else ',' + item)
+        first = False
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def iter_project_graph(project, ranks=None, fields=None, coordinates=None, chunk_size=GRAPH_CHUNK_SIZE):
+    """
+    プロジェクトのグラフをJSONとして逐次生成する
+
+    ノードとリンクをそれぞれ1クエリで取得し、行をモデルインスタンスに
+    変換せずにそのまま書き出すため、ノード数に関わらずメモリ使用量は一定。
+    ranks（ノードID → PageRank）を渡すと各ノードに rank を付ける。
+    fields（NODE_GRAPH_FIELDS と NODE_LAYOUT_FIELDS の一部）を渡すとノードはその列だけを取得して返す。
+    x, y は coordinates（ノードID → (x, y)）を渡した場合だけ付ける。
+    """
+    fields = tuple(fields) if fields is not None else NODE_GRAPH_FIELDS + NODE_LAYOUT_FIELDS
+    columns = tuple(name for name in fields if name in NODE_GRAPH_FIELDS)
+    node_row = _node_row_builder(columns)
+    axes = []
+    if coordinates is not None:
+        axes = [(name, NODE_LAYOUT_FIELDS.index(name)) for name in fields if name in NODE_LAYOUT_FIELDS]
+    if axes or ranks is not None:
+        build = node_row
+
+        def node_row(row):
+            item = build(row)
+            if axes:
+                # 座標の計算後に追加されたノードと、リンクが変わって座標がまだ計算し直されていないノードは null
+                xy = coordinates.get(row[0])
+                for name, axis in axes:
+                    item[name] = None if xy is None else xy[axis]
+            if ranks is not None:
+                item['rank'] = ranks.get(row[0], 0.0)
+            return item
+    
+    yield ('{"project_id":%s,"nodes":[' % json.dumps(str(project.pk))).encode('utf-8')
+    yield from _iter_json_array(project_nodes(project), _node_columns(columns), node_row, chunk_size)
+    yield b'],"edges":['
+    yield from _iter_json_array(project_edges(project), EDGE_GRAPH_FIELDS, _edge_row, chunk_size)
+    yield b']}'
+
+
+# 探索方向ごとの辺の向き（src → dst にたどる。_NEIGHBORHOOD_SQL_FALLBACK 用）
+_NEIGHBORHOOD_EDGES = {
+    'out': 'SELECT from_node_id AS src, to_node_id AS dst, weight FROM node_links',
+    'in': 'SELECT to_node_id AS src, from_node_id AS dst, weight FROM node_links',
+    'both': (
+        'SELECT from_node_id AS src, to_node_id AS dst, weight FROM node_links '
+        'UNION ALL '
+        'SELECT to_node_id AS src, from_node_id AS dst, weight FROM node_links'
+    ),
+}
+
+# 探索方向ごとの、ノード f.node_id から1本の辺でたどれるノード（PostgreSQL 向け）
+_NEIGHBORHOOD_STEPS = {
+    'out': 'SELECT to_node_id AS dst, weight FROM node_links WHERE from_node_id = f.node_id',
+    'in': 'SELECT from_node_id AS dst, weight FROM node_links WHERE to_node_id = f.node_id',
+    'both': (
+        'SELECT to_node_id AS dst, weight FROM node_links WHERE from_node_id = f.node_id '
+        'UNION ALL '
+        'SELECT from_node_id AS dst, weight FROM node_links WHERE to_node_id = f.node_id'
+    ),
+}
+
+# 1段ずつ広げる再帰CTE。各段の行は (その段で初めて届いたノードの配列, ここまでに届いたノードの配列, 深さ)
+# で、届いたノードは二度と広げない。届いたノードが上限（limit）に達したら次の段へ進まないので、
+# 密なグラフでも探索する辺は上限までのノードから出る辺だけになる。
+_NEIGHBORHOOD_SQL = """
+WITH RECURSIVE walk(frontier, visited, hops) AS (
+    SELECT ARRAY[%(root)s::uuid], ARRAY[%(root)s::uuid], 0
+    UNION ALL
+    SELECT step.frontier, w.visited || step.frontier, w.hops + 1
+    FROM walk w
+    CROSS JOIN LATERAL (
+        SELECT (array_agg(d.dst ORDER BY d.dst))[1:%(limit)s - cardinality(w.visited)] AS frontier
+        FROM (
+            SELECT DISTINCT e.dst
+            FROM unnest(w.frontier) AS f(node_id)
+            CROSS JOIN LATERAL ({steps}) e
+            JOIN nodes n ON n.id = e.dst
+            LEFT JOIN projects p ON p.id = n.project_id
+            WHERE NOT e.dst = ANY(w.visited)
+              AND e.weight >= %(min_weight)s
+              AND (n.project_id IS NULL OR p.user_id = %(user_id)s)
+            ORDER BY e.dst
+            LIMIT %(limit)s
+        ) d
+    ) step
+    WHERE w.hops < %(depth)s
+      AND cardinality(w.visited) < %(limit)s
+      AND step.frontier IS NOT NULL
+)
+SELECT n.id, n.title, n.project_id, w.hops
+FROM walk w
+CROSS JOIN LATERAL unnest(w.frontier) AS h(node_id)
+JOIN nodes n ON n.id = h.node_id
+ORDER BY w.hops, n.id
+"""
+
+# 配列の無いデータベース（開発用の SQLite）向け。UNIONで (ノード, 深さ) を重複排除するため、
+# 循環があっても行数は「可視ノード数 × (depth + 1)」で頭打ちになるが、探索は上限で止まらない
+_NEIGHBORHOOD_SQL_FALLBACK = """
+WITH RECURSIVE walk(node_id, hops) AS (
+    SELECT %(root)s, 0
+    UNION
+    SELECT e.dst, w.hops + 1
+    FROM walk w
+    JOIN ({edges}) e ON e.src = w.node_id
+    JOIN nodes n ON n.id = e.dst
+    LEFT JOIN projects p ON p.id = n.project_id
+    WHERE w.hops < %(depth)s
+      AND e.weight >= %(min_weight)s
+      AND (n.project_id IS NULL OR p.user_id = %(user_id)s)
+)
+SELECT n.id, n.title, n.project_id, h.hops
+FROM (SELECT node_id, MIN(hops) AS hops FROM walk GROUP BY node_id) h
+JOIN nodes n ON n.id = h.node_id
+ORDER BY h.hops, n.id
+LIMIT %(limit)s
+"""
+
+
+def _uuid_str(value):
+    if value is None:
+        return None
+    return str(value if isinstance(value, uuid.UUID) else uuid.UUID(value))
+
+
+def node_neighborhood(node, user, depth=1, direction='out', min_weight=0, limit=MAX_NEIGHBORHOOD_NODES):
+    """
+    ノードから depth ホップ以内のサブグラフを返す
+
+    探索は1本の再帰CTEで行い、idx_node_links_from_node / idx_node_links_to_node
+    を使って辺をたどる。ユーザーから見えないノード（他ユーザーのプロジェクト）は
+    たどらない。届いたノードが limit を超えたらそれ以上広げず、ホップ数の小さい順
+    （同じホップ数ではID順）に切り詰める。
+    """
+    pk_field = Node._meta.pk
+    params = {
+        'root': pk_field.get_db_prep_value(node.pk, connection),
+        'depth': depth,
+        'min_weight': min_weight,
+        'user_id': user.pk,
+        'limit': limit + 1,
+    }
+    if connection.vendor == 'postgresql':
+        sql = _NEIGHBORHOOD_SQL.format(steps=_NEIGHBORHOOD_STEPS[direction])
+    else:
+        sql = _NEIGHBORHOOD_SQL_FALLBACK.format(edges=_NEIGHBORHOOD_EDGES[direction])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    
+    truncated = len(rows) > limit
+    nodes = [
+        {
+            'id': _uuid_str(node_id),
+            'title': title,
+            'project_id': _uuid_str(project_id),
+            'hops': hops,
+        }
+        for node_id, title, project_id, hops in rows[:limit]
+    ]
+    
+    node_ids = [item['id'] for item in nodes]
+    edges = NodeLink.objects.filter(
+        from_node_id__in=node_ids,
+        to_node_id__in=node_ids,
+        weight__gte=min_weight,
+    ).order_by('created_at', 'id').values_list(*EDGE_GRAPH_FIELDS)
+    
+    return {
+        'root_id': str(node.pk),
+        'depth': depth,
+        'direction': direction,
+        'nodes': nodes,
+        'edges': [_edge_row(row) for row in edges],
+        'truncated': truncated,
+    }
+
+
+def cluster_id(level, index):
+    return f'{level}:{index}'
+
+
+def parse_cluster_id(value):
+    """'レベル:番号' を (レベル, 番号) にする（形式が違えば ValueError）"""
+    level, _, index = value.partition(':')
+    level, index = int(level), int(index)
+    if level < 0 or index < 0:
+        raise ValueError(value)
+    return level, index
+
+
+def cluster_graph(project, graph, level=0, cluster=None, limit=MAX_CLUSTER_ITEMS):
+    """
+    コミュニティの階層（apps.projects.analytics.communities）の1レベル分の要約グラフ
+
+    レベル0が最も粗く、レベルが上がるほど細かくなり、最後のレベル（levels）は
+    個々のノード。cluster（(レベル, 番号)）を指定すると、そのクラスタに含まれる
+    1つ下のレベルの要素だけを返す。各要素はクラスタ内で重み付き次数が最大の
+    ノードを代表として title を付ける。リンクはクラスタ間の向きごとに重みを合計する。
+    要素は大きい順に limit 件、リンクは重みの大きい順に MAX_CLUSTER_EDGES 件までに
+    切り詰めるので、プロジェクトの大きさに関わらずレスポンスは一定の大きさに収まる。
+    クラスタの番号はリンクが変わるまで有効。
+
+    level / cluster が階層に無い場合は ValueError。
+    """
+    n = graph.n_nodes
+    # 粗い順のレベルごとのノード → クラスタ番号（最後は個々のノード）
+    memberships = list(reversed(communities(graph))) + [np.arange(n)]
+    levels = len(memberships) - 1
+    counts = [int(member.max()) + 1 if n else 0 for member in memberships]
+
+    if cluster is not None:
+        parent_level, parent_index = cluster
+        if parent_level >= levels or parent_index >= counts[parent_level]:
+            raise ValueError(f'クラスタ {cluster_id(*cluster)} はありません')
+        level = parent_level + 1
+        selected = np.zeros(counts[level], dtype=bool)
+        selected[memberships[level][memberships[parent_level] == parent_index]] = True
+    elif level > levels:
+        raise ValueError(f'levelは0〜{levels}を指定してください')
+    else:
+        selected = np.ones(counts[level], dtype=bool)
+
+    member = memberships[level]
+    count = counts[level]
+    sizes = np.bincount(member, minlength=count)
+    items = np.flatnonzero(selected)
+    items = items[np.argsort(-sizes[items], kind='stable')]
+    truncated = len(items) > limit
+    items = items[:limit]
+    selected = np.zeros(count, dtype=bool)
+    selected[items] = True
+
+    # 代表ノード（重み付き次数が最大。同じならノードの並び順）
+    _, _, weighted_in, weighted_out = degrees(graph)
+    order = np.lexsort((-(weighted_in + weighted_out), member))
+    firsts = np.searchsorted(member[order], np.arange(count))
+    representatives = order[firsts]
+
+    # 1つ下のレベルの要素数
+    if level < levels:
+        pairs = np.unique(member * counts[level + 1] + memberships[level + 1])
+        child_counts = np.bincount(pairs // counts[level + 1], minlength=count)
+    else:
+        child_counts = np.zeros(count, dtype=np.int64)
+
+    node_ids = [graph.node_ids[i] for i in representatives[items]]
+    titles = dict(Node.objects.filter(id__in=node_ids).values_list('id', 'title'))
+    clusters = []
+    for index, node_id in zip(items.tolist(), node_ids):
+        representative = representatives[index]
+        clusters.append({
+            'id': cluster_id(level, index),
+            'size': int(sizes[index]),
+            'child_count': int(child_counts[index]),
+            'parent': cluster_id(level - 1, int(memberships[level - 1][representative])) if level else None,
+            'node_id': str(node_id),
+            'title': titles.get(node_id),
+        })
+
+    # クラスタ間のリンク（クラスタ内のリンクは含めない）
+    src = member[graph.sources()]
+    dst = member[graph.indices]
+    keep = selected[src] & selected[dst] & (src != dst)
+    keys, inverse = np.unique(src[keep].astype(np.int64) * count + dst[keep], return_inverse=True)
+    weights = np.bincount(inverse, weights=graph.weights[keep].astype(np.float64), minlength=len(keys))
+    links = np.bincount(inverse, minlength=len(keys))
+    ranked = np.argsort(-weights, kind='stable')
+    truncated = truncated or len(ranked) > MAX_CLUSTER_EDGES
+    edges = [
+        {
+            'from': cluster_id(level, int(keys[i] // count)),
+            'to': cluster_id(level, int(keys[i] % count)),
+            'weight': round(float(weights[i]), 1),
+            'count': int(links[i]),
+        }
+        for i in ranked[:MAX_CLUSTER_EDGES]
+    ]
+
+    return {
+        'project_id': str(project.pk),
+        'level': level,
+        'levels': levels,
+        'cluster': cluster_id(*cluster) if cluster is not None else None,
+        'clusters': clusters,
+        'edges': edges,
+        'truncated': truncated,
+    }
@@ -0,0 +1,266 @@
+"""
+プロジェクトのリンクグラフをCSR形式でメモリ上に保持するエンジン
+
+NodeLink の行を NumPy の CSR 配列（indptr / indices / weights）に詰め、
+探索や分析のたびにORMを経由しないようにする。グラフはプロジェクト単位で
+LRUキャッシュし、メモリ予算を超えたら古いものから破棄する。
+更新は signals から invalidate / patch で反映する。
+
+複数ワーカー間の整合性は CACHES['default']（プロセス間で共有する file / db キャッシュ）上の
+バージョン番号で取る（apps.projects.versions）。取得時にバージョンが変わっていれば再構築する。
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from . import versions
+from .models import Node, NodeLink
+
+GRAPH_VERSION_NAMESPACE = 'graph'
+
+# ノードID（UUID）とインデックス辞書の1ノードあたりの概算バイト数
+_NODE_OVERHEAD_BYTES = 200
+
+
+class ProjectGraph:
+    """1プロジェクト分のCSRグラフ"""
+
+    def __init__(self, project_id, node_ids, indptr, indices, weights, version=0):
+        self.project_id = project_id
+        self.node_ids = list(node_ids)
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.version = version
+        self._memo = {}
+        self._memo_params = {}
+
+    @classmethod
+    def build(cls, project_id, version=0):
+        """DBからプロジェクトのノードとリンクを読み込んで構築（2クエリ）"""
+        node_ids = list(
+            Node.objects.filter(project_id=project_id)
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+        )
+        rows = list(
+            NodeLink.objects.filter(
+                from_node__project_id=project_id,
+                to_node__project_id=project_id,
+            ).values_list('from_node_id', 'to_node_id', 'weight')
+        )
+        return cls.from_edges(project_id, node_ids, rows, version=version)
+
+    @classmethod
+    def from_edges(cls, project_id, node_ids, rows, version=0):
+        """(from_node_id, to_node_id, weight) の列からCSRを組み立てる"""
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        n_nodes = len(node_ids)
+        n_edges = len(rows)
+
+        if n_edges:
+            from_ids, to_ids, raw_weights = zip(*rows)
+            src = np.fromiter(map(index.__getitem__, from_ids), dtype=np.int32, count=n_edges)
+            dst = np.fromiter(map(index.__getitem__, to_ids), dtype=np.int32, count=n_edges)
+            weights = np.fromiter(map(float, raw_weights), dtype=np.float32, count=n_edges)
+        else:
+            src = np.empty(0, dtype=np.int32)
+            dst = np.empty(0, dtype=np.int32)
+            weights = np.empty(0, dtype=np.float32)
+
+        # 行（src）ごと、行内は列（dst）昇順に並べる
+        order = np.lexsort((dst, src))
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n_nodes), out=indptr[1:])
+        return cls(project_id, node_ids, indptr, dst[order], weights[order], version=version)
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self):
+        return int(self.indices.shape[0])
+
+    @property
+    def nbytes(self):
+        """保持している配列とメモ化結果の概算メモリ量"""
+        total = self.indptr.nbytes + self.indices.nbytes + self.weights.nbytes
+        total += self.n_nodes * _NODE_OVERHEAD_BYTES
+        for value in self._memo.values():
+            if isinstance(value, tuple):
+                total += sum(getattr(item, 'nbytes', 0) for item in value)
+            else:
+                total += getattr(value, 'nbytes', 0)
+        return total
+
+    def out_degree(self):
+        return np.diff(self.indptr)
+
+    def in_degree(self):
+        return np.bincount(self.indices, minlength=self.n_nodes)
+
+    def neighbors(self, i):
+        """ノードiの出リンク先インデックスと重み"""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+    def sources(self):
+        """各辺の始点インデックス（indicesと同じ並び）"""
+        return np.repeat(np.arange(self.n_nodes, dtype=np.int32), self.out_degree())
+
+    def transpose(self):
+        """入リンク側のCSR（indptr, indices, weights）"""
+        return self.memo('transpose', self._build_transpose)
+
+    def _build_transpose(self):
+        src = self.sources()
+        order = np.argsort(self.indices, kind='stable')
+        indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(self.in_degree(), out=indptr[1:])
+        return indptr, src[order], self.weights[order]
+
+    def copy(self):
+        """変更を適用するための複製（重みの配列とノードIDの列は別に持つ。分析結果は引き継がない）"""
+        return ProjectGraph(
+            self.project_id, self.node_ids, self.indptr, self.indices, self.weights.copy(), version=self.version
+        )
+
+    def memo(self, key, builder, params=None):
+        """
+        グラフが変わるまで分析結果を保持する
+
+        params を渡した場合は直近のパラメータの結果だけを保持し、
+        異なるパラメータで呼ばれたら作り直す。
+        """
+        if key not in self._memo or self._memo_params.get(key) != params:
+            self._memo[key] = builder()
+            self._memo_params[key] = params
+        return self._memo[key]
+
+    def _edge_position(self, from_id, to_id):
+        i = self.index.get(from_id)
+        j = self.index.get(to_id)
+        if i is None or j is None:
+            return None
+        start, end = self.indptr[i], self.indptr[i + 1]
+        pos = start + np.searchsorted(self.indices[start:end], j)
+        if pos < end and self.indices[pos] == j:
+            return pos
+        return None
+
+    def set_weight(self, from_id, to_id, weight):
+        """既存の辺の重みを更新。辺が無ければFalse"""
+        pos = self._edge_position(from_id, to_id)
+        if pos is None:
+            return False
+        self.weights[pos] = float(weight)
+        self._memo.clear()
+        return True
+
+    def add_node(self, node_id):
+        """リンクを持たないノードを末尾に追加"""
+        if node_id in self.index:
+            return
+        self.index[node_id] = len(self.node_ids)
+        self.node_ids.append(node_id)
+        self.indptr = np.append(self.indptr, self.indptr[-1])
+        self._memo.clear()
+
+
+class GraphCache:
+    """プロジェクトごとのCSRグラフのLRUキャッシュ"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._graphs = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.patches = 0
+
+    def get(self, project_id):
+        """グラフを取得（無い、または他ワーカーで更新済みなら再構築）"""
+        version = versions.get_version(GRAPH_VERSION_NAMESPACE, project_id)
+        with self._lock:
+            graph = self._graphs.get(project_id)
+            if graph is not None and graph.version == version:
+                self._graphs.move_to_end(project_id)
+                self.hits += 1
+                return graph
+            self.misses += 1
+
+        graph = ProjectGraph.build(project_id, version=version)
+        with self._lock:
+            self._graphs[project_id] = graph
+            self._graphs.move_to_end(project_id)
+            self._evict()
+        return graph
+
+    def peek(self, project_id):
+        """キャッシュ済みのグラフを返す（構築はしない）"""
+        with self._lock:
+            return self._graphs.get(project_id)
+
+    def invalidate(self, project_id):
+        with self._lock:
+            self._graphs.pop(project_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._graphs.clear()
+
+    def patch(self, project_id, previous_version, new_version, apply):
+        """
+        キャッシュ済みグラフに変更を適用する
+
+        他のスレッドが読み取り中のグラフは書き換えず、複製に適用して差し替える。
+        apply(graph) が False を返した場合や、他ワーカーの更新を
+        取りこぼしている（グラフが previous_version でない）場合は破棄して次回取得時に再構築させる。
+        """
+        with self._lock:
+            graph = self._graphs.get(project_id)
+            if graph is None:
+                return
+            patched = graph.copy() if graph.version == previous_version else None
+            if patched is not None and apply(patched) is not False:
+                patched.version = new_version
+                self._graphs[project_id] = patched
+                self.patches += 1
+                self._evict()
+            else:
+                self._graphs.pop(project_id, None)
+
+    def _evict(self):
+        total = sum(graph.nbytes for graph in self._graphs.values())
+        # 最後に使ったグラフは予算を超えていても残す
+        while total > self.max_bytes and len(self._graphs) > 1:
+            _, graph = self._graphs.popitem(last=False)
+            total -= graph.nbytes
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'patches': self.patches,
+                'entries': len(self._graphs),
+                'bytes': sum(graph.nbytes for graph in self._graphs.values()),
+                'max_bytes': self.max_bytes,
+            }
+
+
+graph_cache = GraphCache(getattr(settings, 'GRAPH_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+
+def get_project_graph(project_id):
+    """プロジェクトのCSRグラフを取得"""
+    return graph_cache.get(project_id)
@@ -0,0 +1,377 @@
+"""
+WordTree 用のグラフレイアウト（ノードの2次元座標）
+
+Fruchterman-Reingold 法の力学モデルを NumPy でベクトル化して計算する。
+斥力は固定の深さの4分木（レベル l で 2^l × 2^l の格子）で近似する。各ノードは
+同じ・隣のセルのノードとは厳密に、それより遠いノードとはレベルごとに
+「親の隣のセルの子のうち自分の隣でないセル」（高々27個）の重心とだけ
+相互作用するので、1反復の計算量は O(n log n)。引力はリンクごとに計算する。
+
+座標はプロジェクトごとに ProjectLayout に保存する。リンクグラフが変わったら
+保存済みの座標から始め、隣接（リンク先・リンク元と重み）が変わったノードと
+その近傍だけを動かす（他のノードは固定）。
+
+計算するのは書き込み側（リンクグラフの変更のコミット後の signals.graph_changed と、
+compute_layouts コマンド）だけで、GET は保存済みの座標を読むだけにする。
+保存したら CACHES['default'] 上のレイアウトのバージョンを進め、他のワーカーにも読み直させる。
+"""
+import hashlib
+import math
+import uuid
+from functools import cached_property
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from . import versions
+from .graph_engine import get_project_graph
+from .models import ProjectLayout
+
+LAYOUT_VERSION_NAMESPACE = 'layout'
+
+# 保存形式の1ノードあたりのバイト数（ID 16・座標 float32 × 2・署名 uint64）
+_RECORD_BYTES = 16 + 8 + 8
+# 隣接の署名で入リンクを出リンクと区別するための係数（奇数）
+_IN_EDGE_FACTOR = np.uint64(0x9E3779B97F4A7C15)
+_KEY_MASK = (1 << 64) - 1
+# 4分木の最も細かいレベル（2^10 × 2^10 セル）
+_MAX_LEVEL = 10
+# 格子の外側に置く空のセルの幅（範囲外の判定を省く）
+_PAD = 3
+
+
+def _far_offsets():
+    """
+    遠いセルの相対位置（セルの位置の偶奇4通り × 27）
+
+    親の隣のセルの子（6 × 6）のうち、自分の隣（3 × 3）でないもの。
+    """
+    table = []
+    for px in (0, 1):
+        for py in (0, 1):
+            table.append([
+                (bx - 2 - px, by - 2 - py)
+                for bx in range(6) for by in range(6)
+                if max(abs(bx - 2 - px), abs(by - 2 - py)) > 1
+            ])
+    offsets = np.array(table)
+    return offsets[:, :, 0], offsets[:, :, 1]
+
+
+_FAR_DX, _FAR_DY = _far_offsets()
+_NEAR_DX, _NEAR_DY = (np.array([d for d in np.ndindex(3, 3)]) - 1).T
+
+
+class Layout:
+    """ノードの座標（node_ids の順）と、変更の検出に使う隣接の署名"""
+
+    def __init__(self, node_ids, positions, signatures):
+        self.node_ids = list(node_ids)
+        self.positions = positions
+        self.signatures = signatures
+
+    @property
+    def nbytes(self):
+        return self.positions.nbytes + self.signatures.nbytes
+
+    @cached_property
+    def digest(self):
+        """座標のハッシュ（ETag に含める）"""
+        return hashlib.sha1(self.positions.astype('<f4').tobytes()).hexdigest()
+
+    @cached_property
+    def coordinates(self):
+        """ノードID → (x, y)（小数第1位まで）"""
+        rounded = np.round(self.positions, 1).tolist()
+        return {node_id: tuple(xy) for node_id, xy in zip(self.node_ids, rounded)}
+
+    def encode(self):
+        """ProjectLayout.data に保存するバイト列"""
+        return (
+            b''.join(node_id.bytes for node_id in self.node_ids)
+            + self.positions.astype('<f4').tobytes()
+            + self.signatures.astype('<u8').tobytes()
+        )
+
+    @classmethod
+    def decode(cls, data):
+        data = bytes(data)
+        n = len(data) // _RECORD_BYTES
+        node_ids = [uuid.UUID(bytes=data[i * 16:(i + 1) * 16]) for i in range(n)]
+        positions = np.frombuffer(data, dtype='<f4', count=2 * n, offset=16 * n).reshape(n, 2)
+        signatures = np.frombuffer(data, dtype='<u8', count=n, offset=24 * n)
+        return cls(node_ids, positions.astype(np.float64), signatures.astype(np.uint64))
+
+
+def adjacency_signatures(graph):
+    """
+    ノードごとの隣接（リンク先・リンク元と重み）のハッシュ
+
+    順序に依存しない和なので O(辺数) で求まり、前回の値と比べれば
+    リンクや重みが変わったノードがわかる。
+    """
+    keys = np.fromiter(
+        (uuid.UUID(str(node_id)).int & _KEY_MASK for node_id in graph.node_ids),
+        dtype=np.uint64,
+        count=graph.n_nodes
+    )
+    src = graph.sources()
+    dst = graph.indices
+    weights = np.rint(graph.weights * 10).astype(np.uint64) + np.uint64(1)
+    signatures = np.zeros(graph.n_nodes, dtype=np.uint64)
+    np.add.at(signatures, src, keys[dst] * weights)
+    np.add.at(signatures, dst, keys[src] * weights * _IN_EDGE_FACTOR)
+    return signatures
+
+
+def _disc(rng, count, radius):
+    """半径 radius の円内に一様に散らばる count 個の点"""
+    r = radius * np.sqrt(rng.random(count))
+    theta = rng.random(count) * 2 * math.pi
+    return np.column_stack((r * np.cos(theta), r * np.sin(theta)))
+
+
+def _place(positions, known, src, dst, rng, k):
+    """
+    座標の無いノードを置く
+
+    座標のあるリンク先・リンク元があればその重心の近くに、無ければ
+    既存のノードの範囲内にランダムに置く（新しいノード同士のリンクは順にたどる）。
+    """
+    n = len(positions)
+    known = known.copy()
+    if not known.any():
+        positions[:] = _disc(rng, n, k * math.sqrt(n))
+        return
+    a = np.concatenate((src, dst))
+    b = np.concatenate((dst, src))
+    while True:
+        linked = ~known[a] & known[b]
+        if not linked.any():
+            break
+        count = np.bincount(a[linked], minlength=n)
+        targets = np.flatnonzero(count)
+        sums = np.column_stack([
+            np.bincount(a[linked], weights=positions[b[linked], axis], minlength=n)
+            for axis in (0, 1)
+        ])
+        positions[targets] = sums[targets] / count[targets, None] + rng.normal(scale=k / 2, size=(len(targets), 2))
+        known[targets] = True
+    rest = np.flatnonzero(~known)
+    if len(rest):
+        center = positions[known].mean(axis=0)
+        positions[rest] = center + _disc(rng, len(rest), k * math.sqrt(known.sum()) / 2)
+
+
+def _expand(mask, src, dst, hops):
+    """mask のノードから hops ホップ以内（リンクの向きは問わない）"""
+    for _ in range(hops):
+        grown = mask.copy()
+        grown[dst[mask[src]]] = True
+        grown[src[mask[dst]]] = True
+        mask = grown
+    return mask
+
+
+def _repulsion(positions, idx, k2):
+    """idx のノードが受ける斥力（4分木の格子で近似）"""
+    n = len(positions)
+    m = len(idx)
+    force = np.zeros((m, 2))
+    if n < 2 or m == 0:
+        return force
+    lo = positions.min(axis=0)
+    span = float((positions.max(axis=0) - lo).max()) or 1.0
+    unit = (positions - lo) / span
+    depth = min(_MAX_LEVEL, max(2, math.ceil(math.log(n / 2, 4)) if n > 2 else 2))
+    x, y = positions[:, 0], positions[:, 1]
+    tx, ty = x[idx, None], y[idx, None]
+    floor = k2 * 1e-4
+
+    def add(dx, dy, strength):
+        force[:, 0] += (strength * dx).sum(axis=1)
+        force[:, 1] += (strength * dy).sum(axis=1)
+
+    for level in range(2, depth + 1):
+        size = 1 << level
+        width = size + 2 * _PAD
+        cells = np.minimum((unit * size).astype(np.int64), size - 1) + _PAD
+        flat = cells[:, 0] * width + cells[:, 1]
+        mass = np.bincount(flat, minlength=width * width)
+        occupied = np.maximum(mass, 1)
+        cx = np.bincount(flat, weights=x, minlength=width * width) / occupied
+        cy = np.bincount(flat, weights=y, minlength=width * width) / occupied
+
+        # 遠いセルの重心（範囲外のセルは質量0）
+        own = cells[idx]
+        parity = ((own[:, 0] - _PAD) % 2) * 2 + (own[:, 1] - _PAD) % 2
+        far = (own[:, 0, None] + _FAR_DX[parity]) * width + own[:, 1, None] + _FAR_DY[parity]
+        dx = tx - cx[far]
+        dy = ty - cy[far]
+        add(dx, dy, k2 * mass[far] / np.maximum(dx * dx + dy * dy, floor))
+
+    # 最も細かいレベルの自分と隣のセルのノードは1つずつ計算する
+    order = np.argsort(flat, kind='stable')
+    starts = np.zeros(width * width + 1, dtype=np.int64)
+    np.cumsum(mass, out=starts[1:])
+    near = ((own[:, 0, None] + _NEAR_DX) * width + own[:, 1, None] + _NEAR_DY).ravel()
+    counts = mass[near]
+    rows = np.repeat(np.repeat(np.arange(m), len(_NEAR_DX)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    others = order[np.repeat(starts[near], counts) + offsets]
+    distinct = others != idx[rows]
+    rows, others = rows[distinct], others[distinct]
+    dx = x[idx[rows]] - x[others]
+    dy = y[idx[rows]] - y[others]
+    strength = k2 / np.maximum(dx * dx + dy * dy, floor)
+    force[:, 0] += np.bincount(rows, weights=strength * dx, minlength=m)
+    force[:, 1] += np.bincount(rows, weights=strength * dy, minlength=m)
+    return force
+
+
+def _relax(positions, movable, src, dst, weights, iterations, temperature, k):
+    """movable のノードだけを動かして力の釣り合いに近づける（positions をその場で更新）"""
+    idx = np.flatnonzero(movable)
+    if not len(idx):
+        return
+    n = len(positions)
+    gravity = settings.LAYOUT_GRAVITY
+    for step in range(iterations):
+        force = _repulsion(positions, idx, k * k)
+
+        # 引力（リンクの向きは問わない）
+        delta = positions[dst] - positions[src]
+        pull = (np.sqrt((delta ** 2).sum(axis=1)) * weights / k)[:, None] * delta
+        for axis in (0, 1):
+            attraction = (
+                np.bincount(src, weights=pull[:, axis], minlength=n)
+                - np.bincount(dst, weights=pull[:, axis], minlength=n)
+            )
+            force[:, axis] += attraction[idx]
+
+        # 連結していない部分が離れていかないよう中心に引き寄せる
+        force += gravity * (positions.mean(axis=0) - positions[idx])
+
+        limit = temperature * (1 - step / iterations)
+        length = np.sqrt((force ** 2).sum(axis=1))
+        positions[idx] += force * (np.minimum(length, limit) / np.maximum(length, 1e-9))[:, None]
+
+
+def compute_layout(graph, previous=None):
+    """
+    グラフの座標を計算する
+
+    previous（前回の Layout）があればその座標から始め、隣接が変わったノードと
+    LAYOUT_NEIGHBORHOOD_HOPS ホップ以内の近傍だけを動かす。変わったノードの割合が
+    LAYOUT_INCREMENTAL_MAX_RATIO を超える場合は全ノードを動かす。
+    何も変わっていなければ previous をそのまま返す。
+    """
+    n = graph.n_nodes
+    k = settings.LAYOUT_SPACING
+    signatures = adjacency_signatures(graph)
+    positions = np.zeros((n, 2))
+    known = np.zeros(n, dtype=bool)
+    if previous is not None:
+        previous_index = {node_id: i for i, node_id in enumerate(previous.node_ids)}
+        mapped = np.fromiter(
+            (previous_index.get(node_id, -1) for node_id in graph.node_ids),
+            dtype=np.int64,
+            count=n
+        )
+        known = mapped >= 0
+        positions[known] = previous.positions[mapped[known]]
+        changed = ~known
+        changed[known] = previous.signatures[mapped[known]] != signatures[known]
+        if not changed.any() and previous.node_ids == graph.node_ids:
+            return previous
+    else:
+        changed = np.ones(n, dtype=bool)
+
+    # 辺（自己ループは無い）
+    src = graph.sources().astype(np.int64)
+    dst = graph.indices.astype(np.int64)
+    weights = graph.weights.astype(np.float64)
+    rng = np.random.default_rng(uuid.UUID(str(graph.project_id)).int & 0xFFFFFFFF)
+    _place(positions, known, src, dst, rng, k)
+
+    if n and known.any() and changed.mean() <= settings.LAYOUT_INCREMENTAL_MAX_RATIO:
+        movable = _expand(changed, src, dst, settings.LAYOUT_NEIGHBORHOOD_HOPS)
+        iterations = settings.LAYOUT_INCREMENTAL_ITERATIONS
+        temperature = k
+    else:
+        movable = np.ones(n, dtype=bool)
+        iterations = settings.LAYOUT_ITERATIONS
+        # 前回の座標から始める場合は大きく動かさない
+        temperature = k * math.sqrt(max(n, 1)) * (0.1 if known.any() else 0.3)
+    _relax(positions, movable, src, dst, weights, iterations, temperature, k)
+    return Layout(graph.node_ids, positions, signatures)
+
+
+def get_project_layout(project_id):
+    """
+    保存済みのレイアウトを取得する（無ければ None。ここでは計算しない）
+
+    結果はグラフの memo に保持するので、リンクかレイアウトが変わるまでDBも読まない。
+    """
+    graph = get_project_graph(project_id)
+    version = versions.get_version(LAYOUT_VERSION_NAMESPACE, project_id)
+    return graph.memo('layout', lambda: _stored_layout(project_id), params=(version,))
+
+
+def current_coordinates(graph, layout):
+    """
+    保存済みの座標のうち、今のリンクグラフと隣接が同じノードの分（ノードID → (x, y)）
+
+    座標の計算後に追加されたノードと、リンクが変わって座標がまだ計算し直されていない
+    ノードは含めない（x, y は null になる）。
+    """
+    def build():
+        signatures = adjacency_signatures(graph)
+        stored = {node_id: i for i, node_id in enumerate(layout.node_ids)}
+        coordinates = layout.coordinates
+        return {
+            node_id: coordinates[node_id]
+            for node_id, signature in zip(graph.node_ids, signatures.tolist())
+            if node_id in stored and int(layout.signatures[stored[node_id]]) == signature
+        }
+    return graph.memo('coordinates', build, params=(layout,))
+
+
+def update_project_layout(project_id, full=False):
+    """
+    保存済みの座標から変わった部分を計算し直して保存し、レイアウトを返す
+
+    full なら保存済みの座標を使わずに全て計算し直す。何も変わっていなければ保存しない。
+    """
+    graph = get_project_graph(project_id)
+    previous = None if full else _stored_layout(project_id)
+    layout = compute_layout(graph, previous)
+    if layout is not previous:
+        save_layout(project_id, layout)
+    return layout
+
+
+def layout_changed(project_id):
+    """
+    リンクグラフの変更のコミット後に座標を計算し直す（signals.graph_changed から呼ぶ）
+
+    ノードが LAYOUT_ON_WRITE_MAX_NODES を超えるプロジェクトは書き込みを遅くしないよう
+    ここでは計算せず、compute_layouts コマンドに任せる。ノードが無ければ何もしない。
+    """
+    graph = get_project_graph(project_id)
+    if 0 < graph.n_nodes <= settings.LAYOUT_ON_WRITE_MAX_NODES:
+        update_project_layout(project_id)
+
+
+def _stored_layout(project_id):
+    data = ProjectLayout.objects.filter(project_id=project_id).values_list('data', flat=True).first()
+    return Layout.decode(data) if data is not None else None
+
+
+def save_layout(project_id, layout):
+    values = {'data': layout.encode(), 'node_count': len(layout.node_ids), 'updated_at': timezone.now()}
+    # 書き込みのたびに呼ぶので、保存済みの行があれば UPDATE の1文で済ませる
+    if not ProjectLayout.objects.filter(project_id=project_id).update(**values):
+        ProjectLayout.objects.update_or_create(project_id=project_id, defaults=values)
+    versions.bump_version(LAYOUT_VERSION_NAMESPACE, project_id)
@@ -0,0 +1,37 @@
+# Generated manually
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_add_updated_at_to_node'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='node',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('title', 'context', config='simple'), name='idx_nodes_fts'),
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='idx_nodes_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['context'], name='idx_nodes_context_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='processstep',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('content', config='simple'), name='idx_process_steps_content_fts'),
+        ),
+        migrations.AddIndex(
+            model_name='processstep',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['content'], name='idx_process_steps_content_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
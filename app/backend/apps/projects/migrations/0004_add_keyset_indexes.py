@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_add_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(fields=['project', '-created_at', '-id'], name='idx_nodes_project_created'),
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(fields=['-created_at', '-id'], name='idx_nodes_created'),
+        ),
+        migrations.AddIndex(
+            model_name='nodelink',
+            index=models.Index(fields=['from_node', '-created_at', '-id'], name='idx_node_links_from_created'),
+        ),
+        migrations.AddIndex(
+            model_name='nodelink',
+            index=models.Index(fields=['to_node', '-created_at', '-id'], name='idx_node_links_to_created'),
+        ),
+        migrations.AddIndex(
+            model_name='processstep',
+            index=models.Index(fields=['-created_at', '-id'], name='idx_process_steps_created'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='idx_projects_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='round',
+            index=models.Index(fields=['-created_at', '-id'], name='idx_rounds_created'),
+        ),
+    ]
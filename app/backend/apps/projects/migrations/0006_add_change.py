@@ -0,0 +1,63 @@
+# Generated manually
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_changes(apps, schema_editor):
+    """既存のデータを初回同期で取得できるよう変更履歴に登録する"""
+    Change = apps.get_model('projects', 'Change')
+    Project = apps.get_model('projects', 'Project')
+    Round = apps.get_model('projects', 'Round')
+    ProcessStep = apps.get_model('projects', 'ProcessStep')
+    Node = apps.get_model('projects', 'Node')
+    NodeLink = apps.get_model('projects', 'NodeLink')
+
+    sources = [
+        ('project', Project.objects.values_list('id', 'user_id')),
+        ('round', Round.objects.values_list('id', 'project__user_id')),
+        ('step', ProcessStep.objects.values_list('id', 'project__user_id')),
+        ('node', Node.objects.values_list('id', 'project__user_id')),
+        ('link', NodeLink.objects.values_list('id', 'from_node__project__user_id', 'to_node__project__user_id')),
+    ]
+    for kind, rows in sources:
+        batch = []
+        for object_id, user_id, *rest in rows.order_by('created_at', 'id').iterator(chunk_size=2000):
+            if user_id is None and rest:
+                user_id = rest[0]
+            batch.append(Change(kind=kind, object_id=object_id, user_id=user_id))
+            if len(batch) >= 2000:
+                Change.objects.bulk_create(batch)
+                batch = []
+        Change.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('projects', '0005_add_updated_at_to_round_step_link'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('project', 'プロジェクト'), ('round', '周'), ('step', 'ステップ'), ('node', 'ノード'), ('link', 'ノードリンク')], max_length=20, verbose_name='種別')),
+                ('object_id', models.UUIDField(verbose_name='オブジェクトID')),
+                ('deleted', models.BooleanField(default=False, verbose_name='削除済み')),
+                ('changed_at', models.DateTimeField(auto_now=True, verbose_name='変更日時')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': '変更履歴',
+                'verbose_name_plural': '変更履歴',
+                'db_table': 'changes',
+                'indexes': [models.Index(fields=['user', 'seq'], name='idx_changes_user_seq')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='uniq_changes_kind_object')],
+            },
+        ),
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
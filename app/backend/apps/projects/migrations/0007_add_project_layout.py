@@ -0,0 +1,28 @@
+# Generated manually
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_add_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectLayout',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='layout', serialize=False, to='projects.project', verbose_name='プロジェクト')),
+                ('data', models.BinaryField(verbose_name='座標データ')),
+                ('node_count', models.IntegerField(default=0, verbose_name='ノード数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': 'プロジェクトレイアウト',
+                'verbose_name_plural': 'プロジェクトレイアウト',
+                'db_table': 'project_layouts',
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated manually
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0007_add_project_layout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='minhash',
+            field=models.BinaryField(blank=True, editable=False, null=True, verbose_name='MinHash署名'),
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(condition=models.Q(('minhash__isnull', True)), fields=['id'], name='idx_nodes_minhash_pending'),
+        ),
+        migrations.CreateModel(
+            name='MinHashBucket',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('band', models.SmallIntegerField(verbose_name='バンド')),
+                ('bucket', models.BigIntegerField(verbose_name='バケット')),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='projects.node', verbose_name='ノード')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='projects.project', verbose_name='プロジェクト')),
+            ],
+            options={
+                'verbose_name': 'MinHashバケット',
+                'verbose_name_plural': 'MinHashバケット',
+                'db_table': 'node_minhash_buckets',
+                'indexes': [models.Index(fields=['band', 'bucket'], name='idx_minhash_buckets_bucket')],
+            },
+        ),
+    ]
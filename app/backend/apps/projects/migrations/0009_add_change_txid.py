@@ -0,0 +1,26 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0008_add_minhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='txid',
+            field=models.BigIntegerField(default=0, verbose_name='トランザクションID'),
+        ),
+        migrations.RemoveIndex(
+            model_name='change',
+            name='idx_changes_user_seq',
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'txid', 'seq'], name='idx_changes_user_txid_seq'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 import uuid
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -33,6 +35,8 @@ class Project(models.Model):
             models.Index(fields=['status'], name='idx_projects_status'),
             models.Index(fields=['created_at'], name='idx_projects_created_at'),
             models.Index(fields=['user'], name='idx_projects_user'),
+            # キーセットページネーション用（created_at, id）
+            models.Index(fields=['user', '-created_at', '-id'], name='idx_projects_user_created'),
         ]
     
     def __str__(self):
@@ -55,6 +59,7 @@ class Round(models.Model):
     )
     note = models.TextField(blank=True, null=True, verbose_name='メモ')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
     
     class Meta:
         db_table = 'rounds'
@@ -64,6 +69,7 @@ class Round(models.Model):
         indexes = [
             models.Index(fields=['project'], name='idx_rounds_project_id'),
             models.Index(fields=['project', 'round_number'], name='idx_rounds_project_round'),
+            models.Index(fields=['-created_at', '-id'], name='idx_rounds_created'),
         ]
     
     def __str__(self):
@@ -101,6 +107,7 @@ class ProcessStep(models.Model):
     )
     content = models.TextField(verbose_name='内容')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
     
     class Meta:
         db_table = 'process_steps'
@@ -111,6 +118,17 @@ class ProcessStep(models.Model):
             models.Index(fields=['project'], name='idx_process_steps_project_id'),
             models.Index(fields=['round'], name='idx_process_steps_round_id'),
             models.Index(fields=['round', 'step_type'], name='idx_process_steps_round_step'),
+            models.Index(fields=['-created_at', '-id'], name='idx_process_steps_created'),
+            # 全文検索用（apps.projects.search と同じ式）
+            GinIndex(
+                SearchVector('content', config='simple'),
+                name='idx_process_steps_content_fts',
+            ),
+            GinIndex(
+                fields=['content'],
+                opclasses=['gin_trgm_ops'],
+                name='idx_process_steps_content_trgm',
+            ),
         ]
     
     def __str__(self):
@@ -147,6 +165,8 @@ class Node(models.Model):
     )
     title = models.CharField(max_length=255, verbose_name='タイトル')
     context = models.TextField(blank=True, null=True, verbose_name='文脈')
+    # 重複検出用の MinHash 署名（apps.projects.dedup。保存すると消え、検出の前に計算し直す）
+    minhash = models.BinaryField(null=True, blank=True, editable=False, verbose_name='MinHash署名')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
     
@@ -159,6 +179,29 @@ class Node(models.Model):
             models.Index(fields=['round'], name='idx_nodes_round_id'),
             models.Index(fields=['step'], name='idx_nodes_step_id'),
             models.Index(fields=['title'], name='idx_nodes_title'),
+            models.Index(fields=['project', '-created_at', '-id'], name='idx_nodes_project_created'),
+            models.Index(fields=['-created_at', '-id'], name='idx_nodes_created'),
+            # 全文検索用（apps.projects.search と同じ式）
+            GinIndex(
+                SearchVector('title', 'context', config='simple'),
+                name='idx_nodes_fts',
+            ),
+            GinIndex(
+                fields=['title'],
+                opclasses=['gin_trgm_ops'],
+                name='idx_nodes_title_trgm',
+            ),
+            GinIndex(
+                fields=['context'],
+                opclasses=['gin_trgm_ops'],
+                name='idx_nodes_context_trgm',
+            ),
+            # 署名の計算待ちのノード
+            models.Index(
+                fields=['id'],
+                condition=models.Q(minhash__isnull=True),
+                name='idx_nodes_minhash_pending',
+            ),
         ]
     
     def __str__(self):
@@ -167,7 +210,7 @@ class Node(models.Model):
     @property
     def is_global(self):
         """グローバルノードかどうか"""
-        return self.project is None
+        return self.project_id is None
 
 
 class NodeLink(models.Model):
@@ -194,6 +237,7 @@ class NodeLink(models.Model):
         verbose_name='重み'
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
     
     class Meta:
         db_table = 'node_links'
@@ -203,6 +247,8 @@ class NodeLink(models.Model):
         indexes = [
             models.Index(fields=['from_node'], name='idx_node_links_from_node'),
             models.Index(fields=['to_node'], name='idx_node_links_to_node'),
+            models.Index(fields=['from_node', '-created_at', '-id'], name='idx_node_links_from_created'),
+            models.Index(fields=['to_node', '-created_at', '-id'], name='idx_node_links_to_created'),
         ]
         constraints = [
             models.CheckConstraint(
@@ -214,3 +260,106 @@ class NodeLink(models.Model):
     def __str__(self):
         return f"{self.from_node.title} -> {self.to_node.title}"
 
+
+class ProjectLayout(models.Model):
+    """プロジェクトのグラフ描画用のノード座標（apps.projects.layout が計算する）"""
+
+    project = models.OneToOneField(
+        Project,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='layout',
+        verbose_name='プロジェクト'
+    )
+    # ノードごとに ID・座標・隣接の署名を詰めたバイト列（apps.projects.layout.Layout）
+    data = models.BinaryField(verbose_name='座標データ')
+    node_count = models.IntegerField(default=0, verbose_name='ノード数')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        db_table = 'project_layouts'
+        verbose_name = 'プロジェクトレイアウト'
+        verbose_name_plural = 'プロジェクトレイアウト'
+
+    def __str__(self):
+        return f"{self.project_id} ({self.node_count})"
+
+
+class MinHashBucket(models.Model):
+    """重複検出の LSH バケット（ノードの MinHash 署名のバンドごとに1行。apps.projects.dedup が作る）"""
+
+    id = models.BigAutoField(primary_key=True)
+    node = models.ForeignKey(
+        Node,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='ノード'
+    )
+    # ノードの所属（検出の対象を絞る。グローバルノードはNone）
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+        blank=True,
+        verbose_name='プロジェクト'
+    )
+    band = models.SmallIntegerField(verbose_name='バンド')
+    # バンドの署名と所属のハッシュ（同じ値のノードが重複の候補）
+    bucket = models.BigIntegerField(verbose_name='バケット')
+
+    class Meta:
+        db_table = 'node_minhash_buckets'
+        verbose_name = 'MinHashバケット'
+        verbose_name_plural = 'MinHashバケット'
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='idx_minhash_buckets_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.node_id} ({self.band}: {self.bucket})"
+
+
+
+class Change(models.Model):
+    """差分同期用の変更履歴（オブジェクトごとに最新の変更1件だけを残す）"""
+    
+    KIND_CHOICES = [
+        ('project', 'プロジェクト'),
+        ('round', '周'),
+        ('step', 'ステップ'),
+        ('node', 'ノード'),
+        ('link', 'ノードリンク'),
+    ]
+    
+    # 単調増加する変更番号（INSERT の順。コミットの順ではない）
+    seq = models.BigAutoField(primary_key=True)
+    # 書き込んだトランザクションのID（PostgreSQL 以外は0）。同期は (txid, seq) の順に読む
+    txid = models.BigIntegerField(default=0, verbose_name='トランザクションID')
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+        blank=True,
+        verbose_name='ユーザー'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='種別')
+    object_id = models.UUIDField(verbose_name='オブジェクトID')
+    deleted = models.BooleanField(default=False, verbose_name='削除済み')
+    changed_at = models.DateTimeField(auto_now=True, verbose_name='変更日時')
+    
+    class Meta:
+        db_table = 'changes'
+        verbose_name = '変更履歴'
+        verbose_name_plural = '変更履歴'
+        indexes = [
+            models.Index(fields=['user', 'txid', 'seq'], name='idx_changes_user_txid_seq'),
+            models.Index(fields=['kind', 'txid', 'seq'], name='idx_changes_kind_txid_seq'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='uniq_changes_kind_object'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} ({self.seq})"
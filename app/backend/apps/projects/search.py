@@ -0,0 +1,115 @@
+"""
+ノード（タイトル・文脈）とステップ（内容）の全文検索
+
+tsvector（'simple'設定）による語単位の一致に加え、分かち書きのない
+日本語でも部分一致するように pg_trgm のトライグラムインデックスを使う
+（部分一致は列そのものの ILIKE にすること。apps.core.lookups.ILike）。
+結果はランク順に並べ、(rank, type, id) のキーセットでページングする。
+"""
+import base64
+import json
+import uuid
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+from .models import Node, ProcessStep
+
+SEARCH_CONFIG = 'simple'
+
+# インデックス定義（models.py）と同じ式にすること
+NODE_SEARCH_VECTOR = SearchVector('title', 'context', config=SEARCH_CONFIG)
+STEP_SEARCH_VECTOR = SearchVector('content', config=SEARCH_CONFIG)
+
+RESULT_TYPES = ('node', 'step')
+
+
+class InvalidCursor(ValueError):
+    """不正なカーソル"""
+
+
+def encode_cursor(rank, result_type, pk):
+    payload = json.dumps([rank, result_type, str(pk)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        rank, result_type, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        rank = float(rank)
+        pk = uuid.UUID(pk)
+    except (ValueError, TypeError, AttributeError, UnicodeError):
+        raise InvalidCursor(cursor)
+    if result_type not in RESULT_TYPES:
+        raise InvalidCursor(cursor)
+    return rank, result_type, pk
+
+
+def _after_cursor(queryset, result_type, cursor):
+    """カーソル位置より後ろの行に絞り込む（rank降順 → type昇順 → id昇順）"""
+    if cursor is None:
+        return queryset
+    rank, cursor_type, pk = cursor
+    if cursor_type == result_type:
+        return queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__gt=pk))
+    if cursor_type < result_type:
+        # 同じrankの他種別はまだ返していない
+        return queryset.filter(rank__lte=rank)
+    return queryset.filter(rank__lt=rank)
+
+
+def search_nodes(user, text):
+    """ユーザーのプロジェクトのノードとグローバルノードを検索"""
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return Node.objects.annotate(
+        search=NODE_SEARCH_VECTOR,
+    ).filter(
+        Q(project__user=user) | Q(project__isnull=True)
+    ).filter(
+        Q(search=query) | Q(title__ilike=text) | Q(context__ilike=text)
+    ).annotate(
+        rank=Cast(
+            SearchRank(F('search'), query) + TrigramSimilarity('title', text),
+            FloatField(),
+        ),
+    ).select_related('project')
+
+
+def search_steps(user, text):
+    """ユーザーのプロジェクトのステップを検索"""
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return ProcessStep.objects.annotate(
+        search=STEP_SEARCH_VECTOR,
+    ).filter(
+        project__user=user,
+    ).filter(
+        Q(search=query) | Q(content__ilike=text)
+    ).annotate(
+        rank=Cast(SearchRank(F('search'), query), FloatField()),
+    )
+
+
+def search(user, text, types=RESULT_TYPES, limit=20, cursor=None):
+    """
+    検索を実行し、(結果リスト, 次ページの有無) を返す
+
+    結果は (type, rank, object) のタプル。各種別から最大 limit+1 件だけ
+    取得してマージするため、ページの深さによらずコストは一定。
+    """
+    querysets = {
+        'node': search_nodes,
+        'step': search_steps,
+    }
+    rows = []
+    for result_type in types:
+        queryset = _after_cursor(querysets[result_type](user, text), result_type, cursor)
+        for obj in queryset.order_by('-rank', 'id')[:limit + 1]:
+            rows.append((result_type, obj.rank, obj))
+    rows.sort(key=lambda row: (-row[1], row[0], str(row[2].pk)))
+    return rows[:limit], len(rows) > limit
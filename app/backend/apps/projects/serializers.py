@@ -1,8 +1,18 @@
 from rest_framework import serializers
+from apps.core.serializers import SparseFieldsSerializerMixin, ValuesSerializer
 from .models import Project, Round, ProcessStep, Node, NodeLink
 
+# ステップ種別の番号（1〜5）
+STEP_TYPE_NUMBERS = {
+    'overview': 1,
+    'extract': 2,
+    'flow': 3,
+    'mvp': 4,
+    'expand': 5,
+}
 
-class ProjectSerializer(serializers.ModelSerializer):
+
+class ProjectSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     """プロジェクトシリアライザー"""
     
     class Meta:
@@ -11,10 +21,10 @@ class ProjectSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class RoundSerializer(serializers.ModelSerializer):
+class RoundSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     """周シリアライザー"""
     
-    project_id = serializers.UUIDField(source='project.id', read_only=True)
+    project_id = serializers.UUIDField(read_only=True)
     
     class Meta:
         model = Round
@@ -28,11 +38,11 @@ class RoundSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ProcessStepSerializer(serializers.ModelSerializer):
+class ProcessStepSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     """思考プロセスのステップシリアライザー"""
     
-    round_id = serializers.UUIDField(source='round.id', read_only=True)
-    project_id = serializers.UUIDField(source='project.id', read_only=True)
+    round_id = serializers.UUIDField(read_only=True)
+    project_id = serializers.UUIDField(read_only=True)
     step_type_number = serializers.SerializerMethodField()
     
     class Meta:
@@ -42,14 +52,7 @@ class ProcessStepSerializer(serializers.ModelSerializer):
     
     def get_step_type_number(self, obj):
         """ステップ種別の番号を返す（1〜5）"""
-        step_type_order = {
-            'overview': 1,
-            'extract': 2,
-            'flow': 3,
-            'mvp': 4,
-            'expand': 5,
-        }
-        return step_type_order.get(obj.step_type, 0)
+        return STEP_TYPE_NUMBERS.get(obj.step_type, 0)
     
     def create(self, validated_data):
         """ステップ作成時にプロジェクトと周を設定"""
@@ -59,12 +62,12 @@ class ProcessStepSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class NodeSerializer(serializers.ModelSerializer):
+class NodeSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     """ノードシリアライザー"""
     
-    project_id = serializers.UUIDField(source='project.id', read_only=True, allow_null=True)
-    round_id = serializers.UUIDField(source='round.id', read_only=True, allow_null=True)
-    step_id = serializers.UUIDField(source='step.id', read_only=True, allow_null=True)
+    project_id = serializers.UUIDField(read_only=True, allow_null=True)
+    round_id = serializers.UUIDField(read_only=True, allow_null=True)
+    step_id = serializers.UUIDField(read_only=True, allow_null=True)
     is_global = serializers.BooleanField(read_only=True)
     project_title = serializers.CharField(source='project.title', read_only=True, allow_null=True)
     
@@ -113,11 +116,11 @@ class NodeSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class NodeLinkSerializer(serializers.ModelSerializer):
+class NodeLinkSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     """ノードリンクシリアライザー"""
     
-    from_node_id = serializers.UUIDField(source='from_node.id', read_only=True)
-    to_node_id = serializers.UUIDField(source='to_node.id', read_only=True)
+    from_node_id = serializers.UUIDField(read_only=True)
+    to_node_id = serializers.UUIDField(read_only=True)
     from_node_title = serializers.CharField(source='from_node.title', read_only=True)
     to_node_title = serializers.CharField(source='to_node.title', read_only=True)
     
@@ -132,3 +135,30 @@ class NodeLinkSerializer(serializers.ModelSerializer):
         validated_data['from_node'] = from_node
         return super().create(validated_data)
 
+
+# 一覧用の軽量シリアライザー（出力は上のシリアライザーと同じ）
+
+class ProjectValuesSerializer(ValuesSerializer):
+    serializer_class = ProjectSerializer
+
+
+class RoundValuesSerializer(ValuesSerializer):
+    serializer_class = RoundSerializer
+
+
+class ProcessStepValuesSerializer(ValuesSerializer):
+    serializer_class = ProcessStepSerializer
+    computed = {
+        'step_type_number': ('step_type', lambda step_type: STEP_TYPE_NUMBERS.get(step_type, 0)),
+    }
+
+
+class NodeValuesSerializer(ValuesSerializer):
+    serializer_class = NodeSerializer
+    computed = {
+        'is_global': ('project_id', lambda project_id: project_id is None),
+    }
+
+
+class NodeLinkValuesSerializer(ValuesSerializer):
+    serializer_class = NodeLinkSerializer
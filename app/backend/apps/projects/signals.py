@@ -0,0 +1,211 @@
+"""
+プロジェクト関連モデルの変更をキャッシュ類と差分同期の変更履歴に反映するシグナルハンドラ
+
+bulk_create など signals を通らない書き込みでは、ここの関数を直接呼ぶこと。
+
+レスポンスキャッシュ（apps.core.response_cache）は、変更したオブジェクトと
+その親（周・プロジェクト）、所有ユーザーのタグを無効にする。ノードのタイトルは
+リンク一覧に含まれるので、リンクでつながったノードのタグも無効にする。
+
+グラフ・スナップショットのバージョンもコミット後に進める。コミット前に進めると、
+他のリクエストが新しいバージョンでコミット前の内容から作り直してキャッシュしてしまう。
+グラフのレイアウト（WordTree の座標）もリンクグラフの変更のコミット後に計算し直す。
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.core.response_cache import response_cache, tag
+
+from . import versions
+from .graph_engine import GRAPH_VERSION_NAMESPACE, graph_cache
+from .layout import layout_changed
+from .models import Node, NodeLink, ProcessStep, Project, Round
+from .snapshot import SNAPSHOT_VERSION_NAMESPACE
+from .sync import project_owner, record_change
+
+
+def link_project_ids(link):
+    """リンク両端のノードが属するプロジェクトID（元ノード, 先ノード）"""
+    cached = link._state.fields_cache
+    from_node = cached.get('from_node')
+    to_node = cached.get('to_node')
+    if from_node is not None and to_node is not None:
+        return from_node.project_id, to_node.project_id
+    project_ids = dict(
+        Node.objects.filter(pk__in=[link.from_node_id, link.to_node_id]).values_list('pk', 'project_id')
+    )
+    return project_ids.get(link.from_node_id), project_ids.get(link.to_node_id)
+
+
+def graph_changed(project_id, apply=None):
+    """
+    プロジェクトのリンクグラフが変わったことを記録する
+
+    apply を渡すとキャッシュ済みのCSRグラフにその場で適用し、
+    渡さなければ破棄して次回取得時に再構築させる（コミット後に反映）。
+    反映した後に、変わった部分のレイアウトを計算し直して保存する。
+    """
+    if project_id is None:
+        return
+
+    def bump():
+        if apply is None:
+            versions.bump_version(GRAPH_VERSION_NAMESPACE, project_id)
+            graph_cache.invalidate(project_id)
+        else:
+            with transaction.atomic():
+                # その場で適用する場合は、同じプロジェクトのバージョンを進めるプロセスを順番にする。
+                # 前の番号を読んでから書くまでに他のプロセスが進めると、その変更を含まないグラフが
+                # 新しい番号で残ってしまう（キャッシュの読み書きはアトミックでない）
+                list(Project.objects.select_for_update().filter(pk=project_id).values_list('pk'))
+                previous, version = versions.bump_version(GRAPH_VERSION_NAMESPACE, project_id)
+                graph_cache.patch(project_id, previous, version, apply)
+        layout_changed(project_id)
+
+    transaction.on_commit(bump)
+
+
+def bulk_written(project_id):
+    """bulk_create などシグナルを通らない書き込みの後、キャッシュ類へ反映する"""
+    graph_changed(project_id)
+    snapshot_changed(project_id)
+    responses_changed(tag('project', project_id))
+
+
+def responses_changed(*tags):
+    """キャッシュ済みレスポンスのうち tags に依存するものを無効にする（コミット後に反映）"""
+    response_cache.invalidate_on_commit(tags)
+
+
+def owner_tags(user_id):
+    """所有ユーザーのタグ（グローバルノードなど所有者がいなければ無し）"""
+    return (tag('user', user_id),) if user_id is not None else ()
+
+
+def snapshot_changed(project_id):
+    """プロジェクトのスナップショット（周・ステップ・ノードのツリー）が変わったことを記録する（コミット後に反映）"""
+    if project_id is None:
+        return
+    transaction.on_commit(lambda: versions.bump_version(SNAPSHOT_VERSION_NAMESPACE, project_id))
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_changed(sender, instance, signal, **kwargs):
+    snapshot_changed(instance.pk)
+    record_change('project', instance.pk, instance.user_id, deleted=signal is post_delete)
+    responses_changed(tag('project', instance.pk), tag('user', instance.user_id))
+
+
+@receiver(post_save, sender=Round)
+@receiver(post_delete, sender=Round)
+@receiver(post_save, sender=ProcessStep)
+@receiver(post_delete, sender=ProcessStep)
+def project_child_changed(sender, instance, signal, **kwargs):
+    snapshot_changed(instance.project_id)
+    owner = project_owner(instance.project_id)
+    record_change(
+        'round' if sender is Round else 'step',
+        instance.pk,
+        owner,
+        deleted=signal is post_delete
+    )
+    if sender is Round:
+        object_tags = (tag('round', instance.pk),)
+    else:
+        object_tags = (tag('step', instance.pk), tag('round', instance.round_id))
+    responses_changed(*object_tags, tag('project', instance.project_id), *owner_tags(owner))
+
+
+@receiver(pre_save, sender=Node)
+def node_saving(sender, instance, **kwargs):
+    # 重複検出の署名は内容・所属が変わり得るので計算し直させる（apps.projects.dedup）
+    instance.minhash = None
+    # 別プロジェクトへ移動した場合に移動前のプロジェクトのレスポンスも無効にする
+    if not instance._state.adding:
+        instance._previous_project_id = (
+            Node.objects.filter(pk=instance.pk).values_list('project_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Node)
+def node_saved(sender, instance, created, **kwargs):
+    previous_project_id = getattr(instance, '_previous_project_id', instance.project_id)
+    if created:
+        graph_changed(instance.project_id, lambda graph: graph.add_node(instance.pk))
+    elif previous_project_id != instance.project_id:
+        # 別プロジェクトへ移動したノード（とリンク）は移動前・移動先の両方のグラフで変わる
+        graph_changed(previous_project_id)
+        snapshot_changed(previous_project_id)
+        graph_changed(instance.project_id)
+    snapshot_changed(instance.project_id)
+    owner = project_owner(instance.project_id)
+    record_change('node', instance.pk, owner)
+    
+    tags = [tag('node', instance.pk), tag('project', instance.project_id), *owner_tags(owner)]
+    if not created:
+        # リンク先・元のノードのリンク一覧にタイトルが含まれる
+        linked = NodeLink.objects.filter(
+            Q(from_node_id=instance.pk) | Q(to_node_id=instance.pk)
+        ).values_list('from_node_id', 'to_node_id')
+        tags += [tag('node', node_id) for pair in linked for node_id in pair if node_id != instance.pk]
+        if previous_project_id != instance.project_id:
+            tags += [tag('project', previous_project_id), *owner_tags(project_owner(previous_project_id))]
+    responses_changed(*tags)
+
+
+@receiver(post_delete, sender=Node)
+def node_deleted(sender, instance, **kwargs):
+    graph_changed(instance.project_id)
+    snapshot_changed(instance.project_id)
+    owner = project_owner(instance.project_id)
+    record_change('node', instance.pk, owner, deleted=True)
+    # リンクは CASCADE で削除され、link_deleted が隣接ノードのタグを無効にする
+    responses_changed(tag('node', instance.pk), tag('project', instance.project_id), *owner_tags(owner))
+
+
+def link_owner(from_project_id, to_project_id):
+    """リンクの所有ユーザーID（両端ともグローバルノードならNone）"""
+    return project_owner(from_project_id) or project_owner(to_project_id)
+
+
+def link_responses_changed(link, from_project_id, to_project_id, owner):
+    """リンク両端のノード・プロジェクトと所有ユーザーのレスポンスを無効にする"""
+    responses_changed(
+        tag('node', link.from_node_id),
+        tag('node', link.to_node_id),
+        tag('project', from_project_id),
+        tag('project', to_project_id),
+        *owner_tags(owner)
+    )
+
+
+@receiver(post_save, sender=NodeLink)
+def link_saved(sender, instance, created, **kwargs):
+    from_project_id, to_project_id = link_project_ids(instance)
+    owner = link_owner(from_project_id, to_project_id)
+    record_change('link', instance.pk, owner)
+    link_responses_changed(instance, from_project_id, to_project_id, owner)
+    # プロジェクトをまたぐリンクはプロジェクトグラフに含まれない
+    if from_project_id != to_project_id:
+        return
+    if created:
+        graph_changed(from_project_id)
+    else:
+        graph_changed(
+            from_project_id,
+            lambda graph: graph.set_weight(instance.from_node_id, instance.to_node_id, instance.weight)
+        )
+
+
+@receiver(post_delete, sender=NodeLink)
+def link_deleted(sender, instance, **kwargs):
+    from_project_id, to_project_id = link_project_ids(instance)
+    owner = link_owner(from_project_id, to_project_id)
+    record_change('link', instance.pk, owner, deleted=True)
+    link_responses_changed(instance, from_project_id, to_project_id, owner)
+    if from_project_id != to_project_id:
+        return
+    graph_changed(from_project_id)
@@ -0,0 +1,320 @@
+"""
+ノードの類似度インデックス（リンク候補の提案）
+
+タイトルと文脈の先頭（SIMILARITY_MAX_CHARS 文字）を NFKC 正規化・小文字化し、
+文字 n-gram（SIMILARITY_NGRAM_SIZE 文字。分かち書きの無い日本語にも使える）の
+TF-IDF ベクトル（サブリニアTF・L2正規化）にする。全ノードを1つの転置インデックス
+（n-gram ごとのノード番号・重みのCSR）に詰め、問い合わせではノードの重みの大きい
+n-gram（SIMILARITY_QUERY_TERMS 個）のポスティングを np.bincount で足し合わせて
+コサイン類似度を求める。
+
+インデックスはプロセスごとに最初の問い合わせで作る。以降は問い合わせのたびに
+変更履歴（Change）を差分同期と同じ (txid, seq) の順に追いかけ、保存・削除されたノードだけを差分に入れ直す
+（元の行は無効にする）。差分が大きくなったら1つのCSRに詰め直す。
+"""
+import math
+import threading
+import unicodedata
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import Substr
+
+from .models import Node
+from .sync import after, confirmed_changes
+
+MAX_SUGGESTIONS = 50
+DEFAULT_SUGGESTIONS = 10
+
+# n-gram は文字コードを21ビットずつ詰めた整数で表す
+_CODE_BITS = 21
+# NFKC 正規化後の空白（n-gram に含めない）
+_SPACES = np.array([9, 10, 11, 12, 13, 32], dtype=np.int64)
+# 一度に読み込むノード数
+_CHUNK_SIZE = 5000
+# 差分がこの件数（またはノード数の SIMILARITY_MAX_DELTA_RATIO）を超えたら詰め直す
+_MIN_DELTA = 1000
+# 1回の追従で読む変更の上限（超えたら作り直す）
+_MAX_CATCH_UP = 50000
+
+
+def node_text(title, context, max_chars=None):
+    """類似度に使うテキスト（正規化済み。先頭 max_chars 文字、既定は SIMILARITY_MAX_CHARS）"""
+    text = title or ''
+    if context:
+        text += '\n' + context
+    return unicodedata.normalize('NFKC', text[:max_chars or settings.SIMILARITY_MAX_CHARS]).lower()
+
+
+def ngram_counts(texts, n=None):
+    """
+    テキストの列を (テキスト番号, n-gram, 出現回数) の配列にする
+
+    全テキストを1つの文字コード配列にして、n-gram をまとめて求める。
+    空白を含むものとテキストをまたぐものは除く。n の既定は SIMILARITY_NGRAM_SIZE。
+    """
+    n = n or settings.SIMILARITY_NGRAM_SIZE
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype='<u4').astype(np.int64)
+    size = len(codes) - n + 1
+    if size <= 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    owner = np.repeat(np.arange(len(texts)), lengths)
+    grams = np.zeros(size, dtype=np.int64)
+    valid = owner[:size] == owner[n - 1:]
+    for offset in range(n):
+        part = codes[offset:offset + size]
+        grams = (grams << _CODE_BITS) | part
+        valid &= ~np.isin(part, _SPACES)
+    docs, grams = owner[:size][valid], grams[valid]
+
+    order = np.lexsort((grams, docs))
+    docs, grams = docs[order], grams[order]
+    starts = np.flatnonzero(np.concatenate(([True], (docs[1:] != docs[:-1]) | (grams[1:] != grams[:-1]))))
+    counts = np.diff(np.append(starts, len(docs)))
+    return docs[starts], grams[starts], counts
+
+
+class SimilarityIndex:
+    """
+    全ノードの TF-IDF 転置インデックス
+
+    元のセグメント（CSR）と、その後に保存されたノードの差分（辞書）からなる。
+    """
+
+    def __init__(self, node_ids, scopes, docs, grams, counts, position):
+        # 反映済みの変更の位置 (txid, seq)
+        self.position = position
+        self._lock = threading.RLock()
+        self._build(node_ids, scopes, docs, grams, counts)
+
+    def _build(self, node_ids, scopes, docs, grams, counts):
+        n = len(node_ids)
+        self.node_ids = list(node_ids)
+        self.rows = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        # プロジェクトID → 番号（グローバルノードは -1）
+        self.scope_codes = {None: -1}
+        for project_id in scopes:
+            self.scope_codes.setdefault(project_id, len(self.scope_codes) - 1)
+        self.scopes = np.fromiter(
+            (self.scope_codes[project_id] for project_id in scopes), dtype=np.int32, count=n
+        )
+        self.alive = np.ones(n, dtype=bool)
+
+        self.vocab, terms = np.unique(grams, return_inverse=True)
+        df = np.bincount(terms, minlength=len(self.vocab))
+        self.idf = np.log((1 + n) / (1 + df)) + 1
+        weights = (1 + np.log(counts)) * self.idf[terms]
+        norms = np.sqrt(np.bincount(docs, weights=weights ** 2, minlength=n))
+        weights /= np.maximum(norms, 1e-12)[docs]
+
+        order = np.argsort(terms, kind='stable')
+        self.indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=self.indptr[1:])
+        self.docs = docs[order].astype(np.int32)
+        self.weights = weights[order].astype(np.float32)
+        self.counts = np.minimum(counts[order], np.iinfo(np.uint16).max).astype(np.uint16)
+
+        # 差分: ノードID → (プロジェクトID, n-gram → 出現回数, n-gram → 重み) と n-gram → {ノードID: 重み}
+        self.delta = {}
+        self.delta_postings = {}
+
+    def vector(self, text):
+        """テキストの TF-IDF ベクトル（n-gram → 重み）と出現回数"""
+        _, grams, counts = ngram_counts([text])
+        positions = np.searchsorted(self.vocab, grams)
+        known = positions < len(self.vocab)
+        known[known] = self.vocab[positions[known]] == grams[known]
+        # インデックスに無い n-gram は最も珍しい扱い
+        idf = np.full(len(grams), math.log(1 + len(self.node_ids)) + 1)
+        idf[known] = self.idf[positions[known]]
+        weights = (1 + np.log(counts)) * idf
+        weights /= max(float(np.sqrt((weights ** 2).sum())), 1e-12)
+        return dict(zip(grams.tolist(), weights.tolist())), dict(zip(grams.tolist(), counts.tolist()))
+
+    def _discard(self, node_id):
+        row = self.rows.get(node_id)
+        if row is not None:
+            self.alive[row] = False
+        entry = self.delta.pop(node_id, None)
+        if entry is not None:
+            for gram in entry[2]:
+                postings = self.delta_postings[gram]
+                del postings[node_id]
+                if not postings:
+                    del self.delta_postings[gram]
+
+    def _put(self, node_id, project_id, title, context):
+        self._discard(node_id)
+        weights, counts = self.vector(node_text(title, context))
+        self.delta[node_id] = (project_id, counts, weights)
+        for gram, weight in weights.items():
+            self.delta_postings.setdefault(gram, {})[node_id] = weight
+
+    def catch_up(self):
+        """前回以降に保存・削除されたノードを反映する。変更が多すぎたら False（作り直す）"""
+        with self._lock:
+            changes = list(
+                confirmed_changes().filter(after(self.position), kind='node')
+                .order_by('txid', 'seq')
+                .values_list('txid', 'seq', 'object_id', 'deleted')[:_MAX_CATCH_UP + 1]
+            )
+            if len(changes) > _MAX_CATCH_UP:
+                return False
+            if not changes:
+                return True
+
+            saved = [object_id for _, _, object_id, deleted in changes if not deleted]
+            for _, _, object_id, deleted in changes:
+                if deleted:
+                    self._discard(object_id)
+            for start in range(0, len(saved), _CHUNK_SIZE):
+                chunk = saved[start:start + _CHUNK_SIZE]
+                found = set()
+                for node_id, project_id, title, context in _node_rows(Node.objects.filter(pk__in=chunk)):
+                    self._put(node_id, project_id, title, context)
+                    found.add(node_id)
+                # 記録後に削除されたノード
+                for node_id in set(chunk) - found:
+                    self._discard(node_id)
+            self.position = changes[-1][:2]
+
+            if len(self.delta) > max(_MIN_DELTA, settings.SIMILARITY_MAX_DELTA_RATIO * len(self.node_ids)):
+                self._compact()
+            return True
+
+    def _compact(self):
+        """差分を元のセグメントに詰め直す（IDFも計算し直す）"""
+        alive = np.flatnonzero(self.alive)
+        remap = np.full(len(self.node_ids), -1, dtype=np.int64)
+        remap[alive] = np.arange(len(alive))
+        terms = np.repeat(np.arange(len(self.vocab)), np.diff(self.indptr))
+        keep = self.alive[self.docs]
+
+        node_ids = [self.node_ids[i] for i in alive]
+        codes = {code: project_id for project_id, code in self.scope_codes.items()}
+        scopes = [codes[code] for code in self.scopes[alive].tolist()]
+        docs = [remap[self.docs[keep]]]
+        grams = [self.vocab[terms[keep]]]
+        counts = [self.counts[keep].astype(np.int64)]
+        for node_id, (project_id, gram_counts, _) in self.delta.items():
+            docs.append(np.full(len(gram_counts), len(node_ids), dtype=np.int64))
+            grams.append(np.fromiter(gram_counts.keys(), dtype=np.int64, count=len(gram_counts)))
+            counts.append(np.fromiter(gram_counts.values(), dtype=np.int64, count=len(gram_counts)))
+            node_ids.append(node_id)
+            scopes.append(project_id)
+        self._build(node_ids, scopes, np.concatenate(docs), np.concatenate(grams), np.concatenate(counts))
+
+    def similar(self, text, project_id, exclude=(), k=DEFAULT_SUGGESTIONS):
+        """
+        text に似たノードの (ノードID, 類似度) を類似度の高い順に k 件
+
+        対象は project_id のプロジェクトのノードとグローバルノード
+        （project_id が None ならグローバルノードだけ）。exclude のノードは除く。
+        """
+        with self._lock:
+            weights, _ = self.vector(text)
+            terms = sorted(weights.items(), key=lambda item: -item[1])[:settings.SIMILARITY_QUERY_TERMS]
+            if not terms:
+                return []
+            grams = np.array([gram for gram, _ in terms], dtype=np.int64)
+            query = np.array([weight for _, weight in terms])
+            scope = self.scope_codes.get(project_id, -2)
+
+            # 元のセグメント
+            positions = np.searchsorted(self.vocab, grams)
+            found = positions < len(self.vocab)
+            found[found] = self.vocab[positions[found]] == grams[found]
+            starts = self.indptr[positions[found]]
+            ends = self.indptr[positions[found] + 1]
+            lengths = ends - starts
+            offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            postings = np.repeat(starts, lengths) + offsets
+            docs = self.docs[postings]
+            scores = np.bincount(
+                docs,
+                weights=self.weights[postings] * np.repeat(query[found], lengths),
+                minlength=len(self.node_ids)
+            )
+            allowed = self.alive & ((self.scopes == -1) | (self.scopes == scope))
+            for node_id in exclude:
+                row = self.rows.get(node_id)
+                if row is not None:
+                    allowed[row] = False
+            candidates = np.flatnonzero((scores > 0) & allowed)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            results = [(self.node_ids[i], float(scores[i])) for i in candidates.tolist()]
+
+            # 差分
+            delta_scores = {}
+            for gram, weight in terms:
+                for node_id, doc_weight in self.delta_postings.get(gram, {}).items():
+                    delta_scores[node_id] = delta_scores.get(node_id, 0.0) + weight * doc_weight
+            exclude = set(exclude)
+            results += [
+                (node_id, score) for node_id, score in delta_scores.items()
+                if node_id not in exclude and self.delta[node_id][0] in (None, project_id)
+            ]
+
+        results.sort(key=lambda item: (-item[1], str(item[0])))
+        return results[:k]
+
+
+def _node_rows(queryset):
+    """(ID, プロジェクトID, タイトル, 文脈の先頭) の行"""
+    return queryset.annotate(
+        context_head=Substr('context', 1, settings.SIMILARITY_MAX_CHARS)
+    ).values_list('id', 'project_id', 'title', 'context_head').iterator(chunk_size=_CHUNK_SIZE)
+
+
+def build_index():
+    """DBの全ノードからインデックスを作る"""
+    # 確定した変更は読み込むノードに入っている。それ以降の変更は次の追従で反映する
+    position = confirmed_changes().order_by('-txid', '-seq').values_list('txid', 'seq').first() or (0, 0)
+    node_ids, scopes, docs, grams, counts = [], [], [], [], []
+    texts = []
+
+    def flush():
+        chunk_docs, chunk_grams, chunk_counts = ngram_counts(texts)
+        docs.append(chunk_docs + (len(node_ids) - len(texts)))
+        grams.append(chunk_grams)
+        counts.append(chunk_counts)
+        texts.clear()
+
+    for node_id, project_id, title, context in _node_rows(Node.objects.order_by()):
+        node_ids.append(node_id)
+        scopes.append(project_id)
+        texts.append(node_text(title, context))
+        if len(texts) >= _CHUNK_SIZE:
+            flush()
+    flush()
+    return SimilarityIndex(node_ids, scopes, np.concatenate(docs), np.concatenate(grams), np.concatenate(counts), position)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index():
+    """プロセスのインデックス（無ければ作り、あれば変更に追従させる）"""
+    global _index
+    index = _index
+    if index is not None and index.catch_up():
+        return index
+    with _index_lock:
+        if _index is None or _index is index:
+            _index = build_index()
+        return _index
+
+
+def suggest_links(node, k=DEFAULT_SUGGESTIONS, exclude=()):
+    """ノードのリンク候補の (ノードID, 類似度)。自分自身と exclude のノードは除く"""
+    return get_similarity_index().similar(
+        node_text(node.title, node.context),
+        node.project_id,
+        exclude={node.pk, *exclude},
+        k=k
+    )
@@ -0,0 +1,87 @@
+"""
+プロジェクトのスナップショット（Project → Round → ProcessStep → Node のツリー）
+
+固定回数のクエリで組み立て、サーバー側キャッシュに保持する。キャッシュキーには
+プロジェクトのスナップショット用バージョンを含め、子レコードの書き込み時に
+signals でバージョンを進めて古いエントリを参照されないようにする。
+内容もバージョンも CACHES['default']（プロセス間で共有する file / db キャッシュ）に置くので、
+あるワーカーの書き込みの後は他のワーカーも新しいツリーと ETag を返す。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Prefetch, Value, When
+
+from . import versions
+from .models import Node, ProcessStep, Round
+from .serializers import NodeSerializer, ProcessStepSerializer, ProjectSerializer, RoundSerializer
+
+SNAPSHOT_VERSION_NAMESPACE = 'snapshot'
+
+STEP_TYPE_ORDER = Case(
+    *[
+        When(step_type=step_type, then=Value(number))
+        for number, (step_type, _) in enumerate(ProcessStep.STEP_TYPE_CHOICES, start=1)
+    ],
+    default=Value(99),
+    output_field=IntegerField(),
+)
+
+
+def snapshot_version(project_id):
+    return versions.get_version(SNAPSHOT_VERSION_NAMESPACE, project_id)
+
+
+def build_snapshot(project):
+    """スナップショットを組み立てる（周・ステップ・ノードで計3クエリ）"""
+    rounds = list(
+        Round.objects.filter(project=project)
+        .order_by('round_number')
+        .prefetch_related(
+            Prefetch('process_steps', queryset=ProcessStep.objects.order_by(STEP_TYPE_ORDER))
+        )
+    )
+    nodes = Node.objects.filter(project=project).order_by('-created_at', '-id')
+
+    # ノードはステップ → 周 → プロジェクト直下の順に所属先を決める
+    step_ids = {step.pk for round_obj in rounds for step in round_obj.process_steps.all()}
+    round_ids = {round_obj.pk for round_obj in rounds}
+    by_step, by_round, unassigned = {}, {}, []
+    for node in nodes:
+        # project_title 用に取得済みのプロジェクトを使い回す
+        node.project = project
+        if node.step_id in step_ids:
+            by_step.setdefault(node.step_id, []).append(node)
+        elif node.round_id in round_ids:
+            by_round.setdefault(node.round_id, []).append(node)
+        else:
+            unassigned.append(node)
+
+    round_data = []
+    for round_obj in rounds:
+        steps = []
+        for step in round_obj.process_steps.all():
+            step_data = ProcessStepSerializer(step).data
+            step_data['nodes'] = NodeSerializer(by_step.get(step.pk, []), many=True).data
+            steps.append(step_data)
+        item = RoundSerializer(round_obj).data
+        item['steps'] = steps
+        item['nodes'] = NodeSerializer(by_round.get(round_obj.pk, []), many=True).data
+        round_data.append(item)
+
+    return {
+        'project': ProjectSerializer(project).data,
+        'rounds': round_data,
+        'nodes': NodeSerializer(unassigned, many=True).data,
+    }
+
+
+def get_snapshot(project, version=None):
+    """キャッシュ済みのスナップショットを返す（無ければ組み立てて保存）"""
+    if version is None:
+        version = snapshot_version(project.pk)
+    key = f'projects:snapshot:{project.pk}:{version}'
+    data = cache.get(key)
+    if data is None:
+        data = build_snapshot(project)
+        cache.set(key, data, timeout=getattr(settings, 'SNAPSHOT_CACHE_TIMEOUT', 60 * 60 * 24))
+    return data
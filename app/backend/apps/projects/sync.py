@@ -0,0 +1,183 @@
+"""
+差分同期（/sync/changes/?since=<token>）
+
+作成・更新・削除のたびに Change へ変更番号（単調増加の seq）と書き込んだトランザクションの
+ID（txid）を記録し、クライアントは前回受け取ったトークン以降の変更だけを取得する。
+Change はオブジェクトごとに最新の1件だけを残すので、件数はオブジェクト数
+（削除済みは墓標として残る）を超えない。
+
+seq は INSERT の時点で採番され、コミットの順とは一致しない（後から採番された行が先に見える）。
+そのため PostgreSQL では (txid, seq) の順に並べ、実行中の最も古いトランザクション（スナップショットの
+xmin）より前の行だけを返す。xmin より前のトランザクションは全て終わっているので、後から
+トークンより前の行が現れることはない。代わりに長いトランザクションがあると、その間の変更は
+終わるまで返らない（遅れるだけで取りこぼさない）。書き込みが直列になる SQLite などでは txid は0。
+
+記録は signals から行う。bulk_create など signals を通らない書き込みでは
+record_changes を直接呼ぶこと。
+"""
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import BigIntegerField, Expression, Q
+
+from .models import Change, Node, NodeLink, ProcessStep, Project, Round
+from .serializers import (
+    NodeLinkSerializer,
+    NodeSerializer,
+    ProcessStepSerializer,
+    ProjectSerializer,
+    RoundSerializer,
+)
+
+MAX_SYNC_CHANGES = 1000
+
+# 種別ごとのレスポンスのキー、取得するクエリセット、シリアライザー
+SYNC_KINDS = {
+    'project': ('projects', lambda user: Project.objects.filter(user=user), ProjectSerializer),
+    'round': ('rounds', lambda user: Round.objects.filter(project__user=user), RoundSerializer),
+    'step': ('steps', lambda user: ProcessStep.objects.filter(project__user=user), ProcessStepSerializer),
+    'node': (
+        'nodes',
+        lambda user: Node.objects.filter(
+            Q(project__user=user) | Q(project__isnull=True)
+        ).select_related('project'),
+        NodeSerializer
+    ),
+    'link': (
+        'links',
+        lambda user: NodeLink.objects.filter(
+            Q(from_node__project__user=user)
+            | Q(to_node__project__user=user)
+            | Q(from_node__project__isnull=True, to_node__project__isnull=True)
+        ).select_related('from_node', 'to_node'),
+        NodeLinkSerializer
+    ),
+}
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+class CurrentTransactionId(Expression):
+    """書き込み中のトランザクションID（PostgreSQL 以外は0）"""
+    output_field = BigIntegerField()
+
+    def as_sql(self, compiler, connection):
+        return '0', []
+
+    def as_postgresql(self, compiler, connection):
+        return 'pg_current_xact_id()::text::bigint', []
+
+
+def visible_horizon():
+    """これより前のトランザクションIDの変更は全て確定している。PostgreSQL 以外は None（制限なし）"""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+        return cursor.fetchone()[0]
+
+
+def after(position):
+    """変更の位置 (txid, seq) より後の Change の条件"""
+    txid, seq = position
+    return Q(txid__gt=txid) | Q(txid=txid, seq__gt=seq)
+
+
+def confirmed_changes():
+    """確定した（これより前に新しい行が現れない）Change"""
+    changes = Change.objects.all()
+    horizon = visible_horizon()
+    if horizon is not None:
+        changes = changes.filter(txid__lt=horizon)
+    return changes
+
+
+@lru_cache(maxsize=4096)
+def project_owner(project_id):
+    """プロジェクトの所有ユーザーID（所有者は変わらないのでプロセス内で保持する）"""
+    if project_id is None:
+        return None
+    return Project.objects.filter(pk=project_id).values_list('user_id', flat=True).first()
+
+
+def record_changes(kind, changes, deleted=False):
+    """(オブジェクトID, 所有ユーザーID) の列の変更を記録する"""
+    changes = list(changes)
+    if not changes:
+        return
+    with transaction.atomic():
+        # 以前の記録を消して新しい番号で入れ直す
+        Change.objects.filter(kind=kind, object_id__in=[object_id for object_id, _ in changes]).delete()
+        Change.objects.bulk_create(
+            [
+                Change(kind=kind, object_id=object_id, user_id=user_id, deleted=deleted, txid=CurrentTransactionId())
+                for object_id, user_id in changes
+            ],
+            batch_size=1000
+        )
+
+
+def record_change(kind, object_id, user_id, deleted=False):
+    record_changes(kind, [(object_id, user_id)], deleted=deleted)
+
+
+def parse_token(token):
+    """同期トークン（"txid.seq"）を変更の位置 (txid, seq) にする。未指定なら最初から"""
+    if token in (None, ''):
+        return (0, 0)
+    try:
+        # 以前のトークン（seq だけ）は txid 0 の位置として扱う
+        txid, _, seq = str(token).rpartition('.')
+        position = (int(txid or 0), int(seq))
+    except (TypeError, ValueError):
+        raise InvalidSyncToken(token)
+    if min(position) < 0:
+        raise InvalidSyncToken(token)
+    return position
+
+
+def format_token(position):
+    return '%d.%d' % position
+
+
+def changes_since(user, since, limit=MAX_SYNC_CHANGES):
+    """
+    変更の位置 since (txid, seq) より後の確定した変更を返す
+
+    1回に返すのは limit 件までで、続きがあれば has_more が True になる。
+    返したトークンを次回の since に渡す。
+    """
+    rows = list(
+        confirmed_changes()
+        .filter(Q(user=user) | Q(user__isnull=True))
+        .filter(after(since))
+        .order_by('txid', 'seq')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changed = {kind: [] for kind in SYNC_KINDS}
+    deleted = {key: [] for key, _, _ in SYNC_KINDS.values()}
+    for row in rows:
+        if row.deleted:
+            deleted[SYNC_KINDS[row.kind][0]].append(str(row.object_id))
+        else:
+            changed[row.kind].append(row.object_id)
+
+    # 種別ごとに1クエリで現在の内容を取得する（その後削除された物は墓標が後から届く）
+    data = {}
+    for kind, (key, queryset, serializer_class) in SYNC_KINDS.items():
+        objects = queryset(user).in_bulk(changed[kind]) if changed[kind] else {}
+        data[key] = serializer_class(
+            [objects[pk] for pk in changed[kind] if pk in objects],
+            many=True
+        ).data
+
+    return {
+        'changes': data,
+        'deleted': deleted,
+        'token': format_token((rows[-1].txid, rows[-1].seq) if rows else since),
+        'has_more': has_more,
+    }
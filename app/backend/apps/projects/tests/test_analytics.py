@@ -0,0 +1,119 @@
+"""
+グラフ分析（apps.projects.analytics）のテスト
+
+結果が分かっている小さな固定のグラフで確かめる。グラフはDBを使わずに
+ProjectGraph.from_edges で組み立てる。
+"""
+import numpy as np
+from django.test import SimpleTestCase
+
+from apps.projects import analytics
+from apps.projects.graph_engine import ProjectGraph
+
+
+def make_graph(node_ids, edges):
+    """ノードIDの列と (始点, 終点[, 重み]) の列からグラフを作る"""
+    rows = [(edge[0], edge[1], edge[2] if len(edge) > 2 else 1.0) for edge in edges]
+    return ProjectGraph.from_edges('project', node_ids, rows)
+
+
+def partition(graph, labels):
+    """ラベル配列をノードIDの集合の集合にする（ラベルの番号の付け方によらず比べる）"""
+    groups = {}
+    for node_id, label in zip(graph.node_ids, labels.tolist()):
+        groups.setdefault(label, set()).add(node_id)
+    return {frozenset(group) for group in groups.values()}
+
+
+class StronglyConnectedComponentsTests(SimpleTestCase):
+    """Tarjan法の強連結成分"""
+
+    def setUp(self):
+        # a→b→c→a のリング、d⇄e のリング、リングの間の片道の辺と、孤立したノード f
+        self.graph = make_graph(
+            ['a', 'b', 'c', 'd', 'e', 'f'],
+            [('a', 'b'), ('b', 'c'), ('c', 'a'), ('c', 'd'), ('d', 'e', 0.5), ('e', 'd', 0.25)],
+        )
+
+    def test_components(self):
+        labels = analytics.strongly_connected_components(self.graph)
+        self.assertEqual(
+            partition(self.graph, labels),
+            {frozenset('abc'), frozenset('de'), frozenset('f')},
+        )
+
+    def test_rings(self):
+        rings = analytics.rings(self.graph)
+        self.assertEqual(
+            [({self.graph.node_ids[i] for i in members}, edges, weight) for members, edges, weight in rings],
+            [({'a', 'b', 'c'}, 3, 3.0), ({'d', 'e'}, 2, 0.75)],
+        )
+
+    def test_long_chain_does_not_recurse(self):
+        # 再帰では上限に当たる長さの1本のリング
+        node_ids = list(range(5000))
+        edges = [(i, (i + 1) % len(node_ids)) for i in node_ids]
+        labels = analytics.strongly_connected_components(make_graph(node_ids, edges))
+        self.assertEqual(set(labels.tolist()), {int(labels[0])})
+
+
+class PageRankTests(SimpleTestCase):
+    """重み付きPageRank"""
+
+    def setUp(self):
+        # b, c, d が a を指し、a は b だけを指す。e はリンクの無いノード
+        self.graph = make_graph(
+            ['a', 'b', 'c', 'd', 'e'],
+            [('b', 'a'), ('c', 'a'), ('d', 'a'), ('a', 'b')],
+        )
+
+    def test_ranks_sum_to_one(self):
+        ranks, _, converged = analytics.pagerank(self.graph)
+        self.assertTrue(converged)
+        self.assertAlmostEqual(float(ranks.sum()), 1.0, places=6)
+
+    def test_order(self):
+        order = [self.graph.node_ids[i] for i in analytics.rank_order(self.graph)]
+        self.assertEqual(order[:2], ['a', 'b'])
+        ranks = analytics.node_ranks(self.graph)
+        # 指されていないノードはどれも同じランク
+        self.assertAlmostEqual(ranks['c'], ranks['d'], places=6)
+        self.assertAlmostEqual(ranks['c'], ranks['e'], places=6)
+        self.assertGreater(ranks['b'], ranks['c'])
+
+    def test_matches_linear_solution(self):
+        # r = (1 - d) / n + d * (P^T r + 出リンクの無いノードのランク / n) を直接解いた値と比べる
+        damping = 0.85
+        graph = make_graph(['x', 'y', 'z'], [('x', 'y', 0.9), ('x', 'z', 0.1), ('y', 'x', 1.0)])
+        n = graph.n_nodes
+        transition = np.zeros((n, n))
+        for src, dst, weight in [(0, 1, 0.9), (0, 2, 0.1), (1, 0, 1.0)]:
+            transition[dst, src] = weight
+        transition[:, 2] = 1.0 / n
+        expected = np.linalg.solve(np.eye(n) - damping * transition, np.full(n, (1 - damping) / n))
+
+        ranks, _, _ = analytics.pagerank(graph, damping=damping, tol=1e-10, max_iter=1000)
+        np.testing.assert_allclose(ranks, expected, atol=1e-8)
+        self.assertGreater(ranks[1], ranks[2])
+
+
+class CommunityTests(SimpleTestCase):
+    """Louvain法のコミュニティ"""
+
+    def test_two_cliques_joined_by_one_edge(self):
+        left, right = ['a1', 'a2', 'a3', 'a4'], ['b1', 'b2', 'b3', 'b4']
+        edges = [
+            (clique[i], clique[j])
+            for clique in (left, right)
+            for i in range(len(clique))
+            for j in range(i + 1, len(clique))
+        ]
+        edges.append(('a4', 'b1'))
+        graph = make_graph(left + right, edges)
+
+        levels = analytics.communities(graph)
+        self.assertTrue(levels)
+        self.assertEqual(partition(graph, levels[-1]), {frozenset(left), frozenset(right)})
+
+    def test_no_links(self):
+        self.assertEqual(analytics.communities(make_graph(['a', 'b'], [])), ())
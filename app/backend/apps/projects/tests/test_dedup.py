@@ -0,0 +1,78 @@
+"""
+ノードの重複検出（apps.projects.dedup）のテスト
+
+内容の分かっている固定のテキストで、ほぼ同じノードの組だけを重複として検出することと、
+まとめるときに重複ノードのリンクが一意制約にぶつからずに残す側へ付け替えられることを確かめる。
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.test import TestCase
+
+from apps.projects.dedup import find_duplicates, merge_duplicates
+from apps.projects.models import Node, NodeLink, Project
+
+CONTEXT = 'ユーザーの検索履歴を集計して画面に通知する仕組みを作る。週ごとの傾向を分析し、改善の優先度を決める。'
+
+
+class DuplicateTests(TestCase):
+    """ほぼ同じタイトル・文脈のノードの組"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='owner', password='password')
+        self.project = Project.objects.create(user=user, title='プロジェクト')
+        # 作成日時の古い方が残す側になるので順に作る
+        self.keep = Node.objects.create(project=self.project, title='検索履歴の通知', context=CONTEXT)
+        self.duplicate = Node.objects.create(project=self.project, title='検索履歴の通知。', context=CONTEXT)
+        self.other = Node.objects.create(
+            project=self.project, title='在庫の発注点', context='倉庫ごとの在庫数から発注点と発注量を見直す。'
+        )
+        self.another = Node.objects.create(project=self.project, title='配送の遅延', context='遅延の原因を調べる。')
+        self.scope = Q(project=self.project)
+
+    def link(self, from_node, to_node, weight):
+        return NodeLink.objects.create(from_node=from_node, to_node=to_node, weight=Decimal(weight))
+
+    def test_finds_near_duplicate_pair(self):
+        clusters = find_duplicates(self.scope)
+        self.assertEqual(len(clusters), 1)
+        cluster = clusters[0]
+        self.assertEqual(cluster['project_id'], self.project.pk)
+        self.assertEqual([node_id for node_id, _, _ in cluster['nodes']], [self.keep.pk, self.duplicate.pk])
+        self.assertGreaterEqual(cluster['nodes'][1][2], 0.8)
+
+    def test_other_projects_not_mixed(self):
+        other_project = Project.objects.create(user=self.project.user, title='別のプロジェクト')
+        Node.objects.create(project=other_project, title='検索履歴の通知', context=CONTEXT)
+        clusters = find_duplicates(Q(project__user=self.project.user))
+        self.assertEqual(
+            [[node_id for node_id, _, _ in cluster['nodes']] for cluster in clusters],
+            [[self.keep.pk, self.duplicate.pk]],
+        )
+
+    def test_merge_repoints_links(self):
+        self.link(self.keep, self.other, '0.3')
+        # 付け替えると keep → other と同じ組になる（重みの大きい方を残す）
+        self.link(self.duplicate, self.other, '0.8')
+        self.link(self.another, self.keep, '0.9')
+        # 付け替えると another → keep と同じ組になる（既存の方が重い）
+        self.link(self.another, self.duplicate, '0.2')
+        self.link(self.other, self.duplicate, '0.5')
+        # 付け替えると自己ループになるので重複ノードと一緒に消える
+        self.link(self.keep, self.duplicate, '0.4')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = merge_duplicates(find_duplicates(self.scope))
+
+        self.assertEqual(result['cluster_count'], 1)
+        self.assertEqual(result['merged_node_count'], 1)
+        self.assertFalse(Node.objects.filter(pk=self.duplicate.pk).exists())
+        self.assertEqual(
+            set(NodeLink.objects.values_list('from_node_id', 'to_node_id', 'weight')),
+            {
+                (self.keep.pk, self.other.pk, Decimal('0.8')),
+                (self.another.pk, self.keep.pk, Decimal('0.9')),
+                (self.other.pk, self.keep.pk, Decimal('0.5')),
+            },
+        )
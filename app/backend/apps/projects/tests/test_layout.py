@@ -0,0 +1,65 @@
+"""
+グラフレイアウト（apps.projects.layout）のテスト
+
+座標はリンクグラフの変更のコミット後に計算して保存し、/projects/{id}/graph/ は
+保存済みの座標を読むだけで、古くなったノードの x, y を null にすることを確かめる。
+"""
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.projects.graph_engine import graph_cache
+from apps.projects.models import Node, NodeLink, Project, ProjectLayout
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class LayoutOnWriteTests(TestCase):
+    """書き込みで計算し、GET では計算しない"""
+
+    def setUp(self):
+        graph_cache.clear()
+        self.addCleanup(graph_cache.clear)
+        user = User.objects.create_user(username='owner', password='password')
+        self.project = Project.objects.create(user=user, title='プロジェクト')
+        self.nodes = Node.objects.bulk_create([Node(project=self.project, title=f'要素{i}') for i in range(4)])
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def link(self, from_node, to_node):
+        with self.captureOnCommitCallbacks(execute=True):
+            NodeLink.objects.create(from_node=from_node, to_node=to_node)
+
+    def coordinates(self):
+        response = self.client.get(f'/api/v1/projects/{self.project.pk}/graph/')
+        body = json.loads(b''.join(response.streaming_content))
+        return {node['id']: (node['x'], node['y']) for node in body['nodes']}
+
+    def test_get_does_not_compute(self):
+        coordinates = self.coordinates()
+        self.assertEqual(set(coordinates.values()), {(None, None)})
+        self.assertFalse(ProjectLayout.objects.filter(project=self.project).exists())
+
+    def test_computed_after_link_commit(self):
+        self.link(self.nodes[0], self.nodes[1])
+        self.assertTrue(ProjectLayout.objects.filter(project=self.project).exists())
+        coordinates = self.coordinates()
+        self.assertEqual(len(coordinates), 4)
+        self.assertNotIn((None, None), coordinates.values())
+
+    def test_stale_nodes_omitted(self):
+        self.link(self.nodes[0], self.nodes[1])
+        before = self.coordinates()
+        with override_settings(LAYOUT_ON_WRITE_MAX_NODES=0):
+            self.link(self.nodes[2], self.nodes[3])
+
+        # リンクの変わったノードは座標を計算し直すまで null、他のノードは保存済みの座標
+        coordinates = self.coordinates()
+        stale = {str(self.nodes[2].pk), str(self.nodes[3].pk)}
+        self.assertEqual({node_id for node_id, xy in coordinates.items() if xy == (None, None)}, stale)
+        self.assertEqual(
+            {node_id: xy for node_id, xy in coordinates.items() if node_id not in stale},
+            {node_id: xy for node_id, xy in before.items() if node_id not in stale},
+        )
@@ -0,0 +1,62 @@
+"""
+リクエストの計測（apps.core.metrics）のテスト
+
+ストリーミングで返すエクスポートでも、本文を生成する間のSQLが集計に入ることと、
+METRICS_TOKEN が無いときに /metrics を返す相手を確かめる。
+"""
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.core.metrics import registry
+from apps.projects.models import Node, Project
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class StreamingMetricsTests(TestCase):
+    """本文を読み切ったときに集計すること"""
+
+    def setUp(self):
+        registry.clear()
+        self.addCleanup(registry.clear)
+        self.user = User.objects.create_user(username='owner', password='password')
+        project = Project.objects.create(user=self.user, title='プロジェクト')
+        Node.objects.bulk_create([Node(project=project, title=f'要素{i}') for i in range(3)])
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_queries_while_streaming_are_counted(self):
+        response = self.client.get('/api/v1/export/')
+        self.assertTrue(response.streaming)
+        before = response.request_metrics.db_queries
+        self.assertNotIn('route="export', registry.render())
+
+        b''.join(response.streaming_content)
+        self.assertGreater(response.request_metrics.db_queries, before)
+        self.assertIn('stream', response.request_metrics.timings)
+        self.assertIn('route="export', registry.render())
+
+
+class MetricsAccessTests(TestCase):
+    """METRICS_TOKEN が無いときは同じホストからかスタッフだけに返す"""
+
+    @override_settings(METRICS_TOKEN='')
+    def test_remote_caller_denied_without_token(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_local_caller_allowed_without_token(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_staff_allowed_without_token(self):
+        staff = User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret', REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 200)
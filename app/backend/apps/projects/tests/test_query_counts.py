@@ -0,0 +1,363 @@
+"""
+APIのSQL件数のテスト
+
+データ量（1 / 100 / 1000 件）を変えても各エンドポイントのSQL件数が変わらない（N+1 が無い）ことを確かめる。
+件数ごとに別のユーザーのデータを作り、最初の件数で数えたSQL件数を残りの件数で assertNumQueries する。
+GET は同じリクエストでプロセス内のキャッシュ（グラフ・レイアウト・類似度インデックスなど）を
+温めてから数え、書き込みはキャッシュを空にした状態から数える。
+
+周番号・ステップ種別はプロジェクト・周ごとに5つまでなので、周・ステップは最大5件にして、
+その下のノードを増やす。
+"""
+import json
+import uuid
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.auth.cache import user_cache
+from apps.projects import similarity
+from apps.projects.dedup import update_signatures
+from apps.projects.graph_engine import graph_cache
+from apps.projects.models import Node, NodeLink, ProcessStep, Project, Round
+from apps.projects.sync import project_owner, record_changes
+
+SIZES = (1, 100, 1000)
+# 一括登録・インポートで送る件数（SQLite は1文のパラメータ数の上限で INSERT を分けるので、既存のデータ量だけを変える）
+PAYLOAD_SIZE = 100
+STEP_TYPES = [step_type for step_type, _ in ProcessStep.STEP_TYPE_CHOICES]
+DUPLICATE_CONTEXT = 'ユーザーの検索履歴を集計して画面に通知する仕組みを作る。週ごとの傾向を分析し、改善の優先度を決める。'
+
+
+def reset_process_caches():
+    """プロセス内のキャッシュを空にする（件数ごとに同じ状態から数える）"""
+    user_cache.clear()
+    graph_cache.clear()
+    project_owner.cache_clear()
+    cache.clear()
+    similarity._index = None
+
+
+class Dataset:
+    """1ユーザー分のデータ（プロジェクト・ノード・グローバルノードがそれぞれ size 件）"""
+
+    def __init__(self, size):
+        self.size = size
+        self.user = User.objects.create_user(username=f'user-{uuid.uuid4().hex[:12]}', password='password')
+        self.projects = Project.objects.bulk_create(
+            [Project(user=self.user, title=f'プロジェクト{i}') for i in range(size)]
+        )
+        self.project = self.projects[0]
+        self.rounds = Round.objects.bulk_create(
+            [Round(project=self.project, round_number=i + 1) for i in range(min(size, 5))]
+        )
+        self.round = self.rounds[0]
+        self.steps = ProcessStep.objects.bulk_create([
+            ProcessStep(project=self.project, round=self.round, step_type=step_type, content=f'{step_type}の内容')
+            for step_type in STEP_TYPES[:size]
+        ])
+        self.step = self.steps[0]
+        self.nodes = Node.objects.bulk_create([
+            Node(
+                project=self.project,
+                round=self.round,
+                step=self.steps[i % len(self.steps)],
+                title=f'要素{i}',
+                context=f'要素{i}の文脈'
+            )
+            for i in range(size)
+        ])
+        self.node = self.nodes[0]
+        self.global_nodes = Node.objects.bulk_create([Node(title=f'共通の要素{i}') for i in range(size)])
+        # リンクの無い重複ノードの組
+        self.duplicates = Node.objects.bulk_create(
+            [Node(project=self.project, title='検索履歴の集計', context=DUPLICATE_CONTEXT) for _ in range(2)]
+        )
+        # 先頭のノードから他の全ノードへのリンク（リンク一覧・近傍が件数分になる）と、
+        # 各ノードからグローバルノードへのリンク
+        self.links = NodeLink.objects.bulk_create(
+            [NodeLink(from_node=self.node, to_node=node, weight='0.5') for node in self.nodes[1:]]
+            + [
+                NodeLink(from_node=node, to_node=global_node, weight='0.3')
+                for node, global_node in zip(self.nodes, self.global_nodes)
+            ]
+        )
+        self.link = self.links[-1]
+
+        # bulk_create はシグナルを通らないので差分同期の変更履歴は直接記録する。
+        # 同期の最初のページに全ての種別が入るように、種別ごとに1件ずつ先に記録する
+        changes = (
+            ('project', self.projects),
+            ('round', self.rounds),
+            ('step', self.steps),
+            ('node', self.nodes + self.duplicates),
+            ('link', self.links),
+        )
+        for kind, objs in changes:
+            record_changes(kind, [(obj.pk, self.user.pk) for obj in objs[:1]])
+        for kind, objs in changes:
+            record_changes(kind, [(obj.pk, self.user.pk) for obj in objs[1:]])
+        record_changes('node', [(node.pk, None) for node in self.global_nodes])
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+
+def get(url):
+    """url(data) をGETする関数（ストリーミングのレスポンスは読み切る）"""
+    def send(data):
+        response = data.client.get(url(data))
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+    return send
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class QueryCountTests(TestCase):
+    """データ量に依らずSQL件数が一定であること"""
+
+    def assertConstantQueries(self, send, prepare=None, sizes=SIZES):
+        """件数ごとのデータで send(data) のSQL件数が同じであることを確かめる（prepare(data) は数えない）"""
+        expected = None
+        for size in sizes:
+            with self.subTest(size=size), transaction.atomic():
+                reset_process_caches()
+                data = Dataset(size)
+                if prepare is not None:
+                    prepare(data)
+                if expected is None:
+                    with CaptureQueriesContext(connection) as queries:
+                        response = send(data)
+                    expected = len(queries)
+                else:
+                    with self.assertNumQueries(expected):
+                        response = send(data)
+                self.assertLess(response.status_code, 300, getattr(response, 'data', None))
+                transaction.set_rollback(True)
+
+    def assertConstantGetQueries(self, url, sizes=SIZES):
+        send = get(url)
+        self.assertConstantQueries(send, prepare=send, sizes=sizes)
+
+    # プロジェクト
+
+    def test_project_list(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/projects/')
+
+    def test_project_detail(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/projects/{data.project.pk}/')
+
+    def test_project_snapshot(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/projects/{data.project.pk}/snapshot/')
+
+    def test_project_rounds(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/projects/{data.project.pk}/rounds/')
+
+    def test_project_nodes(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/projects/{data.project.pk}/nodes/?omit=')
+
+    def test_project_nodes_with_rank(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/projects/{data.project.pk}/nodes/?rank=true')
+
+    def test_project_nodes_ordered_by_rank(self):
+        self.assertConstantGetQueries(
+            lambda data: f'/api/v1/projects/{data.project.pk}/nodes/?rank=true&ordering=rank'
+        )
+
+    def test_project_graph(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/projects/{data.project.pk}/graph/?rank=true')
+
+    def test_project_graph_summary(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/projects/{data.project.pk}/graph/?level=0')
+
+    def test_project_graph_cluster(self):
+        # ノード1件のプロジェクトにはコミュニティの階層が無い
+        self.assertConstantGetQueries(
+            lambda data: f'/api/v1/projects/{data.project.pk}/graph/?cluster=0:0',
+            sizes=SIZES[1:]
+        )
+
+    def test_project_cycles(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/projects/{data.project.pk}/cycles/')
+
+    def test_project_centrality(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/projects/{data.project.pk}/centrality/')
+
+    def test_project_create(self):
+        self.assertConstantQueries(
+            lambda data: data.client.post('/api/v1/projects/', {'title': '新しいプロジェクト'}, format='json')
+        )
+
+    def test_project_update(self):
+        self.assertConstantQueries(
+            lambda data: data.client.patch(f'/api/v1/projects/{data.project.pk}/', {'title': '変更'}, format='json')
+        )
+
+    def test_round_create(self):
+        # 最後のプロジェクトには第1周までしか無い
+        self.assertConstantQueries(
+            lambda data: data.client.post(
+                f'/api/v1/projects/{data.projects[-1].pk}/rounds/', {'round_number': 2}, format='json'
+            )
+        )
+
+    # 周・ステップ
+
+    def test_round_list(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/rounds/')
+
+    def test_round_detail(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/rounds/{data.round.pk}/')
+
+    def test_round_steps(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/rounds/{data.round.pk}/steps/?omit=')
+
+    def test_round_update(self):
+        self.assertConstantQueries(
+            lambda data: data.client.patch(f'/api/v1/rounds/{data.round.pk}/', {'note': 'メモ'}, format='json')
+        )
+
+    def test_step_create(self):
+        # 最後の周には俯瞰のステップまでしか無い
+        self.assertConstantQueries(
+            lambda data: data.client.post(
+                f'/api/v1/rounds/{data.rounds[-1].pk}/steps/',
+                {'step_type': 'expand', 'content': '拡張余地'},
+                format='json'
+            )
+        )
+
+    def test_step_list(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/steps/')
+
+    def test_step_detail(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/steps/{data.step.pk}/')
+
+    # ノード・リンク
+
+    def test_node_list(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/nodes/')
+
+    def test_node_detail(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/nodes/{data.node.pk}/')
+
+    def test_global_nodes(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/nodes/global_nodes/')
+
+    def test_node_links(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/nodes/{data.node.pk}/links/')
+
+    def test_node_neighborhood(self):
+        self.assertConstantGetQueries(
+            lambda data: f'/api/v1/nodes/{data.node.pk}/neighborhood/?depth=2&direction=both'
+        )
+
+    def test_node_suggestions(self):
+        # 重複ノードの組は互いに候補になる（候補が無いとノードを読むクエリが省かれる）
+        self.assertConstantGetQueries(lambda data: f'/api/v1/nodes/{data.duplicates[0].pk}/suggestions/')
+
+    def test_duplicates(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/nodes/duplicates/?project={data.project.pk}')
+
+    def test_duplicates_merge(self):
+        self.assertConstantQueries(
+            lambda data: data.client.post(
+                '/api/v1/nodes/duplicates/',
+                {'project': str(data.project.pk), 'clusters': [[str(node.pk) for node in data.duplicates]]},
+                format='json'
+            ),
+            prepare=lambda data: update_signatures(Q(pk__in=[node.pk for node in data.duplicates]))
+        )
+
+    def test_node_create(self):
+        self.assertConstantQueries(
+            lambda data: data.client.post(
+                '/api/v1/nodes/',
+                {'title': '新しいノード', 'project_id': str(data.project.pk), 'round_id': str(data.round.pk)},
+                format='json'
+            )
+        )
+
+    def test_node_update(self):
+        self.assertConstantQueries(
+            lambda data: data.client.patch(f'/api/v1/nodes/{data.node.pk}/', {'title': '変更'}, format='json')
+        )
+
+    def test_node_delete(self):
+        self.assertConstantQueries(lambda data: data.client.delete(f'/api/v1/nodes/{data.duplicates[0].pk}/'))
+
+    def test_node_bulk(self):
+        def send(data):
+            nodes = [
+                {'temp_id': f'n{i}', 'project_id': str(data.project.pk), 'title': f'一括{i}'}
+                for i in range(PAYLOAD_SIZE)
+            ]
+            links = [{'from_node_id': f'n{i}', 'to_node_id': f'n{i + 1}'} for i in range(PAYLOAD_SIZE - 1)]
+            links.append({'from_node_id': 'n0', 'to_node_id': str(data.node.pk)})
+            return data.client.post('/api/v1/nodes/bulk/', {'nodes': nodes, 'links': links}, format='json')
+        self.assertConstantQueries(send)
+
+    def test_link_create(self):
+        self.assertConstantQueries(
+            lambda data: data.client.post(
+                f'/api/v1/nodes/{data.duplicates[0].pk}/links/',
+                {'to_node_id': str(data.node.pk), 'weight': 0.5},
+                format='json'
+            )
+        )
+
+    def test_link_delete(self):
+        self.assertConstantQueries(
+            lambda data: data.client.delete(
+                f'/api/v1/nodes/{data.link.from_node_id}/links/', {'link_id': str(data.link.pk)}, format='json'
+            )
+        )
+
+    # 検索・同期・エクスポート／インポート
+
+    @skipUnless(connection.vendor == 'postgresql', '全文検索は PostgreSQL の機能を使う')
+    def test_search(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/search/?q=要素')
+
+    def test_sync_changes(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/sync/changes/')
+
+    def test_export(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/export/')
+
+    def test_import(self):
+        def send(data):
+            lines = [
+                json.dumps({'type': 'node', 'id': str(uuid.uuid4()), 'project_id': str(data.project.pk), 'title': f'取り込み{i}'})
+                for i in range(PAYLOAD_SIZE)
+            ]
+            return data.client.post('/api/v1/import/', '\n'.join(lines), content_type='application/x-ndjson')
+        self.assertConstantQueries(send)
+
+    # async 版の読み取りAPI
+
+    def test_async_project_list(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/async/projects/')
+
+    def test_async_project_nodes(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/async/projects/{data.project.pk}/nodes/')
+
+    def test_async_project_rounds(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/async/projects/{data.project.pk}/rounds/')
+
+    def test_async_round_steps(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/async/rounds/{data.round.pk}/steps/')
+
+    def test_async_global_nodes(self):
+        self.assertConstantGetQueries(lambda data: '/api/v1/async/nodes/global_nodes/')
+
+    def test_async_node_links(self):
+        self.assertConstantGetQueries(lambda data: f'/api/v1/async/nodes/{data.node.pk}/links/')
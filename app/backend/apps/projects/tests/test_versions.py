@@ -0,0 +1,119 @@
+"""
+プロセス間で共有するバージョン番号のテスト
+
+CACHES['default'] を file バックエンドにして、別のプロセスを同じ保存先に繋いだ
+2つ目のキャッシュインスタンスで表す。そちらで進めたバージョンをこのプロセスが見て、
+プロセス内に持っているグラフを作り直し、新しいスナップショットを返すことを確かめる。
+"""
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.test import TestCase, override_settings
+
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.projects import versions
+from apps.projects.graph_engine import GRAPH_VERSION_NAMESPACE, get_project_graph, graph_cache
+from apps.projects.models import Node, NodeLink, Project, Round
+from apps.projects.snapshot import SNAPSHOT_VERSION_NAMESPACE
+
+
+class SharedVersionTests(TestCase):
+    """別のプロセスが進めたバージョンで、このプロセスのキャッシュが古くなること"""
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, True)
+        shared = override_settings(CACHES={
+            **settings.CACHES,
+            DEFAULT_CACHE_ALIAS: {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            },
+        })
+        shared.enable()
+        self.addCleanup(shared.disable)
+        graph_cache.clear()
+        self.addCleanup(graph_cache.clear)
+
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.project = Project.objects.create(user=self.user, title='プロジェクト')
+        self.nodes = Node.objects.bulk_create([Node(project=self.project, title=f'要素{i}') for i in range(3)])
+        self.link = NodeLink.objects.create(from_node=self.nodes[0], to_node=self.nodes[1], weight='0.5')
+
+    def bump_in_other_process(self, namespace):
+        """同じ保存先に繋いだ別のキャッシュインスタンスでバージョンを進める"""
+        other = caches.create_connection(DEFAULT_CACHE_ALIAS)
+        self.assertIsNot(other, caches[DEFAULT_CACHE_ALIAS])
+        with mock.patch.object(versions, 'cache', other):
+            return versions.bump_version(namespace, self.project.pk)
+
+    def test_version_bumped_by_other_process_is_visible(self):
+        version = versions.get_version(GRAPH_VERSION_NAMESPACE, self.project.pk)
+        previous, bumped = self.bump_in_other_process(GRAPH_VERSION_NAMESPACE)
+        self.assertEqual(previous, version)
+        self.assertNotEqual(bumped, version)
+        self.assertEqual(versions.get_version(GRAPH_VERSION_NAMESPACE, self.project.pk), bumped)
+
+    def test_graph_rebuilt_after_other_process_bumps(self):
+        graph = get_project_graph(self.project.pk)
+        self.assertIs(get_project_graph(self.project.pk), graph)
+
+        # 他のプロセスでリンクを追加した（このプロセスのグラフには無い）
+        NodeLink.objects.bulk_create([NodeLink(from_node=self.nodes[1], to_node=self.nodes[2])])
+        self.bump_in_other_process(GRAPH_VERSION_NAMESPACE)
+
+        rebuilt = get_project_graph(self.project.pk)
+        self.assertIsNot(rebuilt, graph)
+        self.assertEqual(rebuilt.n_edges, 2)
+
+    def change_weight(self, weight):
+        """このプロセスでリンクの重みを変える（キャッシュ済みのグラフにその場で適用される）"""
+        self.link.weight = weight
+        with self.captureOnCommitCallbacks(execute=True):
+            self.link.save()
+
+    def test_patch_discarded_when_other_process_bumped_first(self):
+        graph = get_project_graph(self.project.pk)
+        NodeLink.objects.bulk_create([NodeLink(from_node=self.nodes[1], to_node=self.nodes[2])])
+        self.bump_in_other_process(GRAPH_VERSION_NAMESPACE)
+
+        # 取りこぼしたリンクがあるのでその場で適用せず、作り直させる
+        # （コミット後のレイアウトの計算で作り直したグラフがキャッシュに入る）
+        self.change_weight('0.9')
+        self.assertIsNot(graph_cache.peek(self.project.pk), graph)
+        self.assertEqual(get_project_graph(self.project.pk).n_edges, 2)
+
+    def test_patch_applied_without_other_process(self):
+        graph = get_project_graph(self.project.pk)
+        self.change_weight('0.9')
+        # 作り直さずに（DBを読まずに）複製へ適用したグラフに差し替わり、元のグラフは書き換えない
+        with self.assertNumQueries(0):
+            patched = get_project_graph(self.project.pk)
+        self.assertIsNot(patched, graph)
+        self.assertAlmostEqual(float(patched.weights[0]), 0.9, places=5)
+        self.assertAlmostEqual(float(graph.weights[0]), 0.5, places=5)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_snapshot_refreshed_after_other_process_bumps(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        url = f'/api/v1/projects/{self.project.pk}/snapshot/'
+        response = client.get(url)
+        self.assertEqual(response.data['rounds'], [])
+        etag = response['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # 他のプロセスで周を追加した
+        Round.objects.bulk_create([Round(project=self.project, round_number=1)])
+        self.bump_in_other_process(SNAPSHOT_VERSION_NAMESPACE)
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['round_number'] for item in response.data['rounds']], [1])
+        self.assertNotEqual(response['ETag'], etag)
@@ -0,0 +1,421 @@
+"""
+ユーザーの全データのエクスポート／インポート（NDJSON）
+
+エクスポートはプロジェクト → 周 → ステップ → ノード → リンクの順に1行1レコードで
+逐次書き出す。行はモデルインスタンスやDRFシリアライザーを経由せずに .values() の
+イテレーターから直接作るので、データ量に関わらずサーバーのメモリ使用量は一定。
+
+インポートは1行ずつ読み、IMPORT_BATCH_SIZE 行ごとに1トランザクションで
+bulk_create する。親レコードは同じバッチか先のバッチで登録済みである必要がある
+（エクスポートの出力順ならそうなる）。既に存在するIDの行は上書きせずにスキップする。
+IDが新しくても一意制約（プロジェクト内の周番号、リンクの両端）に反する行は登録せず、
+行番号付きでエラーに記録する。
+"""
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers
+
+from apps.core.response_cache import tag
+
+from .models import Node, NodeLink, ProcessStep, Project, Round
+from .signals import bulk_written, responses_changed
+from .sync import record_changes
+
+EXPORT_FORMAT_VERSION = 1
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+MAX_IMPORT_ERRORS = 100
+
+# 出力順（インポート時は親から順に登録する）
+RECORD_TYPES = ('project', 'round', 'step', 'node', 'link')
+
+EXPORT_FIELDS = {
+    'project': ('id', 'title', 'status', 'created_at', 'updated_at'),
+    'round': ('id', 'project_id', 'round_number', 'note', 'created_at', 'updated_at'),
+    'step': ('id', 'project_id', 'round_id', 'step_type', 'content', 'created_at', 'updated_at'),
+    'node': ('id', 'project_id', 'round_id', 'step_id', 'title', 'context', 'created_at', 'updated_at'),
+    'link': ('id', 'from_node_id', 'to_node_id', 'weight', 'created_at', 'updated_at'),
+}
+
+
+def export_querysets(user):
+    """種別ごとのエクスポート対象（ユーザーのプロジェクト配下）"""
+    return {
+        'project': Project.objects.filter(user=user),
+        'round': Round.objects.filter(project__user=user),
+        'step': ProcessStep.objects.filter(project__user=user),
+        'node': Node.objects.filter(project__user=user),
+        # グローバルノードとのリンクも含める（グローバルノード自体は含めない）
+        'link': NodeLink.objects.filter(
+            Q(from_node__project__user=user) | Q(to_node__project__user=user)
+        ),
+    }
+
+
+class _ExportEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder はミリ秒に丸めるので、並び順が変わらないようマイクロ秒まで残す
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _dumps(record):
+    return json.dumps(record, cls=_ExportEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_export(user, chunk_size=EXPORT_CHUNK_SIZE):
+    """ユーザーの全データをNDJSONとして逐次生成する"""
+    yield (_dumps({
+        'type': 'meta',
+        'version': EXPORT_FORMAT_VERSION,
+        'exported_at': timezone.now(),
+    }) + '\n').encode('utf-8')
+
+    for record_type, queryset in export_querysets(user).items():
+        fields = EXPORT_FIELDS[record_type]
+        rows = queryset.order_by('created_at', 'id').values_list(*fields).iterator(chunk_size=chunk_size)
+        buffer = []
+        for row in rows:
+            record = {'type': record_type}
+            record.update(zip(fields, row))
+            buffer.append(_dumps(record))
+            if len(buffer) >= chunk_size:
+                yield ('\n'.join(buffer) + '\n').encode('utf-8')
+                buffer = []
+        if buffer:
+            yield ('\n'.join(buffer) + '\n').encode('utf-8')
+
+
+class _ImportRecordSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    created_at = serializers.DateTimeField(required=False)
+    updated_at = serializers.DateTimeField(required=False)
+
+
+class ImportProjectSerializer(_ImportRecordSerializer):
+    title = serializers.CharField(max_length=255)
+    status = serializers.ChoiceField(choices=Project.STATUS_CHOICES, default='active')
+
+
+class ImportRoundSerializer(_ImportRecordSerializer):
+    project_id = serializers.UUIDField()
+    round_number = serializers.IntegerField(min_value=1, max_value=5)
+    note = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class ImportStepSerializer(_ImportRecordSerializer):
+    round_id = serializers.UUIDField()
+    step_type = serializers.ChoiceField(choices=ProcessStep.STEP_TYPE_CHOICES)
+    content = serializers.CharField(allow_blank=True)
+
+
+class ImportNodeSerializer(_ImportRecordSerializer):
+    project_id = serializers.UUIDField(required=False, allow_null=True)
+    round_id = serializers.UUIDField(required=False, allow_null=True)
+    step_id = serializers.UUIDField(required=False, allow_null=True)
+    title = serializers.CharField(max_length=255)
+    context = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class ImportLinkSerializer(_ImportRecordSerializer):
+    from_node_id = serializers.UUIDField()
+    to_node_id = serializers.UUIDField()
+    weight = serializers.DecimalField(max_digits=3, decimal_places=1, min_value=0.1, max_value=1.0, default=0.5)
+
+
+IMPORT_SERIALIZERS = {
+    'project': ImportProjectSerializer,
+    'round': ImportRoundSerializer,
+    'step': ImportStepSerializer,
+    'node': ImportNodeSerializer,
+    'link': ImportLinkSerializer,
+}
+
+# 一意制約に反して登録されなかった行のエラー
+CONFLICT_MESSAGES = {
+    'round': '同じ周番号の周が既にあります',
+    'link': '同じノード間のリンクが既にあります',
+}
+
+IMPORT_MODELS = {
+    'project': Project,
+    'round': Round,
+    'step': ProcessStep,
+    'node': Node,
+    'link': NodeLink,
+}
+
+
+def import_ndjson(user, lines, batch_size=IMPORT_BATCH_SIZE):
+    """
+    NDJSONの行（bytes または str）を読み込んで登録する
+
+    不正な行はスキップして行番号付きでエラーに記録し、残りの行は続けて取り込む。
+    """
+    importer = _Importer(user)
+    batch = []
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                importer.error(number, 'UTF-8として解釈できません')
+                continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            importer.error(number, 'JSONとして解釈できません')
+            continue
+        record_type = record.get('type') if isinstance(record, dict) else None
+        if record_type == 'meta':
+            continue
+        if record_type not in IMPORT_SERIALIZERS:
+            importer.error(number, f'不明な種別です: {record_type}')
+            continue
+        batch.append((number, record_type, record))
+        if len(batch) >= batch_size:
+            importer.flush(batch)
+            batch = []
+    if batch:
+        importer.flush(batch)
+    return importer.summary()
+
+
+class _Importer:
+    """バッチ単位の登録と結果の集計"""
+
+    def __init__(self, user):
+        self.user = user
+        self.imported = {record_type: 0 for record_type in RECORD_TYPES}
+        self.skipped = 0
+        self.errors = []
+        self.error_count = 0
+
+    def error(self, number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append({'line': number, 'message': message})
+
+    def summary(self):
+        return {
+            'imported': {f'{record_type}s': count for record_type, count in self.imported.items()},
+            'skipped': self.skipped,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    def flush(self, batch):
+        by_type = {record_type: [] for record_type in RECORD_TYPES}
+        for number, record_type, record in batch:
+            serializer = IMPORT_SERIALIZERS[record_type](data=record)
+            if not serializer.is_valid():
+                self.error(number, json.dumps(serializer.errors, ensure_ascii=False))
+                continue
+            by_type[record_type].append((number, serializer.validated_data))
+
+        touched = set()
+        tags = {tag('user', self.user.pk)}
+        with transaction.atomic():
+            for record_type in RECORD_TYPES:
+                rows = self._skip_existing(record_type, by_type[record_type])
+                if not rows:
+                    continue
+                objs = getattr(self, f'_build_{record_type}s')(rows)
+                numbers = {data['id']: number for number, data in rows}
+                self._insert(record_type, objs, numbers, touched, tags)
+            for project_id in touched - {None}:
+                transaction.on_commit(lambda project_id=project_id: bulk_written(project_id))
+            responses_changed(*tags)
+
+    def _skip_existing(self, record_type, rows):
+        """既に存在するIDの行と、同じバッチで2回目以降のIDの行を除く（1クエリ）"""
+        if not rows:
+            return rows
+        existing = set(
+            IMPORT_MODELS[record_type].objects.filter(
+                pk__in=[data['id'] for _, data in rows]
+            ).values_list('pk', flat=True)
+        )
+        kept = []
+        for number, data in rows:
+            if data['id'] in existing:
+                self.skipped += 1
+                continue
+            existing.add(data['id'])
+            kept.append((number, data))
+        return kept
+
+    def _insert(self, record_type, objs, numbers, touched, tags):
+        """
+        bulk_create して、エクスポート元の作成・更新日時を書き戻す（touched と tags に影響先を加える）
+
+        一意制約に反した行は ignore_conflicts で登録されないので、登録後にIDを読み直して
+        登録できた行だけを集計・変更履歴の対象にする。
+        """
+        if not objs:
+            return
+        model = IMPORT_MODELS[record_type]
+        model.objects.bulk_create([obj for obj, _ in objs], batch_size=IMPORT_BATCH_SIZE, ignore_conflicts=True)
+        inserted = set(
+            model.objects.filter(pk__in=[obj.pk for obj, _ in objs]).values_list('pk', flat=True)
+        )
+        if len(inserted) < len(objs):
+            message = CONFLICT_MESSAGES.get(record_type, '既存のデータと重複しています')
+            for obj, _ in objs:
+                if obj.pk not in inserted:
+                    self.error(numbers[obj.pk], message)
+            objs = [(obj, data) for obj, data in objs if obj.pk in inserted]
+            if not objs:
+                return
+
+        # auto_now / auto_now_add は bulk_create で現在時刻になるので、指定があれば戻す
+        restored = []
+        for obj, data in objs:
+            if data.get('created_at') or data.get('updated_at'):
+                obj.created_at = data.get('created_at') or obj.created_at
+                obj.updated_at = data.get('updated_at') or obj.updated_at
+                restored.append(obj)
+        if restored:
+            model.objects.bulk_update(restored, ['created_at', 'updated_at'], batch_size=IMPORT_BATCH_SIZE)
+
+        self.imported[record_type] += len(objs)
+        if record_type == 'link':
+            touched.update(obj._graph_project_id for obj, _ in objs)
+            owned = [obj._owned for obj, _ in objs]
+            # 既存ノードのリンク一覧にも加わる
+            tags.update(tag('node', node_id) for obj, _ in objs for node_id in (obj.from_node_id, obj.to_node_id))
+        else:
+            project_ids = [obj.pk if record_type == 'project' else obj.project_id for obj, _ in objs]
+            touched.update(project_ids)
+            owned = [project_id is not None for project_id in project_ids]
+            if record_type == 'step':
+                tags.update(tag('round', obj.round_id) for obj, _ in objs)
+            elif record_type == 'node' and not all(owned):
+                tags.add(tag('project', None))
+        # 両端ともグローバルノードのリンクなどは全ユーザーの同期対象
+        record_changes(
+            record_type,
+            [(obj.pk, self.user.pk if is_owned else None) for (obj, _), is_owned in zip(objs, owned)]
+        )
+
+    def _build_projects(self, rows):
+        return [
+            (Project(id=data['id'], user=self.user, title=data['title'], status=data['status']), data)
+            for _, data in rows
+        ]
+
+    def _build_rounds(self, rows):
+        projects = set(
+            Project.objects.filter(
+                user=self.user, pk__in={data['project_id'] for _, data in rows}
+            ).values_list('pk', flat=True)
+        )
+        objs = []
+        for number, data in rows:
+            if data['project_id'] not in projects:
+                self.error(number, 'Project not found')
+                continue
+            objs.append((Round(
+                id=data['id'],
+                project_id=data['project_id'],
+                round_number=data['round_number'],
+                note=data.get('note')
+            ), data))
+        return objs
+
+    def _build_steps(self, rows):
+        rounds = dict(
+            Round.objects.filter(
+                project__user=self.user, pk__in={data['round_id'] for _, data in rows}
+            ).values_list('pk', 'project_id')
+        )
+        objs = []
+        for number, data in rows:
+            if data['round_id'] not in rounds:
+                self.error(number, 'Round not found')
+                continue
+            objs.append((ProcessStep(
+                id=data['id'],
+                project_id=rounds[data['round_id']],
+                round_id=data['round_id'],
+                step_type=data['step_type'],
+                content=data['content']
+            ), data))
+        return objs
+
+    def _build_nodes(self, rows):
+        def ids(field):
+            return {data[field] for _, data in rows if data.get(field)}
+
+        projects = set(
+            Project.objects.filter(user=self.user, pk__in=ids('project_id')).values_list('pk', flat=True)
+        )
+        rounds = dict(
+            Round.objects.filter(project__user=self.user, pk__in=ids('round_id')).values_list('pk', 'project_id')
+        )
+        steps = {
+            pk: (round_id, project_id)
+            for pk, round_id, project_id in ProcessStep.objects.filter(
+                project__user=self.user, pk__in=ids('step_id')
+            ).values_list('pk', 'round_id', 'project_id')
+        }
+        objs = []
+        for number, data in rows:
+            project_id = data.get('project_id')
+            round_id = data.get('round_id')
+            step_id = data.get('step_id')
+            if project_id and project_id not in projects:
+                self.error(number, 'Project not found')
+                continue
+            if round_id and round_id not in rounds:
+                self.error(number, 'Round not found')
+                continue
+            if step_id and step_id not in steps:
+                self.error(number, 'ProcessStep not found')
+                continue
+            if step_id:
+                round_id = round_id or steps[step_id][0]
+                project_id = project_id or steps[step_id][1]
+            if round_id in rounds:
+                project_id = project_id or rounds[round_id]
+            objs.append((Node(
+                id=data['id'],
+                project_id=project_id,
+                round_id=round_id,
+                step_id=step_id,
+                title=data['title'],
+                context=data.get('context')
+            ), data))
+        return objs
+
+    def _build_links(self, rows):
+        node_ids = {data[field] for _, data in rows for field in ('from_node_id', 'to_node_id')}
+        nodes = dict(
+            Node.objects.filter(
+                Q(project__user=self.user) | Q(project__isnull=True), pk__in=node_ids
+            ).values_list('pk', 'project_id')
+        )
+        objs = []
+        for number, data in rows:
+            from_id, to_id = data['from_node_id'], data['to_node_id']
+            if from_id not in nodes or to_id not in nodes:
+                self.error(number, 'Node not found')
+                continue
+            if from_id == to_id:
+                self.error(number, '同じノード同士はリンクできません')
+                continue
+            link = NodeLink(id=data['id'], from_node_id=from_id, to_node_id=to_id, weight=data['weight'])
+            # 両端が同じプロジェクトのリンクだけがプロジェクトのグラフに含まれる
+            link._graph_project_id = nodes[from_id] if nodes[from_id] == nodes[to_id] else None
+            link._owned = bool(nodes[from_id] or nodes[to_id])
+            objs.append((link, data))
+        return objs
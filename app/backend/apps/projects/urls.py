@@ -1,10 +1,16 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     ProjectViewSet,
     RoundViewSet,
     ProcessStepViewSet,
-    NodeViewSet
+    NodeViewSet,
+    SearchView,
+    SyncChangesView,
+    ExportView,
+    ImportView,
+    graph_cache_stats_view
 )
 
 # プロジェクト用のルーター
@@ -42,3 +48,37 @@ step_urlpatterns = [
 node_urlpatterns = [
     path('', include(node_router.urls)),
 ]
+
+# 検索用のURL（/search/ でアクセス）
+search_urlpatterns = [
+    path('', SearchView.as_view(), name='search'),
+]
+
+# 差分同期用のURL（/sync/ でアクセス）
+sync_urlpatterns = [
+    path('changes/', SyncChangesView.as_view(), name='sync_changes'),
+]
+
+# エクスポート・インポート用のURL（/export/, /import/ でアクセス）
+export_urlpatterns = [
+    path('', ExportView.as_view(), name='export'),
+]
+
+import_urlpatterns = [
+    path('', ImportView.as_view(), name='import'),
+]
+
+# 読み取りAPIの async 版（/async/ でアクセス）
+async_urlpatterns = [
+    path('projects/', async_views.project_list, name='async_project_list'),
+    path('projects/<uuid:pk>/nodes/', async_views.project_nodes, name='async_project_nodes'),
+    path('projects/<uuid:pk>/rounds/', async_views.project_rounds, name='async_project_rounds'),
+    path('rounds/<uuid:pk>/steps/', async_views.round_steps, name='async_round_steps'),
+    path('nodes/global_nodes/', async_views.global_nodes, name='async_global_nodes'),
+    path('nodes/<uuid:pk>/links/', async_views.node_links, name='async_node_links'),
+]
+
+# グラフキャッシュ用のURL（/graph-cache/ でアクセス）
+graph_cache_urlpatterns = [
+    path('stats/', graph_cache_stats_view, name='graph_cache_stats'),
+]
@@ -0,0 +1,39 @@
+"""
+プロジェクト単位のバージョン番号（Djangoキャッシュ上で管理）
+
+プロセス内キャッシュやキャッシュキーの鮮度判定に使う。子レコードへの書き込み時に
+signals から bump_version を呼ぶ。CACHES['default'] はプロセス間で共有するキャッシュ
+（file / db）なので、あるワーカーが進めたバージョンを他のワーカーと async 版も見る。
+
+file / db バックエンドの incr はアトミックでないので、進めるたびに前の値より大きい
+新しい値（時刻）を書き込む。同時に進めても値は重ならず、どちらかの値が残る。
+"""
+import time
+
+from django.core.cache import cache
+
+
+def _key(namespace, project_id):
+    return f'projects:{namespace}:version:{project_id}'
+
+
+def get_version(namespace, project_id):
+    """現在のバージョン番号を返す"""
+    key = _key(namespace, project_id)
+    version = cache.get(key)
+    if version is None:
+        # キーが追い出された後も過去の番号と衝突しないよう時刻から始める
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, project_id):
+    """バージョン番号を進めて (前の番号, 新しい番号) を返す"""
+    key = _key(namespace, project_id)
+    previous = cache.get(key)
+    version = time.time_ns()
+    if previous is not None and version <= previous:
+        version = previous + 1
+    cache.set(key, version, timeout=None)
+    return previous, version
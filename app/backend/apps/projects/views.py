@@ -1,33 +1,150 @@
+import uuid
+from decimal import Decimal, InvalidOperation
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.utils.urls import replace_query_param
 from django.shortcuts import get_object_or_404
 from django.db import IntegrityError
+from django.db.models import Q
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from apps.core.conditional import Validators, queryset_fingerprint
+from apps.core.pagination import InMemoryPagination, KeysetPagination
+from apps.core.params import is_true
+from apps.core.renderers import FastJSONRenderer, NDJSONRenderer
+from apps.core.response_cache import CachedResponseMixin, tag
+from apps.core.sparse import SparseFieldsMixin, select_fields
 from .models import Project, Round, ProcessStep, Node, NodeLink
 from .serializers import (
     ProjectSerializer,
     RoundSerializer,
     ProcessStepSerializer,
     NodeSerializer,
-    NodeLinkSerializer
+    NodeLinkSerializer,
+    ProjectValuesSerializer,
+    RoundValuesSerializer,
+    ProcessStepValuesSerializer,
+    NodeValuesSerializer,
+    NodeLinkValuesSerializer
 )
+from .graph import (
+    DEFAULT_NODE_GRAPH_OMIT,
+    MAX_CLUSTER_ITEMS,
+    MAX_NEIGHBORHOOD_DEPTH,
+    MAX_NEIGHBORHOOD_NODES,
+    NEIGHBORHOOD_DIRECTIONS,
+    NODE_GRAPH_FIELDS,
+    NODE_LAYOUT_FIELDS,
+    cluster_graph,
+    iter_project_graph,
+    node_neighborhood,
+    parse_cluster_id,
+    project_edges,
+    project_nodes,
+)
+from .graph_engine import GRAPH_VERSION_NAMESPACE, get_project_graph, graph_cache
+from . import versions
+from .snapshot import STEP_TYPE_ORDER, get_snapshot, snapshot_version
+from .bulk import BulkValidationError, bulk_create_nodes_and_links
+from .sync import MAX_SYNC_CHANGES, InvalidSyncToken, changes_since, parse_token
+from .transfer import import_ndjson, iter_export
+from .analytics import degrees, node_ranks, pagerank, rank_order, rings
+from .layout import current_coordinates, get_project_layout
+from .similarity import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS, suggest_links
+from .dedup import MAX_DUPLICATE_CLUSTERS, InvalidClusters, check_clusters, find_duplicates, merge_duplicates
+from .search import RESULT_TYPES, InvalidCursor, decode_cursor, encode_cursor, search
+
+
+# クエリパラメータで指定できるPageRankの範囲
+MIN_PAGERANK_TOLERANCE = 1e-12
+MAX_PAGERANK_ITER = 1000
+
+
+def pagerank_params(tol=None, max_iter=None):
+    """PageRankの計算パラメータ（未指定なら設定値）"""
+    tol = float(tol) if tol is not None else settings.PAGERANK_TOLERANCE
+    max_iter = int(max_iter) if max_iter is not None else settings.PAGERANK_MAX_ITER
+    if not tol > 0 or max_iter < 1:
+        raise ValueError('invalid pagerank parameters')
+    return {
+        'damping': settings.PAGERANK_DAMPING,
+        'tol': max(tol, MIN_PAGERANK_TOLERANCE),
+        'max_iter': min(max_iter, MAX_PAGERANK_ITER),
+    }
+
+# 一覧で既定で返さない長いテキスト（?omit= で含められる）
+DEFAULT_NODE_OMIT = ('context',)
+DEFAULT_STEP_OMIT = ('content',)
+
+
+def object_tags(kind, pk, *extra):
+    """URLのIDからレスポンスキャッシュのタグを作る（UUIDでなければキャッシュしない）"""
+    try:
+        object_id = uuid.UUID(str(pk))
+    except ValueError:
+        return None
+    return [tag(kind, object_id), *extra]
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ValuesListMixin(SparseFieldsMixin):
+    """一覧（list）を values_serializer_class で返す（?fields= / ?omit= の列だけを取得）"""
+    
+    values_serializer_class = None
+    
+    def list(self, request, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        rows = self.values_serializer_class.values(self.filter_queryset(self.get_queryset()), fields)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.values_serializer_class(page, fields).data)
+        return Response(self.values_serializer_class(rows, fields).data)
+
+
+class ProjectViewSet(CachedResponseMixin, ValuesListMixin, viewsets.ModelViewSet):
     """プロジェクトViewSet"""
     
     serializer_class = ProjectSerializer
+    values_serializer_class = ProjectValuesSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         """現在のユーザーのプロジェクトのみ取得"""
         return Project.objects.filter(user=self.request.user).order_by('-created_at')
     
+    def get_cache_tags(self):
+        """一覧はユーザー、詳細と周・ノード・グラフ類はプロジェクトに依存する"""
+        if self.detail:
+            return object_tags('project', self.kwargs.get('pk'))
+        return [tag('user', self.request.user.pk)]
+    
     def perform_create(self, serializer):
         """プロジェクト作成時にユーザーを設定"""
         serializer.save(user=self.request.user)
     
+    def retrieve(self, request, *args, **kwargs):
+        """プロジェクト詳細を取得（変更が無ければ304）"""
+        project = self.get_object()
+        validators = Validators(request, project.pk, project.updated_at)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        serializer = self.get_serializer(project)
+        return validators.apply(Response(serializer.data))
+    
+    @action(detail=True, methods=['get'])
+    def snapshot(self, request, pk=None):
+        """プロジェクトの周・ステップ・ノードをツリーで一括取得（サーバー側キャッシュ）"""
+        project = self.get_object()
+        version = snapshot_version(project.pk)
+        validators = Validators(request, project.pk, version)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        return validators.apply(Response(get_snapshot(project, version=version)))
+    
     @action(detail=True, methods=['get', 'post'])
     def rounds(self, request, pk=None):
         """プロジェクトの周一覧を取得、または周を作成"""
@@ -35,8 +152,13 @@ class ProjectViewSet(viewsets.ModelViewSet):
         
         if request.method == 'GET':
             rounds = Round.objects.filter(project=project).order_by('round_number')
-            serializer = RoundSerializer(rounds, many=True)
-            return Response(serializer.data)
+            validators = Validators(request, queryset_fingerprint(rounds))
+            not_modified = validators.not_modified(request)
+            if not_modified is not None:
+                return not_modified
+            fields = self.select_values_fields(RoundValuesSerializer)
+            data = RoundValuesSerializer(RoundValuesSerializer.values(rounds, fields), fields).data
+            return validators.apply(Response(data))
         elif request.method == 'POST':
             serializer = RoundSerializer(
                 data=request.data,
@@ -76,15 +198,234 @@ class ProjectViewSet(viewsets.ModelViewSet):
     def nodes(self, request, pk=None):
         """プロジェクトのノード一覧を取得"""
         project = self.get_object()
-        nodes = Node.objects.filter(project=project).order_by('-created_at')
-        serializer = NodeSerializer(nodes, many=True)
-        return Response(serializer.data)
+        nodes = Node.objects.filter(project=project)
+        with_rank = is_true(request.query_params.get('rank'))
+        fields = self.select_values_fields(NodeValuesSerializer, DEFAULT_NODE_OMIT)
+        
+        # project_title を含むのでプロジェクトの更新日時も、
+        # rank を付ける場合はリンクグラフのバージョンもETagに含める
+        validators = Validators(
+            request,
+            project.updated_at,
+            queryset_fingerprint(nodes),
+            versions.get_version(GRAPH_VERSION_NAMESPACE, project.pk) if with_rank else None
+        )
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        
+        # ?rank=true で重み付きPageRankを付与（?ordering=rank で重要度順）
+        if not with_rank:
+            page = self.paginate_queryset(NodeValuesSerializer.values(nodes, fields))
+            return validators.apply(self.get_paginated_response(NodeValuesSerializer(page, fields).data))
+        
+        params = pagerank_params()
+        graph = get_project_graph(project.pk)
+        ranks, _, _ = pagerank(graph, **params)
+        if request.query_params.get('ordering') == 'rank':
+            # 並び順はメモリ上のPageRank順なので、そのページのノードだけを取得する
+            paginator = InMemoryPagination()
+            page_ids = [graph.node_ids[i] for i in paginator.paginate_queryset(rank_order(graph, **params), request, view=self)]
+            rows_by_id = {row.id: row for row in NodeValuesSerializer.values(nodes.filter(pk__in=page_ids), fields)}
+            page = [rows_by_id[node_id] for node_id in page_ids if node_id in rows_by_id]
+        else:
+            paginator = self.paginator
+            page = paginator.paginate_queryset(NodeValuesSerializer.values(nodes, fields), request, view=self)
+        
+        # ?fields= で id を除いても行には id があるので、行の id で引く
+        data = NodeValuesSerializer(page, fields).data
+        for row, item in zip(page, data):
+            i = graph.index.get(row.id)
+            item['rank'] = float(ranks[i]) if i is not None else 0.0
+        return validators.apply(paginator.get_paginated_response(data))
+    
+    @action(detail=True, methods=['get'])
+    def graph(self, request, pk=None):
+        """
+        プロジェクトの全ノードとプロジェクト内リンクを一括取得（ストリーミング）
 
+        ノードにはリンクの変更時に計算して保存した座標（x, y）を付ける（apps.projects.layout）。
+        ここでは計算せず、座標の計算後にリンクが変わったノードと追加されたノードの x, y は null。
+        ?level=n / ?cluster=<クラスタID> を指定するとコミュニティの要約グラフを返す。
+        """
+        project = self.get_object()
+        if 'level' in request.query_params or 'cluster' in request.query_params:
+            return self._cluster_graph(request, project)
+        # 既定では文脈（context）を返さない（?omit= で全フィールド）
+        fields = select_fields(request, NODE_GRAPH_FIELDS + NODE_LAYOUT_FIELDS, DEFAULT_NODE_GRAPH_OMIT)
+        if fields is None:
+            fields = NODE_GRAPH_FIELDS + NODE_LAYOUT_FIELDS
+        layout = coordinates = None
+        if any(name in NODE_LAYOUT_FIELDS for name in fields):
+            layout = get_project_layout(project.pk)
+            # 座標がまだ保存されていなければ x, y は null
+            coordinates = current_coordinates(get_project_graph(project.pk), layout) if layout is not None else {}
+        validators = Validators(
+            request,
+            queryset_fingerprint(project_nodes(project)),
+            queryset_fingerprint(project_edges(project)),
+            layout.digest if layout is not None else None
+        )
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        
+        ranks = None
+        if is_true(request.query_params.get('rank')):
+            ranks = node_ranks(get_project_graph(project.pk), **pagerank_params())
+        return validators.apply(StreamingHttpResponse(
+            iter_project_graph(
+                project,
+                ranks=ranks,
+                fields=fields,
+                coordinates=coordinates
+            ),
+            content_type='application/json'
+        ))
+    
+    def _cluster_graph(self, request, project):
+        """コミュニティの階層の1レベル分（?level=n）か、クラスタの中身（?cluster=レベル:番号）を返す"""
+        try:
+            level = int(request.query_params.get('level', 0))
+            cluster = request.query_params.get('cluster')
+            cluster = parse_cluster_id(cluster) if cluster is not None else None
+            limit = int(request.query_params.get('limit', MAX_CLUSTER_ITEMS))
+        except ValueError:
+            level = None
+        
+        if level is None or level < 0:
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': 'levelは0以上の整数、clusterは「レベル:番号」の形式で指定してください',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        validators = Validators(
+            request,
+            queryset_fingerprint(project_nodes(project)),
+            queryset_fingerprint(project_edges(project))
+        )
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        
+        try:
+            data = cluster_graph(
+                project,
+                get_project_graph(project.pk),
+                level=level,
+                cluster=cluster,
+                limit=min(max(limit, 1), MAX_CLUSTER_ITEMS)
+            )
+        except ValueError as exc:
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': str(exc),
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return validators.apply(Response(data))
+    
+    @action(detail=True, methods=['get'])
+    def cycles(self, request, pk=None):
+        """プロジェクトのリンクグラフに含まれるリング（強連結成分）を取得"""
+        project = self.get_object()
+        graph = get_project_graph(project.pk)
+        found = rings(graph)
+        
+        titles = {}
+        if found:
+            titles = dict(Node.objects.filter(project=project).values_list('id', 'title'))
+        
+        data = []
+        for ring_id, (members, edge_count, weight) in enumerate(found):
+            node_ids = [graph.node_ids[i] for i in members]
+            data.append({
+                'id': ring_id,
+                'size': len(node_ids),
+                'edge_count': edge_count,
+                'weight': round(weight, 1),
+                'nodes': [
+                    {'id': str(node_id), 'title': titles.get(node_id)}
+                    for node_id in node_ids
+                ],
+            })
+        
+        return Response({
+            'project_id': str(project.pk),
+            'ring_count': len(data),
+            'rings': data
+        })
+    
+    @action(detail=True, methods=['get'])
+    def centrality(self, request, pk=None):
+        """プロジェクトのノードの重み付きPageRankと次数を取得（重要度順）"""
+        project = self.get_object()
+        
+        try:
+            params = pagerank_params(
+                tol=request.query_params.get('tol'),
+                max_iter=request.query_params.get('max_iter')
+            )
+        except ValueError:
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': 'tolは正の数値、max_iterは1以上の整数を指定してください',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        graph = get_project_graph(project.pk)
+        ranks, iterations, converged = pagerank(graph, **params)
+        in_degree, out_degree, weighted_in, weighted_out = degrees(graph)
+        
+        paginator = InMemoryPagination()
+        page = paginator.paginate_queryset(rank_order(graph, **params), request, view=self)
+        titles = dict(
+            Node.objects.filter(id__in=[graph.node_ids[i] for i in page]).values_list('id', 'title')
+        )
+        
+        data = [
+            {
+                'id': str(graph.node_ids[i]),
+                'title': titles.get(graph.node_ids[i]),
+                'rank': float(ranks[i]),
+                'in_degree': int(in_degree[i]),
+                'out_degree': int(out_degree[i]),
+                'weighted_in_degree': round(float(weighted_in[i]), 1),
+                'weighted_out_degree': round(float(weighted_out[i]), 1),
+            }
+            for i in page
+        ]
+        
+        return Response({
+            'project_id': str(project.pk),
+            'iterations': iterations,
+            'converged': converged,
+            'count': paginator.count,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'nodes': data
+        })
 
-class RoundViewSet(viewsets.ModelViewSet):
+class RoundViewSet(CachedResponseMixin, ValuesListMixin, viewsets.ModelViewSet):
     """周ViewSet"""
     
     serializer_class = RoundSerializer
+    values_serializer_class = RoundValuesSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -93,6 +434,12 @@ class RoundViewSet(viewsets.ModelViewSet):
             project__user=self.request.user
         ).order_by('project', 'round_number')
     
+    def get_cache_tags(self):
+        """一覧はユーザー、詳細とステップ一覧は周に依存する"""
+        if self.detail:
+            return object_tags('round', self.kwargs.get('pk'))
+        return [tag('user', self.request.user.pk)]
+    
     def perform_update(self, serializer):
         """周の更新処理（Phase 5.1）"""
         serializer.save()
@@ -104,18 +451,14 @@ class RoundViewSet(viewsets.ModelViewSet):
         
         if request.method == 'GET':
             steps = ProcessStep.objects.filter(round=round_obj)
+            validators = Validators(request, queryset_fingerprint(steps))
+            not_modified = validators.not_modified(request)
+            if not_modified is not None:
+                return not_modified
             # ステップ種別の順序でソート（1. 俯瞰、2. 要素抽出、3. 流れ構築、4. 最小仕様、5. 拡張余地）
-            step_type_order = {
-                'overview': 1,
-                'extract': 2,
-                'flow': 3,
-                'mvp': 4,
-                'expand': 5,
-            }
-            steps_list = list(steps)
-            steps_list.sort(key=lambda s: step_type_order.get(s.step_type, 99))
-            serializer = ProcessStepSerializer(steps_list, many=True)
-            return Response(serializer.data)
+            fields = self.select_values_fields(ProcessStepValuesSerializer)
+            rows = ProcessStepValuesSerializer.values(steps.order_by(STEP_TYPE_ORDER), fields)
+            return validators.apply(Response(ProcessStepValuesSerializer(rows, fields).data))
         elif request.method == 'POST':
             serializer = ProcessStepSerializer(
                 data=request.data,
@@ -155,10 +498,12 @@ class RoundViewSet(viewsets.ModelViewSet):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProcessStepViewSet(viewsets.ReadOnlyModelViewSet):
+class ProcessStepViewSet(CachedResponseMixin, ValuesListMixin, viewsets.ReadOnlyModelViewSet):
     """思考プロセスのステップViewSet（読み取り専用）"""
     
     serializer_class = ProcessStepSerializer
+    values_serializer_class = ProcessStepValuesSerializer
+    default_omit_fields = DEFAULT_STEP_OMIT
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -166,27 +511,266 @@ class ProcessStepViewSet(viewsets.ReadOnlyModelViewSet):
         return ProcessStep.objects.filter(
             project__user=self.request.user
         ).order_by('round', 'step_type')
+    
+    def get_cache_tags(self):
+        if self.detail:
+            return object_tags('step', self.kwargs.get('pk'))
+        return [tag('user', self.request.user.pk)]
 
 
-class NodeViewSet(viewsets.ModelViewSet):
+class NodeViewSet(CachedResponseMixin, ValuesListMixin, viewsets.ModelViewSet):
     """ノードViewSet"""
     
     serializer_class = NodeSerializer
+    values_serializer_class = NodeValuesSerializer
+    default_omit_fields = DEFAULT_NODE_OMIT
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         """現在のユーザーのプロジェクトに属するノード、またはグローバルノードを取得"""
         # グローバルノード（project=None）も含める
         return Node.objects.filter(
-            project__user=self.request.user
-        ) | Node.objects.filter(project__isnull=True)
+            Q(project__user=self.request.user) | Q(project__isnull=True)
+        ).select_related('project')
+    
+    def get_cache_tags(self):
+        """
+        ノードとリンク一覧はノード（リンクの作成・削除と隣接ノードの更新で無効にする）に依存する
+
+        詳細は project_title を、近傍はユーザーのプロジェクトをまたいでたどるので
+        ユーザーにも依存する。一覧と重複はユーザーのノードとグローバルノードに依存する。
+        """
+        user_tag = tag('user', self.request.user.pk)
+        global_tag = tag('project', None)
+        if self.action == 'retrieve':
+            return object_tags('node', self.kwargs.get('pk'), user_tag)
+        if self.action == 'links':
+            return object_tags('node', self.kwargs.get('pk'))
+        if self.action in ('neighborhood', 'duplicates'):
+            return [user_tag, global_tag]
+        if self.action == 'suggestions':
+            return object_tags('node', self.kwargs.get('pk'), user_tag, global_tag)
+        if self.action == 'global_nodes':
+            return [global_tag]
+        if self.action == 'list':
+            return [user_tag, global_tag]
+        return None
     
     @action(detail=False, methods=['get'])
     def global_nodes(self, request):
         """グローバルノード一覧を取得"""
-        nodes = Node.objects.filter(project__isnull=True).order_by('-created_at')
-        serializer = self.get_serializer(nodes, many=True)
-        return Response(serializer.data)
+        fields = self.select_values_fields(NodeValuesSerializer, DEFAULT_NODE_OMIT)
+        nodes = NodeValuesSerializer.values(Node.objects.filter(project__isnull=True), fields)
+        page = self.paginate_queryset(nodes)
+        return self.get_paginated_response(NodeValuesSerializer(page, fields).data)
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """ノードとリンクを一括登録（リンクの両端にはノードIDまたはtemp_idを指定）"""
+        nodes_data = request.data.get('nodes', [])
+        links_data = request.data.get('links', [])
+        if not isinstance(nodes_data, list) or not isinstance(links_data, list):
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': 'nodes と links は配列で指定してください',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            result = bulk_create_nodes_and_links(request.user, nodes_data, links_data)
+        except BulkValidationError as e:
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': e.message,
+                        'type': 'validation_error',
+                        'details': e.errors
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(result, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get', 'post'])
+    def duplicates(self, request):
+        """
+        重複ノードのクラスタを取得（GET）、またはまとめる（POST）
+
+        対象はユーザーのプロジェクトのノードとグローバルノードで、?project= で1プロジェクト、
+        ?global=true でグローバルノードだけに絞れる（POSTは本文で指定）。
+        POSTの clusters には取得したクラスタのうちまとめるもののノードIDの列（先頭が残す側）を指定する。
+        現在の署名で確かめ直し、残す側と似ていなくなったノードはまとめずに skipped_node_ids で返す。
+        まとめると重複ノードのリンクは残す側のノードへ付け替えられ、重複ノードは削除される。
+        """
+        params = request.query_params if request.method == 'GET' else request.data
+        try:
+            threshold = float(params.get('threshold', settings.DEDUP_THRESHOLD))
+            project_id = params.get('project')
+            project_id = uuid.UUID(str(project_id)) if project_id else None
+        except (TypeError, ValueError):
+            threshold = None
+        if threshold is None or not 0 < threshold <= 1:
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': 'thresholdは0より大きく1以下、projectはプロジェクトIDを指定してください',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if project_id is not None:
+            project = get_object_or_404(Project, pk=project_id, user=request.user)
+            scope = Q(project=project)
+        elif is_true(str(params.get('global'))):
+            scope = Q(project__isnull=True)
+        else:
+            scope = Q(project__user=request.user) | Q(project__isnull=True)
+        
+        if request.method == 'POST':
+            try:
+                clusters = [[uuid.UUID(str(node_id)) for node_id in cluster] for cluster in request.data['clusters']]
+                if not 0 < len(clusters) <= MAX_DUPLICATE_CLUSTERS:
+                    raise InvalidClusters(f'clustersは1〜{MAX_DUPLICATE_CLUSTERS}件のクラスタで指定してください')
+                clusters, skipped = check_clusters(clusters, scope, threshold)
+            except InvalidClusters as e:
+                message = str(e)
+            except (KeyError, TypeError, ValueError, AttributeError):
+                message = 'clustersはノードIDの列の配列で指定してください'
+            else:
+                return Response({**merge_duplicates(clusters), 'skipped_node_ids': [str(node_id) for node_id in skipped]})
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': message,
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        clusters = find_duplicates(scope, threshold)
+        return Response({
+            'threshold': threshold,
+            'cluster_count': len(clusters),
+            'duplicate_count': sum(len(cluster['nodes']) - 1 for cluster in clusters),
+            'truncated': len(clusters) > MAX_DUPLICATE_CLUSTERS,
+            'clusters': [
+                {
+                    'project_id': str(cluster['project_id']) if cluster['project_id'] else None,
+                    'is_global': cluster['project_id'] is None,
+                    'nodes': [
+                        {'id': str(node_id), 'title': title, 'similarity': round(similarity, 4)}
+                        for node_id, title, similarity in cluster['nodes']
+                    ],
+                }
+                for cluster in clusters[:MAX_DUPLICATE_CLUSTERS]
+            ]
+        })
+    
+    @action(detail=True, methods=['get'])
+    def suggestions(self, request, pk=None):
+        """
+        リンク候補を取得（タイトル・文脈の文字 n-gram の TF-IDF が似ているノード）
+
+        対象はノードと同じプロジェクトのノードとグローバルノードで、
+        既にリンクがあるノード（向きは問わない）は除く。
+        """
+        node = self.get_object()
+        
+        try:
+            k = int(request.query_params.get('k', DEFAULT_SUGGESTIONS))
+        except ValueError:
+            k = None
+        if k is None or not 1 <= k <= MAX_SUGGESTIONS:
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': f'kは1〜{MAX_SUGGESTIONS}を指定してください',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        linked = NodeLink.objects.filter(
+            Q(from_node=node) | Q(to_node=node)
+        ).values_list('from_node_id', 'to_node_id')
+        scored = suggest_links(node, k=k, exclude={node_id for pair in linked for node_id in pair})
+        
+        found = {
+            row[0]: row
+            for row in Node.objects.filter(pk__in=[node_id for node_id, _ in scored])
+            .values_list('id', 'title', 'project_id')
+        }
+        data = []
+        for node_id, score in scored:
+            if node_id not in found:
+                continue
+            _, title, project_id = found[node_id]
+            data.append({
+                'id': str(node_id),
+                'title': title,
+                'project_id': str(project_id) if project_id else None,
+                'is_global': project_id is None,
+                'score': round(score, 4),
+            })
+        
+        return Response({
+            'node_id': str(node.pk),
+            'k': k,
+            'suggestions': data
+        })
+    
+    @action(detail=True, methods=['get'])
+    def neighborhood(self, request, pk=None):
+        """ノードからkホップ以内のサブグラフを取得"""
+        node = self.get_object()
+        
+        try:
+            depth = int(request.query_params.get('depth', 1))
+            min_weight = Decimal(request.query_params.get('min_weight', '0'))
+            limit = int(request.query_params.get('limit', MAX_NEIGHBORHOOD_NODES))
+        except (ValueError, InvalidOperation):
+            depth = None
+        direction = request.query_params.get('direction', 'out')
+        
+        if (
+            depth is None
+            or not 1 <= depth <= MAX_NEIGHBORHOOD_DEPTH
+            or direction not in NEIGHBORHOOD_DIRECTIONS
+            or not min_weight.is_finite()
+        ):
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': f'depthは1〜{MAX_NEIGHBORHOOD_DEPTH}、directionはout/in/bothのいずれかを指定してください',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        limit = min(max(limit, 1), MAX_NEIGHBORHOOD_NODES)
+        return Response(node_neighborhood(
+            node,
+            request.user,
+            depth=depth,
+            direction=direction,
+            min_weight=min_weight,
+            limit=limit
+        ))
     
     @action(detail=True, methods=['get', 'post', 'delete'])
     def links(self, request, pk=None):
@@ -194,17 +778,36 @@ class NodeViewSet(viewsets.ModelViewSet):
         node = self.get_object()
         
         if request.method == 'GET':
-            # リンク一覧を取得
-            outgoing_links = NodeLink.objects.filter(from_node=node)
-            incoming_links = NodeLink.objects.filter(to_node=node)
+            # リンク一覧を取得（送信・受信それぞれ別カーソルでページング）
+            fields = self.select_values_fields(NodeLinkValuesSerializer)
+            outgoing_links = NodeLinkValuesSerializer.values(NodeLink.objects.filter(from_node=node), fields)
+            incoming_links = NodeLinkValuesSerializer.values(NodeLink.objects.filter(to_node=node), fields)
+            
+            # リンク先・元ノードのタイトルも返すのでノードの更新日時も含める
+            validators = Validators(
+                request,
+                queryset_fingerprint(
+                    NodeLink.objects.filter(Q(from_node=node) | Q(to_node=node)),
+                    'updated_at',
+                    'from_node__updated_at',
+                    'to_node__updated_at'
+                )
+            )
+            not_modified = validators.not_modified(request)
+            if not_modified is not None:
+                return not_modified
             
-            outgoing_data = NodeLinkSerializer(outgoing_links, many=True).data
-            incoming_data = NodeLinkSerializer(incoming_links, many=True).data
+            outgoing_paginator = KeysetPagination(cursor_query_param='outgoing_cursor')
+            incoming_paginator = KeysetPagination(cursor_query_param='incoming_cursor')
+            outgoing_page = outgoing_paginator.paginate_queryset(outgoing_links, request, view=self)
+            incoming_page = incoming_paginator.paginate_queryset(incoming_links, request, view=self)
             
-            return Response({
-                'outgoing': outgoing_data,
-                'incoming': incoming_data
-            })
+            return validators.apply(Response({
+                'outgoing': NodeLinkValuesSerializer(outgoing_page, fields).data,
+                'incoming': NodeLinkValuesSerializer(incoming_page, fields).data,
+                'outgoing_next': outgoing_paginator.get_next_link(),
+                'incoming_next': incoming_paginator.get_next_link()
+            }))
         
         elif request.method == 'POST':
             # リンクを作成
@@ -257,7 +860,7 @@ class NodeViewSet(viewsets.ModelViewSet):
             try:
                 link = NodeLink.objects.get(id=link_id)
                 # このノードが送信元または送信先であることを確認
-                if link.from_node != node and link.to_node != node:
+                if link.from_node_id != node.id and link.to_node_id != node.id:
                     return Response(
                         {'error': 'Link does not belong to this node'},
                         status=status.HTTP_403_FORBIDDEN
@@ -278,3 +881,150 @@ class NodeViewSet(viewsets.ModelViewSet):
                     {'error': 'Link not found'},
                     status=status.HTTP_404_NOT_FOUND
                 )
+
+
+class SearchView(APIView):
+    """ノードとステップの全文検索View"""
+    
+    permission_classes = [IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
+    
+    def get(self, request):
+        """ユーザーのプロジェクトとグローバルノードをランク順に検索"""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': '検索語（q）が必要です',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # type=node / type=step で種別を絞り込み（未指定なら両方）
+        types = [t for t in request.query_params.getlist('type') if t in RESULT_TYPES] or RESULT_TYPES
+        
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        limit = max(limit, 1)
+        
+        cursor = request.query_params.get('cursor')
+        try:
+            cursor = decode_cursor(cursor) if cursor else None
+        except InvalidCursor:
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': 'カーソルが不正です',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rows, has_next = search(request.user, text, types=types, limit=limit, cursor=cursor)
+        
+        serializer_classes = {
+            'node': NodeSerializer,
+            'step': ProcessStepSerializer,
+        }
+        results = [
+            {
+                'type': result_type,
+                'rank': rank,
+                'item': serializer_classes[result_type](obj).data,
+            }
+            for result_type, rank, obj in rows
+        ]
+        
+        next_url = None
+        if has_next:
+            result_type, rank, obj = rows[-1]
+            next_url = replace_query_param(
+                request.build_absolute_uri(),
+                'cursor',
+                encode_cursor(rank, result_type, obj.pk)
+            )
+        
+        return Response({
+            'next': next_url,
+            'results': results
+        })
+
+
+class SyncChangesView(APIView):
+    """差分同期View"""
+    
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        """トークン（since）以降に作成・更新・削除されたデータを取得"""
+        try:
+            since = parse_token(request.query_params.get('since'))
+            limit = int(request.query_params.get('limit', MAX_SYNC_CHANGES))
+        except (InvalidSyncToken, ValueError):
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': '同期トークンが不正です',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        limit = min(max(limit, 1), MAX_SYNC_CHANGES)
+        return Response(changes_since(request.user, since, limit=limit))
+
+
+class ExportView(APIView):
+    """全データのエクスポートView"""
+    
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, NDJSONRenderer]
+    
+    def get(self, request):
+        """ユーザーのプロジェクト・周・ステップ・ノード・リンクをNDJSONでストリーミング"""
+        if request.query_params.get('format', 'ndjson') != 'ndjson':
+            return Response(
+                {
+                    'error': {
+                        'code': 'VAL_001',
+                        'message': 'formatはndjsonのみ指定できます',
+                        'type': 'validation_error'
+                    }
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        response = StreamingHttpResponse(iter_export(request.user), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="thinkring-export.ndjson"'
+        return response
+
+
+class ImportView(APIView):
+    """全データのインポートView"""
+    
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        """エクスポートしたNDJSONを1行ずつ読み込んで登録（既存のIDはスキップ）"""
+        # request.data を経由すると本文全体を読み込むので、ストリームから直接読む
+        stream = request.stream
+        lines = iter(stream.readline, b'') if stream is not None else []
+        return Response(import_ndjson(request.user, lines))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def graph_cache_stats_view(request):
+    """CSRグラフキャッシュの統計情報を取得（管理者のみ）"""
+    return Response(graph_cache.stats())
@@ -1,5 +1,13 @@
 """
 ASGI config for thinkring project.
+
+ASGIで配信するのは読み取りAPIの async 版（/api/v1/async/）と /metrics だけで、
+それ以外（ストリーミングのレスポンスや同期のViewSet）はWSGI（thinkring.wsgi）で配信する。
+ASGIでは同期のビューがワーカーごとに1つのスレッドで順に実行され、
+StreamingHttpResponse も送信前に全てメモリに読み込まれるため。
+
+開発時: uvicorn thinkring.asgi:application --port 8001 --reload
+本番時: gunicorn thinkring.asgi:application -k uvicorn.workers.UvicornWorker --workers $WEB_CONCURRENCY
 """
 
 import os
@@ -8,5 +16,27 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thinkring.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from apps.core.renderers import FastJSONRenderer  # noqa: E402
+
+ASGI_PATH_PREFIXES = ('/api/v1/async/', '/metrics')
+
+NOT_FOUND_BODY = FastJSONRenderer().render({
+    'error': {
+        'code': 'not_found',
+        'message': 'このURLはWSGIのサーバーで配信しています',
+        'type': 'NotFound',
+    }
+})
+
 
+async def application(scope, receive, send):
+    if scope['type'] != 'http' or scope['path'].startswith(ASGI_PATH_PREFIXES):
+        return await django_application(scope, receive, send)
+    await send({
+        'type': 'http.response.start',
+        'status': 404,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({'type': 'http.response.body', 'body': NOT_FOUND_BODY})
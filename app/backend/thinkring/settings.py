@@ -3,6 +3,7 @@ Django settings for thinkring project.
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -28,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
@@ -38,6 +40,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.core.metrics.RequestMetricsMiddleware',  # 計測（先頭に置いて全体の時間を測る）
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -116,15 +119,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.auth.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'apps.core.renderers.FastJSONRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'apps.core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
     'EXCEPTION_HANDLER': 'apps.core.exceptions.custom_exception_handler',
 }
@@ -142,7 +150,122 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_REFRESH_SERIALIZER': 'apps.auth.serializers.FilteredTokenRefreshSerializer',
+}
+
+# Auth cache settings
+# 認証時に引く User のプロセス内キャッシュ（件数上限、保持秒数）。他プロセスでの無効化は TTL 後に反映
+AUTH_USER_CACHE_MAX_SIZE = int(os.getenv('AUTH_USER_CACHE_MAX_SIZE', '10000'))
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', '60'))
+# リフレッシュトークンのブラックリストのブルームフィルタ（想定件数、誤判定率、差分取り込み・作り直しの間隔秒、
+# 差分で飛んでいたIDを読み直す秒数）。他のワーカーで無効にしたトークンは差分取り込みの間隔の間だけ使える
+TOKEN_BLACKLIST_FILTER_CAPACITY = int(os.getenv('TOKEN_BLACKLIST_FILTER_CAPACITY', '100000'))
+TOKEN_BLACKLIST_FILTER_ERROR_RATE = float(os.getenv('TOKEN_BLACKLIST_FILTER_ERROR_RATE', '0.001'))
+TOKEN_BLACKLIST_FILTER_REFRESH_INTERVAL = int(os.getenv('TOKEN_BLACKLIST_FILTER_REFRESH_INTERVAL', '1'))
+TOKEN_BLACKLIST_FILTER_REBUILD_INTERVAL = int(os.getenv('TOKEN_BLACKLIST_FILTER_REBUILD_INTERVAL', '3600'))
+TOKEN_BLACKLIST_FILTER_GAP_TIMEOUT = int(os.getenv('TOKEN_BLACKLIST_FILTER_GAP_TIMEOUT', '60'))
+
+# Graph engine settings
+# プロジェクトごとのCSRグラフをメモリに保持する上限（バイト）
+GRAPH_CACHE_MAX_BYTES = int(os.getenv('GRAPH_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# 重み付きPageRank（/projects/{id}/centrality/）の既定値
+PAGERANK_DAMPING = float(os.getenv('PAGERANK_DAMPING', '0.85'))
+PAGERANK_TOLERANCE = float(os.getenv('PAGERANK_TOLERANCE', '1e-6'))
+PAGERANK_MAX_ITER = int(os.getenv('PAGERANK_MAX_ITER', '100'))
+
+# Layout settings
+# WordTree の座標（/projects/{id}/graph/ の x, y）。ノード間隔の目安（描画時のピクセル）
+LAYOUT_SPACING = float(os.getenv('LAYOUT_SPACING', '100'))
+# 全ノードを動かす場合と、変更があったノードの近傍だけを動かす場合の反復回数
+LAYOUT_ITERATIONS = int(os.getenv('LAYOUT_ITERATIONS', '50'))
+LAYOUT_INCREMENTAL_ITERATIONS = int(os.getenv('LAYOUT_INCREMENTAL_ITERATIONS', '30'))
+# 変更があったノードから何ホップまで動かすか。変更の割合がこれを超えたら全ノードを動かす
+LAYOUT_NEIGHBORHOOD_HOPS = int(os.getenv('LAYOUT_NEIGHBORHOOD_HOPS', '1'))
+LAYOUT_INCREMENTAL_MAX_RATIO = float(os.getenv('LAYOUT_INCREMENTAL_MAX_RATIO', '0.3'))
+# 中心への引力（連結していない部分をまとめる）
+LAYOUT_GRAVITY = float(os.getenv('LAYOUT_GRAVITY', '0.5'))
+# リンクグラフの変更のコミット後に座標を計算し直すノード数の上限（超えるプロジェクトは compute_layouts で計算する）
+LAYOUT_ON_WRITE_MAX_NODES = int(os.getenv('LAYOUT_ON_WRITE_MAX_NODES', '2000'))
+
+# Similarity settings
+# リンク候補（/nodes/{id}/suggestions/）の類似度インデックス（apps.projects.similarity）
+# 文字 n-gram の長さ、ノードごとに使う先頭の文字数、問い合わせに使う n-gram の数
+SIMILARITY_NGRAM_SIZE = int(os.getenv('SIMILARITY_NGRAM_SIZE', '2'))
+SIMILARITY_MAX_CHARS = int(os.getenv('SIMILARITY_MAX_CHARS', '300'))
+SIMILARITY_QUERY_TERMS = int(os.getenv('SIMILARITY_QUERY_TERMS', '32'))
+# 差分がノード数のこの割合を超えたらインデックスを詰め直す
+SIMILARITY_MAX_DELTA_RATIO = float(os.getenv('SIMILARITY_MAX_DELTA_RATIO', '0.05'))
+
+# Deduplication settings
+# ノードの重複検出（apps.projects.dedup）。文字 n-gram の長さとノードごとに使う先頭の文字数
+# （変えたら find_duplicates --rebuild で署名を計算し直す）、重複とみなす推定 Jaccard 係数
+DEDUP_SHINGLE_SIZE = int(os.getenv('DEDUP_SHINGLE_SIZE', '2'))
+DEDUP_MAX_CHARS = int(os.getenv('DEDUP_MAX_CHARS', '2000'))
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.8'))
+
+# Snapshot settings
+# /projects/{id}/snapshot/ のキャッシュ保持期間（秒）。内容の鮮度はバージョン番号で保証する
+SNAPSHOT_CACHE_TIMEOUT = int(os.getenv('SNAPSHOT_CACHE_TIMEOUT', str(60 * 60 * 24)))
+
+# Cache settings
+# バックエンドは file（同じホストのワーカー間で共有。コンテナを分ける場合は CACHE_DIR を共有ボリュームにする）/
+# db（ホストをまたいで共有。python manage.py createcachetable が必要）/
+# locmem（プロセス内。無効化が他のワーカーに届かないのでワーカー1つの場合だけ使う）
+_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
 }
+CACHE_DIR = os.getenv('CACHE_DIR', tempfile.gettempdir())
+
+
+def _cache_location(backend, name, table):
+    """バックエンドごとの既定の保存先（file はディレクトリ、db はテーブル名）"""
+    if backend == 'file':
+        return os.path.join(CACHE_DIR, f'thinkring-{name}')
+    if backend == 'db':
+        return table
+    return f'thinkring-{name}'
+
+
+# 'default' はグラフ・スナップショットのバージョン番号とスナップショット（apps.projects.versions / snapshot）。
+# 書き込んだプロセスが進めたバージョンを全てのプロセス（WSGI のワーカーと async 版）が見る必要があるので、
+# ワーカーが1つでなければ file か db にする
+DEFAULT_CACHE_BACKEND = os.getenv('DEFAULT_CACHE_BACKEND', 'file')
+# ホストごとのワーカープロセス数（gunicorn と同じ環境変数）。2以上で locmem を使うと apps.core.checks がエラーにする
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+DEFAULT_CACHE_MAX_ENTRIES = int(os.getenv('DEFAULT_CACHE_MAX_ENTRIES', '10000'))
+# 'responses' はAPIレスポンスのキャッシュ（apps.core.response_cache）
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True') == 'True'
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'file')
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))
+# これより大きいレスポンス（pickle後のバイト数）は保存しない
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRY_BYTES', str(1024 * 1024)))
+
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[DEFAULT_CACHE_BACKEND],
+        'LOCATION': os.getenv(
+            'DEFAULT_CACHE_LOCATION',
+            _cache_location(DEFAULT_CACHE_BACKEND, 'default', 'default_cache')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': DEFAULT_CACHE_MAX_ENTRIES},
+    },
+    'responses': {
+        'BACKEND': _CACHE_BACKENDS[RESPONSE_CACHE_BACKEND],
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION',
+            _cache_location(RESPONSE_CACHE_BACKEND, 'responses', 'response_cache')
+        ),
+        'TIMEOUT': RESPONSE_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': RESPONSE_CACHE_MAX_ENTRIES},
+    },
+}
+
+# Metrics settings
+# /metrics の Bearer トークン（空なら同じホストからの接続とスタッフのユーザーにだけ返す）
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 
 # CORS settings
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000').split(',')
@@ -4,8 +4,11 @@ URL configuration for thinkring project.
 from django.contrib import admin
 from django.urls import path, include
 
+from apps.core.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('apps.core.urls')),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus
 ]
 
@@ -4,11 +4,30 @@
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000/api/v1';
 
+// 一覧APIの1ページの最大件数（サーバーの max_page_size）
+const MAX_PAGE_SIZE = 100;
+
+/**
+ * 返すフィールドの指定（?fields= / ?omit=）をクエリ文字列にする
+ * omit: [] を渡すと一覧で既定で省かれる長いテキスト（context など）も含めて返す
+ */
+function fieldsQuery({ fields, omit } = {}) {
+  const params = new URLSearchParams();
+  if (fields) {
+    params.set('fields', fields.join(','));
+  } else if (omit) {
+    params.set('omit', omit.join(','));
+  }
+  const query = params.toString();
+  return query ? `?${query}` : '';
+}
+
 /**
  * APIリクエストの基本関数
  */
 async function apiRequest(endpoint, options = {}) {
-  const url = `${API_BASE_URL}${endpoint}`;
+  // ページネーションの next などの絶対URLはそのまま使う
+  const url = /^https?:\/\//.test(endpoint) ? endpoint : `${API_BASE_URL}${endpoint}`;
   const token = localStorage.getItem('access_token');
   
   const headers = {
@@ -56,6 +75,20 @@ async function apiRequest(endpoint, options = {}) {
   }
 }
 
+/**
+ * ページネーションされた一覧を next をたどって全件取得する
+ */
+async function fetchAllPages(endpoint) {
+  const separator = endpoint.includes('?') ? '&' : '?';
+  let page = await apiRequest(`${endpoint}${separator}page_size=${MAX_PAGE_SIZE}`);
+  const results = [...page.results];
+  while (page.next) {
+    page = await apiRequest(page.next);
+    results.push(...page.results);
+  }
+  return results;
+}
+
 /**
  * 認証API
  */
@@ -118,6 +151,11 @@ export const projectApi = {
     return apiRequest('/projects/');
   },
   
+  // 全ページを取得
+  async listAll() {
+    return fetchAllPages('/projects/');
+  },
+  
   async get(id) {
     return apiRequest(`/projects/${id}/`);
   },
@@ -146,8 +184,8 @@ export const projectApi = {
     return apiRequest(`/projects/${projectId}/rounds/`);
   },
   
-  async getNodes(projectId) {
-    return apiRequest(`/projects/${projectId}/nodes/`);
+  async getNodes(projectId, selection) {
+    return apiRequest(`/projects/${projectId}/nodes/${fieldsQuery(selection)}`);
   },
   
   async createRound(projectId, roundNumber, note = '') {
@@ -157,8 +195,27 @@ export const projectApi = {
     });
   },
   
-  async getNodes(projectId) {
-    return apiRequest(`/projects/${projectId}/nodes/`);
+  async getNodes(projectId, selection) {
+    return apiRequest(`/projects/${projectId}/nodes/${fieldsQuery(selection)}`);
+  },
+  
+  // 全ページを取得
+  async getAllNodes(projectId, selection) {
+    return fetchAllPages(`/projects/${projectId}/nodes/${fieldsQuery(selection)}`);
+  },
+  
+  async getGraph(projectId, selection) {
+    return apiRequest(`/projects/${projectId}/graph/${fieldsQuery(selection)}`);
+  },
+
+  // コミュニティの要約グラフ（level: 0が最も粗い。cluster を指定するとその中身）
+  async getGraphSummary(projectId, { level = 0, cluster } = {}) {
+    const params = new URLSearchParams(cluster ? { cluster } : { level: String(level) });
+    return apiRequest(`/projects/${projectId}/graph/?${params}`);
+  },
+
+  async getSnapshot(projectId) {
+    return apiRequest(`/projects/${projectId}/snapshot/`);
   },
 };
 
@@ -177,8 +234,8 @@ export const roundApi = {
     });
   },
   
-  async getSteps(roundId) {
-    return apiRequest(`/rounds/${roundId}/steps/`);
+  async getSteps(roundId, selection) {
+    return apiRequest(`/rounds/${roundId}/steps/${fieldsQuery(selection)}`);
   },
   
   async createStep(roundId, stepType, content) {
@@ -193,8 +250,8 @@ export const roundApi = {
  * ノードAPI
  */
 export const nodeApi = {
-  async list() {
-    return apiRequest('/nodes/');
+  async list(selection) {
+    return apiRequest(`/nodes/${fieldsQuery(selection)}`);
   },
   
   async get(id) {
@@ -221,14 +278,58 @@ export const nodeApi = {
     });
   },
   
-  async getGlobalNodes() {
-    return apiRequest('/nodes/global_nodes/');
+  async getGlobalNodes(selection) {
+    return apiRequest(`/nodes/global_nodes/${fieldsQuery(selection)}`);
+  },
+  
+  // 全ページを取得
+  async getAllGlobalNodes(selection) {
+    return fetchAllPages(`/nodes/global_nodes/${fieldsQuery(selection)}`);
+  },
+  
+  // 重複ノードのクラスタ（projectId を指定するとそのプロジェクト、global: true でグローバルノードだけ）
+  async getDuplicates({ projectId, global = false, threshold } = {}) {
+    const params = new URLSearchParams();
+    if (projectId) params.set('project', projectId);
+    if (global) params.set('global', 'true');
+    if (threshold) params.set('threshold', String(threshold));
+    const query = params.toString();
+    return apiRequest(`/nodes/duplicates/${query ? `?${query}` : ''}`);
+  },
+  
+  // getDuplicates で取得したクラスタのうち clusters（ノードIDの配列。先頭が残す側）だけをまとめる
+  // （リンクは付け替え、重複ノードは削除。似ていなくなったノードは skipped_node_ids で返る）
+  async mergeDuplicates(clusters, { projectId, global = false, threshold } = {}) {
+    return apiRequest('/nodes/duplicates/', {
+      method: 'POST',
+      body: JSON.stringify({ clusters, project: projectId, global, threshold }),
+    });
   },
   
   async getLinks(nodeId) {
     return apiRequest(`/nodes/${nodeId}/links/`);
   },
   
+  // 送信・受信それぞれのカーソル（outgoing_next / incoming_next）をたどって全件取得
+  async getAllLinks(nodeId) {
+    const first = await apiRequest(`/nodes/${nodeId}/links/?page_size=${MAX_PAGE_SIZE}`);
+    const links = { outgoing: [...first.outgoing], incoming: [...first.incoming] };
+    for (const direction of ['outgoing', 'incoming']) {
+      let next = first[`${direction}_next`];
+      while (next) {
+        const page = await apiRequest(next);
+        links[direction].push(...page[direction]);
+        next = page[`${direction}_next`];
+      }
+    }
+    return links;
+  },
+  
+  // タイトル・文脈が似ているノード（リンク候補）
+  async getSuggestions(nodeId, k = 10) {
+    return apiRequest(`/nodes/${nodeId}/suggestions/?k=${k}`);
+  },
+  
   async createLink(fromNodeId, toNodeId, weight = 0.5) {
     return apiRequest(`/nodes/${fromNodeId}/links/`, {
       method: 'POST',
@@ -244,3 +345,9 @@ export const nodeApi = {
   },
 };
 
+
+export const syncApi = {
+  async getChanges(since = '') {
+    return apiRequest(`/sync/changes/?since=${encodeURIComponent(since)}`);
+  },
+};